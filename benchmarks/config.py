@@ -0,0 +1,23 @@
+from os import getenv
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def connect_kwargs() -> dict:
+    """
+    Connection settings for the benchmark database, from BENCH_DB_NAME (required), BENCH_DB_USERNAME and BENCH_DB_PASSWORD.
+    The username and password fall back to the bot's. Seeding empties tables, so the bot's own database is refused
+    """
+    name = getenv("BENCH_DB_NAME")
+
+    if name is None:
+        raise SystemExit("Set BENCH_DB_NAME to a database used only for benchmarks")
+
+    if name == getenv("DB_NAME"):
+        raise SystemExit("BENCH_DB_NAME must not be the bot's database (DB_NAME)")
+
+    return {
+        'database': name,
+        'user': getenv("BENCH_DB_USERNAME", getenv("DB_USERNAME")),
+        'password': getenv("BENCH_DB_PASSWORD", getenv("DB_PASSWORD"))
+    }
@@ -0,0 +1,205 @@
+import asyncio
+import argparse
+import json
+import random
+import time
+import discord
+from datetime import datetime, timezone
+from benchmarks.config import connect_kwargs
+from benchmarks.stubs import FakeBot, FakeContext, FakeGuild, FakeMember, FakeMessage, FakeInteraction
+from helper.queries import Database
+from helper.pg_listener import PGListener
+from helper.guild_cache import GuildCache
+from helper import poll_views
+from commands.moderation import Moderation
+from commands.public import Tags
+from main import get_prefix
+
+"""
+Times the real command code with stub Discord objects, against the database filled by benchmarks.seed.
+Usage: python -m benchmarks.run [--iterations 500] [--only warn,warnings] [--output results.json] [--compare earlier.json]
+Each benchmark runs sequentially, so the numbers are per call latency rather than throughput.
+"""
+
+class Env:
+    def __init__(self, bot: FakeBot, seed, polls: int):
+        self.bot = bot
+        self.guilds = seed['guilds']
+        self.users = seed['users']
+        self.polls = polls
+        self.moderation = Moderation(bot)
+        self.tags = Tags(bot)
+
+    def context(self, rng: random.Random) -> tuple:
+        # cubed like the seeded warns, so busy guilds are picked more often
+        guild = FakeGuild(1 + int(rng.random() ** 3 * self.guilds))
+        author = FakeMember(1, guild, "moderator")
+        member = FakeMember(1 + rng.randrange(self.users), guild)
+        return FakeContext(self.bot, guild, author), member
+
+async def bench_warn(env: Env, rng: random.Random):
+    ctx, member = env.context(rng)
+    await env.moderation.warn.callback(env.moderation, ctx, member, None, reason = "benchmark")
+
+async def bench_warnings(env: Env, rng: random.Random):
+    ctx, member = env.context(rng)
+    await env.moderation.warnings.callback(env.moderation, ctx, member = member)
+
+async def bench_offences(env: Env, rng: random.Random):
+    ctx, member = env.context(rng)
+    await env.moderation.offences.callback(env.moderation, ctx, member = member)
+
+async def bench_tag_view(env: Env, rng: random.Random):
+    ctx, _ = env.context(rng)
+    # half by name, half by alias
+    name = f"{rng.choice(['tag', 'alias'])}{rng.randint(1, 20)}"
+    await env.tags.t_view.callback(env.tags, ctx, name = name)
+
+async def bench_poll_vote(env: Env, rng: random.Random):
+    ctx, member = env.context(rng)
+    itx = FakeInteraction(ctx.guild, member, FakeMessage(ctx.guild))
+    await poll_views.dispatch(env.bot, itx, [str(rng.randint(1, env.polls)), 'vote', str(rng.randint(1, 3))])
+
+async def bench_get_prefix(env: Env, rng: random.Random):
+    ctx, _ = env.context(rng)
+    await get_prefix(env.bot, FakeMessage(ctx.guild))
+
+async def check_history_pages(env: Env):
+    """Shows warnings and offences for a user with a page of the longest reasons, which must fit in one embed"""
+    guild = FakeGuild(1)
+    member = FakeMember(env.users + 1, guild) # not one of the seeded users
+    ctx = FakeContext(env.bot, guild, FakeMember(1, guild, "moderator"))
+
+    try:
+        await env.bot.pool.execute("""INSERT INTO warns (guild_id, user_id, body, points, created_by, created_on)
+            SELECT $1, $2, repeat('w', 2000), 999, 1, now() FROM generate_series(1, 10)""", guild.id, member.id)
+        await env.bot.pool.execute("""INSERT INTO offences (guild_id, user_id, punishment, body, created_by, created_on)
+            SELECT $1, $2, repeat('p', 100), repeat('o', 2000), 1, now() FROM generate_series(1, 10)""", guild.id, member.id)
+
+        # the stubs raise if an embed is over Discord's limit
+        await env.moderation.warnings.callback(env.moderation, ctx, member = member)
+        await env.moderation.offences.callback(env.moderation, ctx, member = member)
+    finally:
+        await env.bot.pool.execute("DELETE FROM warns WHERE guild_id = $1 AND user_id = $2", guild.id, member.id)
+        await env.bot.pool.execute("DELETE FROM offences WHERE guild_id = $1 AND user_id = $2", guild.id, member.id)
+
+BENCHMARKS = {
+    'warn': bench_warn,
+    'warnings': bench_warnings,
+    'offences': bench_offences,
+    'tag view': bench_tag_view,
+    'poll vote': bench_poll_vote,
+    'get_prefix': bench_get_prefix,
+}
+
+def percentile(ordered: list, percent: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+def total_calls(db: Database) -> int:
+    return sum(stats.calls for stats in db.stats.values())
+
+async def run_one(env: Env, bench, iterations: int, warmup: int, seed: int) -> dict:
+    rng = random.Random(seed)
+
+    for _ in range(warmup):
+        await bench(env, rng)
+
+    latencies = []
+    calls_before = total_calls(env.bot.db)
+
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await bench(env, rng)
+        latencies.append(time.perf_counter() - start)
+
+    queries = total_calls(env.bot.db) - calls_before
+    latencies.sort()
+
+    return {
+        'iterations': iterations,
+        'mean_ms': round(sum(latencies) / iterations * 1000, 3),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'queries_per_call': round(queries / iterations, 2)
+    }
+
+def print_results(results: dict, previous: dict | None):
+    print(f"{'benchmark':<12} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8}")
+
+    for name, result in results.items():
+        line = f"{name:<12} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['queries_per_call']:>8}"
+
+        old = (previous or {}).get(name)
+        if old is not None:
+            change = (result['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0
+            line += f"   p95 {change:+.1f}% vs {old['p95_ms']:.2f}"
+
+        print(line)
+
+async def main(args):
+    db = Database()
+    await db.create_pool(**connect_kwargs())
+
+    listener = PGListener(db.pool)
+    await listener.start()
+
+    try:
+        seed = await db.pool.fetchrow("SELECT * FROM bench_seed")
+        if seed is None:
+            raise SystemExit("The benchmark database is empty; run python -m benchmarks.seed first")
+
+        polls = await db.pool.fetchval("SELECT max(id) FROM poll_table")
+
+        guild_cache = GuildCache(db, listener, 'guild_table')
+        join_cache = GuildCache(db, listener, 'join_stats')
+        await asyncio.gather(guild_cache.start(), join_cache.start())
+
+        bot = FakeBot(db, guild_cache, join_cache)
+        bot.outbox.start()
+        env = Env(bot, seed, polls)
+
+        await check_history_pages(env)
+
+        names = args.only.split(',') if args.only else list(BENCHMARKS)
+        results = {}
+
+        for name in names:
+            results[name] = await run_one(env, BENCHMARKS[name], args.iterations, args.warmup, args.seed)
+
+        report = {
+            'ran_on': datetime.now(timezone.utc).isoformat(),
+            'discord.py': discord.__version__,
+            'postgres': await db.pool.fetchval("SHOW server_version"),
+            'seed': {'guilds': seed['guilds'], 'users': seed['users'], 'warns': seed['warns']},
+            'results': results,
+            # per query breakdown, for finding which query moved between runs
+            'queries': db.report()
+        }
+
+    finally:
+        await listener.close()
+        await db.pool.close()
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['results']
+
+    print_results(results, previous)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent = 2)
+        print(f"Saved to {args.output}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Benchmark command latency against the seeded database")
+    parser.add_argument('--iterations', type = int, default = 500)
+    parser.add_argument('--warmup', type = int, default = 50)
+    parser.add_argument('--seed', type = int, default = 0, help = "random seed, so runs pick the same guilds and users")
+    parser.add_argument('--only', help = f"comma separated, from: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--output', help = "JSON file to save the results to")
+    parser.add_argument('--compare', help = "JSON file from an earlier run to compare against")
+
+    asyncio.run(main(parser.parse_args()))
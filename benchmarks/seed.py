@@ -0,0 +1,89 @@
+import asyncio
+import asyncpg
+import argparse
+import time
+from benchmarks.config import connect_kwargs
+from helper.migrations import migrate
+from helper.warn_points import REBUILD
+
+"""
+Fills the benchmark database with synthetic data.
+Usage: python -m benchmarks.seed [--guilds 5000] [--users 500] [--warns 2000000]
+Warns are skewed towards low guild IDs, so a few guilds are much busier than the rest like on a real bot.
+Every table the benchmarks touch is emptied first.
+"""
+
+TABLES = ['guild_table', 'join_stats', 'autopunishments', 'autocompletes', 'tags', 'poll_table', 'warns', 'offences', 'banned_users', 'warn_balances']
+
+STEPS = [
+    ("guilds", ('guilds',), """INSERT INTO guild_table (guild_id, prefix, offence_message)
+        SELECT g, CASE WHEN g % 3 = 0 THEN '!' END, CASE WHEN g % 2 = 0 THEN 'Appeal at example.com' END
+        FROM generate_series(1, $1::int) g"""),
+
+    ("thresholds", ('guilds',), """INSERT INTO autopunishments (guild_id, points, p_type, timer)
+        SELECT g, v.points, v.p_type, v.timer FROM generate_series(1, $1::int) g
+        CROSS JOIN (VALUES (5, 'mute', interval '1 day'), (10, 'kick', NULL::interval), (20, 'ban', NULL::interval)) v (points, p_type, timer)"""),
+
+    ("autocompletes", ('guilds',), """INSERT INTO autocompletes (guild_id, points, reason)
+        SELECT g, n, 'reason ' || n FROM generate_series(1, $1::int) g CROSS JOIN generate_series(1, 5) n"""),
+
+    ("tags", ('guilds',), """INSERT INTO tags (guild_id, tag_name, body, created_by, created_on, aliases)
+        SELECT g, 'tag' || n, repeat('tag body ', 20), 1, now(), ARRAY['alias' || n]::varchar(255)[]
+        FROM generate_series(1, $1::int) g CROSS JOIN generate_series(1, 20) n"""),
+
+    ("polls", ('guilds',), """INSERT INTO poll_table (message_id, creator_id, poll_options, multi_option, option_votes, used_users)
+        SELECT 10000000 + g * 10 + n, 1, ARRAY['**Option 1**: a', '**Option 2**: b', '**Option 3**: c'], n % 2 = 0, ARRAY[0, 0, 0], '{}'
+        FROM generate_series(1, $1::int) g CROSS JOIN generate_series(1, 2) n"""),
+
+    ("warns", ('guilds', 'users', 'warns'), """INSERT INTO warns (guild_id, user_id, body, points, created_by, created_on)
+        SELECT 1 + floor(power(random(), 3) * $1::int)::bigint, 1 + floor(random() * $2::int)::bigint,
+        'synthetic warn ' || i, 1 + floor(random() * 3)::int, 1, now() - random() * interval '365 days'
+        FROM generate_series(1, $3::int) i"""),
+
+    ("offences", ('guilds', 'users', 'warns'), """INSERT INTO offences (guild_id, user_id, punishment, body, created_by, created_on)
+        SELECT 1 + floor(power(random(), 3) * $1::int)::bigint, 1 + floor(random() * $2::int)::bigint,
+        'kick', 'synthetic offence ' || i, 1, now() - random() * interval '365 days'
+        FROM generate_series(1, $3::int / 10) i"""),
+]
+
+async def main(guilds: int, users: int, warns: int):
+    conn = await asyncpg.connect(**connect_kwargs())
+
+    try:
+        await migrate(conn)
+        # the synthetic history goes back a year
+        for table in ('warns', 'offences'):
+            await conn.execute("SELECT create_month_partitions($1, now() - interval '1 year', now())", table)
+
+        await conn.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY")
+        await conn.execute("CREATE TABLE IF NOT EXISTS bench_seed (guilds INT, users INT, warns INT, seeded_on TIMESTAMP WITH TIME ZONE)")
+        await conn.execute("TRUNCATE bench_seed")
+
+        sizes = {'guilds': guilds, 'users': users, 'warns': warns}
+
+        for name, params, sql in STEPS:
+            start = time.perf_counter()
+            await conn.execute(sql, *[sizes[param] for param in params])
+            print(f"{name:<14} {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        await conn.execute(REBUILD)
+        print(f"{'balances':<14} {time.perf_counter() - start:.1f}s")
+
+        await conn.execute("INSERT INTO bench_seed VALUES ($1, $2, $3, now())", guilds, users, warns)
+
+        start = time.perf_counter()
+        await conn.execute("ANALYZE")
+        print(f"{'analyze':<14} {time.perf_counter() - start:.1f}s")
+
+    finally:
+        await conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Seed the benchmark database")
+    parser.add_argument('--guilds', type = int, default = 5000)
+    parser.add_argument('--users', type = int, default = 500, help = "users per guild")
+    parser.add_argument('--warns', type = int, default = 2_000_000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.guilds, args.users, args.warns))
@@ -0,0 +1,198 @@
+import discord
+from discord.ext import commands
+from discord.ext.commands.cooldowns import BucketType
+from datetime import timedelta
+import re
+from helper.other import Confirm, TimeParser, offence_embed_maker, time_unparser
+from helper.bulk import BulkAction
+from helper import warn_points
+
+EMBED_COLOR = discord.Color.from_str('#e27a7a')
+MAX_TARGETS = 1000
+OFFENCE_COLUMNS = ['guild_id', 'user_id', 'punishment', 'body', 'created_by', 'created_on']
+
+class MassFlags(commands.FlagConverter):
+    users: str = commands.flag(default = None, description = "User IDs or mentions, separated by spaces")
+    joined: TimeParser = commands.flag(default = None, description = "Also every member who joined within this long, e.g. 10m")
+    reason: str = commands.flag(default = "No reason given", description = "The reason, for every user")
+
+class MassMuteFlags(MassFlags):
+    duration: TimeParser = commands.flag(default = None, description = "Duration of timeout, 1 week if not given. 28 days maximum")
+
+class MassWarnFlags(MassFlags):
+    points: int = commands.flag(default = 1, description = "The number of points for each warn")
+
+class MassModeration(commands.Cog, name = "mass moderation", description = "Moderation actions on many users at once, for raids"):
+    def __init__(self, bot: commands.Bot) -> None:
+        self.bot = bot
+
+    async def cog_check(self, ctx: commands.Context) -> bool:
+        if ctx.channel.type == discord.ChannelType.private:
+            return False
+
+        b_c = self.bot.guild_cache.get_value(ctx.guild.id, 'blacklisted_channels')
+
+        if b_c is not None and ctx.channel.id in b_c:
+            return False
+        return True
+
+    def targets(self, ctx: commands.Context, flags: MassFlags, permission: str) -> tuple:
+        """
+        (user IDs to act on, number skipped) from the ID list and the join window.
+        Skips the author, the bot and members who have `permission` or whose top role is not below the bot's
+        """
+        user_ids = [int(user_id) for user_id in re.findall(r'\d{15,20}', flags.users or '')]
+
+        if flags.joined is not None:
+            since = discord.utils.utcnow() - flags.joined
+            user_ids += [member.id for member in ctx.guild.members if member.joined_at is not None and member.joined_at >= since and not member.bot]
+
+        targets = []
+        skipped = 0
+
+        for user_id in dict.fromkeys(user_ids):
+            member = ctx.guild.get_member(user_id)
+
+            if user_id in (ctx.author.id, ctx.guild.me.id, ctx.guild.owner_id) or (member is not None and (
+                getattr(member.guild_permissions, permission) or member.top_role >= ctx.guild.me.top_role)):
+                skipped += 1
+            else:
+                targets.append(user_id)
+
+        return targets[:MAX_TARGETS], skipped + max(len(targets) - MAX_TARGETS, 0)
+
+    async def confirm(self, ctx: commands.Context, action: str, targets: list, skipped: int) -> bool:
+        if len(targets) == 0:
+            await ctx.send(f"No users to {action}." + (f" Skipped {skipped} that cannot be actioned." if skipped else ""),
+            ephemeral = True, delete_after = 5)
+            return False
+
+        view = Confirm(ctx.author)
+        msg = await ctx.send(f"This will {action} **{len(targets)}** users" + (f" (skipping {skipped})" if skipped else "") +
+        ". Should I do it?", view = view, ephemeral = True)
+
+        await view.wait()
+        await msg.delete()
+        return view.value is not None
+
+    def log(self, ctx: commands.Context, title: str, action_past: str, user_ids: list, reason: str):
+        """Sends one embed per user to the mod-log channel, which packs them into few messages"""
+        for user_id in user_ids:
+            user = ctx.guild.get_member(user_id) or self.bot.get_user(user_id) or discord.Object(user_id)
+            self.bot.modlog.log(ctx, offence_embed_maker(title, action_past, user, ctx.author, reason, False))
+
+    async def run(self, ctx: commands.Context, title: str, action_past: str, targets: list, action, punishment: str, reason: str) -> BulkAction:
+        """Runs `action` on every target with a live progress message, then logs the offences in one COPY"""
+        def progress_embed(bulk: BulkAction, done: bool) -> discord.Embed:
+            em = discord.Embed(color = EMBED_COLOR, title = f"Moderator Action: ` {title} `",
+            description = f"**Progress:** `{bulk.finished}/{len(targets)}`{' (done)' if done else ''}\n**Reason:** {reason}")
+            em.add_field(name = "Succeeded", value = f"`{len(bulk.done)}`")
+            em.add_field(name = "Failed", value = f"`{len(bulk.failed)}`")
+            em.add_field(name = "Rate", value = f"`{bulk.rate:.1f}/s`")
+            em.set_author(name = str(ctx.author), icon_url = ctx.author.display_avatar.url)
+            return em
+
+        bulk = BulkAction(targets, action)
+        msg = await ctx.send(embed = progress_embed(bulk, False))
+
+        async def on_progress(bulk: BulkAction):
+            await msg.edit(embed = progress_embed(bulk, False))
+
+        await bulk.run(on_progress)
+
+        now = discord.utils.utcnow()
+        await self.bot.db.copy_records('offences', OFFENCE_COLUMNS,
+        [(ctx.guild.id, user_id, punishment, reason, ctx.author.id, now) for user_id in bulk.done])
+        self.log(ctx, title, action_past, bulk.done, reason)
+
+        em = progress_embed(bulk, True)
+        if bulk.failed:
+            failed = ', '.join(f"`{user_id}`" for user_id, _ in bulk.failed[:20])
+            em.add_field(name = "Failed users", value = failed + (" ..." if len(bulk.failed) > 20 else ""), inline = False)
+
+        await msg.edit(embed = em)
+        return bulk
+
+    @commands.cooldown(rate = 1, per = 30, type = BucketType.guild)
+    @commands.has_guild_permissions(ban_members = True)
+    @commands.hybrid_command(description = "Bans many users at once, by ID or by join time, deleting their last day of messages")
+    async def massban(self, ctx: commands.Context, *, flags: MassFlags):
+        targets, skipped = self.targets(ctx, flags, 'ban_members')
+
+        if not await self.confirm(ctx, 'ban', targets, skipped):
+            return
+
+        async def ban(user_id: int):
+            await ctx.guild.ban(discord.Object(user_id), reason = flags.reason, delete_message_days = 1)
+
+        bulk = await self.run(ctx, 'Mass ban', 'banned', targets, ban, 'ban', flags.reason)
+
+        # the bans are permanent, so earlier timed bans of these users are dropped
+        await self.bot.db.execute('banned_delete_users', bulk.done, ctx.guild.id)
+        for user_id in bulk.done:
+            self.bot.unbans.remove(ctx.guild.id, user_id)
+
+    @commands.cooldown(rate = 1, per = 30, type = BucketType.guild)
+    @commands.has_guild_permissions(kick_members = True)
+    @commands.hybrid_command(description = "Kicks many members at once, by ID or by join time")
+    async def masskick(self, ctx: commands.Context, *, flags: MassFlags):
+        targets, skipped = self.targets(ctx, flags, 'kick_members')
+        # only members can be kicked
+        targets = [user_id for user_id in targets if ctx.guild.get_member(user_id) is not None]
+
+        if not await self.confirm(ctx, 'kick', targets, skipped):
+            return
+
+        async def kick(user_id: int):
+            await ctx.guild.kick(discord.Object(user_id), reason = flags.reason)
+
+        await self.run(ctx, 'Mass kick', 'kicked', targets, kick, 'kick', flags.reason)
+
+    @commands.cooldown(rate = 1, per = 30, type = BucketType.guild)
+    @commands.has_guild_permissions(moderate_members = True)
+    @commands.hybrid_command(description = "Times out many members at once, by ID or by join time", aliases = ['masstimeout'])
+    async def massmute(self, ctx: commands.Context, *, flags: MassMuteFlags):
+        until = flags.duration if flags.duration is not None else timedelta(weeks = 1)
+
+        if until > timedelta(days = 28):
+            return await ctx.send("Can only timeout for 28 days maximum.", ephemeral = True, delete_after = 5)
+
+        targets, skipped = self.targets(ctx, flags, 'moderate_members')
+        targets = [user_id for user_id in targets if ctx.guild.get_member(user_id) is not None]
+
+        if not await self.confirm(ctx, 'timeout', targets, skipped):
+            return
+
+        async def mute(user_id: int):
+            member = ctx.guild.get_member(user_id)
+            if member is None:
+                raise commands.MemberNotFound(str(user_id))
+            await member.timeout(until, reason = flags.reason)
+
+        await self.run(ctx, 'Mass timeout', 'timed out', targets, mute, f'timeout {time_unparser(until)}', flags.reason)
+
+    @commands.cooldown(rate = 1, per = 30, type = BucketType.guild)
+    @commands.has_guild_permissions(moderate_members = True)
+    @commands.hybrid_command(description = "Warns many users at once, by ID or by join time. Thresholds are not applied")
+    async def masswarn(self, ctx: commands.Context, *, flags: MassWarnFlags):
+        if flags.points > 999 or flags.points <= 0:
+            return await ctx.send("Invalid number of points", ephemeral = True, delete_after = 5)
+
+        targets, skipped = self.targets(ctx, flags, 'moderate_members')
+
+        if not await self.confirm(ctx, 'warn', targets, skipped):
+            return
+
+        # no Discord requests, so every warn is one statement
+        await warn_points.warn_many(self.bot.db, ctx.guild.id, targets, flags.reason, flags.points, ctx.author.id)
+        self.log(ctx, 'Mass warn', f"warned (`{flags.points}` point{'s' if flags.points > 1 else ''})", targets, flags.reason)
+
+        em = discord.Embed(color = EMBED_COLOR, title = f"Moderator Action: ` Mass warn `",
+        description = f"**{len(targets)}** users have been warned (`{flags.points}` point{'s' if flags.points > 1 else ''}).\n**Reason:** {flags.reason}")
+        em.set_author(name = str(ctx.author), icon_url = ctx.author.display_avatar.url)
+        em.set_footer(text = "Warn thresholds are not applied to mass warns")
+
+        await ctx.send(embed = em)
+
+async def setup(bot: commands.Bot) -> None:
+    await bot.add_cog(MassModeration(bot))
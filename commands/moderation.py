@@ -6,19 +6,57 @@ from discord.app_commands import describe
 from datetime import timedelta
 from typing import Optional, Literal
 from helper.other import Paginator, offence_dm_embed_maker, offence_embed_maker, time_unparser, TimeParser, Confirm
+from helper import warn_points
+from helper.resolver import mention
+from helper.outbox import dm_footer
+from helper.history import KeysetSource
+from helper.unbans import UnbanScheduler, WINDOW
+from helper import partitions
+import asyncio
 import asyncpg
+import sys
+import traceback
 
 EMBED_COLOR = discord.Color.from_str('#e27a7a')
+# kicked and banned users no longer share a server with the bot, so their DM gets this long to go out before the action
+DM_HEAD_START = 2
+
+def triggered_threshold(ctx: commands.Context) -> tuple:
+    """(autopunishment id, points) if `warn` invoked this command for a threshold, otherwise (None, None)"""
+    threshold = getattr(ctx, 'threshold', None)
+    return (threshold['id'], threshold['points']) if threshold is not None else (None, None)
 
 class Moderation(commands.Cog, name = "moderation"):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
 
+    async def dm_before(self, user: discord.abc.User, embed: discord.Embed) -> tuple:
+        """Queues the DM and waits up to DM_HEAD_START for it. Returns (future, sent), sent being None if it is still pending"""
+        future = self.bot.outbox.send(user, embed)
+        await asyncio.wait([future], timeout = DM_HEAD_START)
+        return future, future.result() if future.done() else None
+
+    async def act_and_log(self, ctx: commands.Context, action, user_id: int, punishment: str, reason: str):
+        """Runs the Discord action and logs the offence concurrently. If the action fails, the offence is removed and the error raised"""
+        done, offence_id = await asyncio.gather(action,
+        self.bot.db.fetchval('offence_insert', ctx.guild.id, user_id, punishment, reason, ctx.author.id, discord.utils.utcnow(), *triggered_threshold(ctx)),
+        return_exceptions = True)
+
+        if isinstance(done, BaseException):
+            if not isinstance(offence_id, BaseException):
+                await self.bot.db.execute('offence_delete', offence_id)
+            raise done
+
+        if isinstance(offence_id, BaseException):
+            # the action went through, so the moderator still gets their response
+            print(f'Logging offence for user {user_id} in guild {ctx.guild.id} failed:', file = sys.stderr)
+            traceback.print_exception(type(offence_id), offence_id, offence_id.__traceback__, file = sys.stderr)
+
     async def cog_check(self, ctx: commands.Context) -> bool:
         if ctx.channel.type == discord.ChannelType.private:
             return False
 
-        b_c = await self.bot.pool.fetchval("SELECT blacklisted_channels FROM guild_table WHERE guild_id = $1", ctx.guild.id)
+        b_c = self.bot.guild_cache.get_value(ctx.guild.id, 'blacklisted_channels')
 
         if b_c is not None and ctx.channel.id in b_c:
             return False
@@ -39,33 +77,21 @@ class Moderation(commands.Cog, name = "moderation"):
         if member.roles[-1] >= ctx.guild.me.roles[-1]:
             return await ctx.send("You need to place my role higher than the highest role of this member.", ephemeral = True, delete_after = 5)
 
-        additional_message = await self.bot.pool.fetchval("SELECT offence_message FROM guild_table WHERE guild_id = $1", ctx.guild.id)
+        additional_message = self.bot.guild_cache.get_value(ctx.guild.id, 'offence_message')
 
         dm_em = offence_dm_embed_maker("kicked", 'from', ctx.guild.name, reason = reason, additional_message = additional_message)
         
         kicked_member = member
 
-        try:
-            await member.send(embed = dm_em)
-            sent = True
-        except:
-            sent = False
-        
-        await member.kick(reason = reason)
+        future, sent = await self.dm_before(member, dm_em)
+
+        await self.act_and_log(ctx, member.kick(reason = reason), kicked_member.id, 'kick', reason)
         em = offence_embed_maker("Kick", "kicked", kicked_member, ctx.author, reason, sent)
+        self.bot.modlog.log(ctx, em)
 
-        await ctx.send(embed = em)
-
-        # id serial primary key,
-        # guild_id BIGINT NOT NULL,
-        # user_id BIGINT NOT NULL,
-        # punishment varchar (50) NOT NULL,
-        # body TEXT,
-        # created_by BIGINT NOT NULL,
-        # created_on TIMESTAMP WITH TIME ZONE NOT NULL
-        
-        await self.bot.pool.execute("INSERT INTO offences (guild_id, user_id, punishment, body, created_by, created_on) VALUES ($1,$2,$3,$4,$5,$6)",
-        ctx.guild.id, kicked_member.id, 'kick', reason, ctx.author.id, discord.utils.utcnow())
+        msg = await ctx.send(embed = em)
+        if sent is None:
+            self.bot.outbox.report(future, msg, em)
 
     @commands.cooldown(rate = 1, per = 5, type = BucketType.member)
     @describe(
@@ -89,27 +115,22 @@ class Moderation(commands.Cog, name = "moderation"):
         if until > timedelta(days=28):
             return await ctx.send("Can only timeout for 28 days maximum.", ephemeral = True, delete_after = 5)
         try:
-            await member.timeout(until, reason = reason)
+            await self.act_and_log(ctx, member.timeout(until, reason = reason), member.id, f'timeout {time_unparser(until)}', reason)
         except:
             return await ctx.send("Failed to time out the user.", delete_after = 5, ephemeral = True)
 
-        additional_message = await self.bot.pool.fetchval("SELECT offence_message FROM guild_table WHERE guild_id = $1", ctx.guild.id)
+        additional_message = self.bot.guild_cache.get_value(ctx.guild.id, 'offence_message')
 
         dm_em = offence_dm_embed_maker('timed out', 'in', ctx.guild.name, reason, additional_message = additional_message,
         until = until + discord.utils.utcnow())
 
-        try:
-            await member.send(embed = dm_em)
-            sent = True
-        except:
-            sent = False
-
-        em = offence_embed_maker('Timeout', 'timed out', member, ctx.author, reason, sent, until + discord.utils.utcnow())
+        # the member stays in the server, so the DM does not have to go out first
+        future = self.bot.outbox.send(member, dm_em)
 
-        await ctx.send(embed = em)
+        em = offence_embed_maker('Timeout', 'timed out', member, ctx.author, reason, None, until + discord.utils.utcnow())
+        self.bot.modlog.log(ctx, em)
 
-        await self.bot.pool.execute("INSERT INTO offences (guild_id, user_id, punishment, body, created_by, created_on) VALUES ($1,$2,$3,$4,$5,$6)",
-        ctx.guild.id, member.id, f'timeout {time_unparser(until)}', reason, ctx.author.id, discord.utils.utcnow())
+        self.bot.outbox.report(future, await ctx.send(embed = em), em)
 
     @commands.cooldown(rate = 1, per = 5, type = BucketType.member)
     @describe(
@@ -162,7 +183,7 @@ class Moderation(commands.Cog, name = "moderation"):
             if member.roles[-1] >= ctx.guild.me.roles[-1]:
                 return await ctx.send("You need to place my role higher than the highest role of this member.", ephemeral = True, delete_after = 5)
 
-        additional_message = await self.bot.pool.fetchval("SELECT offence_message FROM guild_table WHERE guild_id = $1", ctx.guild.id)
+        additional_message = self.bot.guild_cache.get_value(ctx.guild.id, 'offence_message')
 
         if until is not None:
             dm_em = offence_dm_embed_maker("banned", 'from', ctx.guild.name, reason = reason, additional_message = additional_message,
@@ -173,35 +194,37 @@ class Moderation(commands.Cog, name = "moderation"):
         
         banned_member = member
 
-        try:
-            await member.send(embed = dm_em)
-            sent = True
-        except:
-            sent = False
+        future, sent = await self.dm_before(member, dm_em)
 
         delete_days = 1 if ban_type == 'del' else 0
+        punishment = f"ban {time_unparser(until)}" if until is not None else 'ban'
+
+        # banning again only changes the timer below
+        if self.bot.ban_index.contains(ctx.guild.id, member.id) is not True:
+            action = ctx.guild.ban(member, reason = reason, delete_message_days = delete_days)
+        else:
+            action = asyncio.sleep(0)
 
-        await ctx.guild.ban(member, reason = reason, delete_message_days = delete_days)
+        await self.act_and_log(ctx, action, banned_member.id, punishment, reason)
 
-        await self.bot.pool.execute("DELETE FROM banned_users WHERE user_id=$1 and guild_id=$2", banned_member.id, ctx.guild.id)
+        await self.bot.db.execute('banned_delete_user', banned_member.id, ctx.guild.id)
+        self.bot.unbans.remove(ctx.guild.id, banned_member.id)
         
         if until is not None:
-            ban_em = offence_embed_maker('Ban', 'banned', banned_member, ctx.author, reason, sent, until = discord.utils.utcnow() + until)
-            await self.bot.pool.execute("INSERT INTO banned_users(user_id,guild_id,wait_until) VALUES($1,$2,$3)",
-            banned_member.id, ctx.guild.id, discord.utils.utcnow() + until)
+            wait_until = discord.utils.utcnow() + until
+            ban_em = offence_embed_maker('Ban', 'banned', banned_member, ctx.author, reason, sent, until = wait_until)
+            ban_id = await self.bot.db.fetchval('banned_insert', banned_member.id, ctx.guild.id, wait_until)
+            self.bot.unbans.add(ban_id, ctx.guild.id, banned_member.id, wait_until)
             
         else:
             ban_em = offence_embed_maker('Ban', 'banned', banned_member, ctx.author, reason, sent)
 
-        if ctx.interaction is None:
-            await ctx.send(embed = ban_em)
-        else:
-            await ctx.interaction.followup.send(embed = ban_em)
+        self.bot.modlog.log(ctx, ban_em)
 
-        punishment = f"ban {time_unparser(until)}" if until is not None else 'ban'
-
-        await self.bot.pool.execute("INSERT INTO offences(guild_id, user_id, punishment, body, created_by, created_on) VALUES($1,$2,$3,$4,$5,$6)",
-        ctx.guild.id, banned_member.id, punishment, reason, ctx.author.id, discord.utils.utcnow())
+        # after the defer, ctx.send sends a followup and returns its message
+        msg = await ctx.send(embed = ban_em)
+        if sent is None:
+            self.bot.outbox.report(future, msg, ban_em)
 
     @commands.cooldown(rate = 1, per = 5, type = BucketType.member)
     @describe(
@@ -213,14 +236,16 @@ class Moderation(commands.Cog, name = "moderation"):
     async def unban(self, ctx: commands.Context, member: discord.User, reason: str = "No reason given."):
         banned = False
 
-        if member in [x.user async for x in ctx.guild.bans()]:
+        if await self.bot.ban_index.is_banned(ctx.guild, member.id):
             await ctx.guild.unban(user = member, reason = reason)
             banned = True
 
-            await self.bot.pool.execute("DELETE FROM banned_users where guild_id=$1 AND user_id=$2", ctx.guild.id, member.id)
+            await self.bot.db.execute('banned_delete_user', member.id, ctx.guild.id)
+            self.bot.unbans.remove(ctx.guild.id, member.id)
 
         if banned:
             em = offence_embed_maker('Unban', 'unbanned', member, ctx.author, reason, False)
+            self.bot.modlog.log(ctx, em)
             return await ctx.send(embed = em)
 
         await ctx.send("User is not banned.", ephemeral=True, delete_after=3)
@@ -236,67 +261,38 @@ class Moderation(commands.Cog, name = "moderation"):
     async def warn(self, ctx: commands.Context, member: discord.Member | discord.User, points: Optional[int], *, reason: str = "No reason given."):
         if ctx.interaction:
             await ctx.interaction.response.defer()
-        conn = self.bot.pool
-
-        autocompletes = await conn.fetch("SELECT * FROM autocompletes WHERE guild_id=$1",ctx.guild.id)
-
-        for x in autocompletes:
-            if reason in x['reason']:
-                points = x['points']
-                break
 
-        if points is None:
-            points = 1
+        # logs the warn and reads the new total, the threshold to punish for and the DM message, in one call
+        result = await warn_points.warn(self.bot.db, ctx.guild.id, member.id, reason, points, ctx.author.id)
+        points = result['points']
 
-        thresholds = await conn.fetch("SELECT * FROM autopunishments WHERE guild_id=$1 ORDER BY points ASC", ctx.guild.id)
-
-        if points > 999 or points == 0:
+        if result['total'] is None:
+            if points < 0:
+                return await ctx.send("To reduce a user's points, use `pardon`", ephemeral = True, delete_after = 5)
             return await ctx.send("Invalid number of points", ephemeral = True, delete_after = 5)
-        if points < 0:
-            return await ctx.send("To reduce a user's points, use `pardon`", ephemeral = True, delete_after = 5)
-        
-        await conn.execute("INSERT INTO warns(guild_id, user_id, body, points, created_by, created_on) VALUES($1,$2,$3,$4,$5,$6)",
-        ctx.guild.id, member.id, reason, points, ctx.author.id, discord.utils.utcnow())
 
-
-        # adding points to user, along with retrieving total
-        total_points = 0
+        total_points = result['total']
         violated_offence = None
 
-        for x in await conn.fetch("SELECT points FROM warns WHERE guild_id=$1 AND user_id=$2", ctx.guild.id, member.id):
-            total_points += x['points']
-            total_points = 0 if total_points < 0 else total_points
-
-        if len(thresholds) > 0:
-            violated_r = [record for record in thresholds if record['points'] <= total_points]
-
-            if len(violated_r) > 0:
-                violated_t = violated_r[-1]
-            
-                violated_offences = await conn.fetch(f"""SELECT * FROM offences
-                WHERE guild_id=$1 AND user_id=$2 AND body LIKE '%{str(violated_t['points'])} points' AND pardoned = false""", 
-                ctx.guild.id, member.id)
-
-                if violated_offences == []:
-                    violated_offence = violated_t
+        if result['threshold_id'] is not None:
+            violated_offence = {
+                'id': result['threshold_id'],
+                'points': result['threshold_points'],
+                'p_type': result['threshold_type'],
+                'timer': result['threshold_timer']
+            }
         
         # DM
         dm_em = discord.Embed(color = EMBED_COLOR, title = f"Moderator Action: you have been warned",
         description = f"You have been warned (`{points}` point{'s' if points > 1 else ''}) in **{ctx.guild.name}**.\n**Reason:** {reason}")
 
-        additional_message = await self.bot.pool.fetchval("SELECT offence_message FROM guild_table WHERE guild_id = $1", ctx.guild.id)
-
-        if additional_message is not None:
-            dm_em.add_field(name = "Additional Message", value = additional_message, inline = False)
+        if result['offence_message'] is not None:
+            dm_em.add_field(name = "Additional Message", value = result['offence_message'], inline = False)
             
-        if len(thresholds) > 0 and 'ban' in thresholds[-1]['p_type']:
-            dm_em.add_field(name = "Maximum points", value = f"You get banned at {thresholds[-1]['points']} points.")
+        if result['max_type'] is not None and 'ban' in result['max_type']:
+            dm_em.add_field(name = "Maximum points", value = f"You get banned at {result['max_points']} points.")
 
-        try:
-            await member.send(embed = dm_em)
-            sent = True
-        except:
-            sent = False
+        future = self.bot.outbox.send(member, dm_em)
 
         # making embed        
         warn_em = discord.Embed(color = EMBED_COLOR, title = f"Moderator Action: ` Warn `",
@@ -307,16 +303,17 @@ class Moderation(commands.Cog, name = "moderation"):
         warn_em.add_field(name = "User points", value = f"`{total_points} points`")
 
         no_max_threshold = "No maximum threshold is set.\nPlease use `/set warning` to setup the warning system."
-        if len(thresholds) > 0:
-            maximum_points = f"`{thresholds[-1]['points']} points`" if 'ban' in thresholds[-1]['p_type'] else f"`{no_max_threshold}`"
+        if result['max_type'] is not None:
+            maximum_points = f"`{result['max_points']} points`" if 'ban' in result['max_type'] else f"`{no_max_threshold}`"
         else:
             maximum_points = no_max_threshold
 
         warn_em.add_field(name = "Maximum points", value = maximum_points)
     
-        warn_em.set_footer(text = f"DM to the user {'has been sent' if sent else 'could not be sent'}")
+        warn_em.set_footer(text = dm_footer(None))
     
-        await ctx.send(embed = warn_em)
+        self.bot.modlog.log(ctx, warn_em)
+        self.bot.outbox.report(future, await ctx.send(embed = warn_em), warn_em)
 
         # punishment
         if violated_offence is None:
@@ -340,6 +337,8 @@ class Moderation(commands.Cog, name = "moderation"):
 
         if view.value is not None:
             pun_reason = f"Exceeded warn limit - {violated_offence['points']} points"
+            # read by the punishment command, to link its offence to the threshold
+            ctx.threshold = violated_offence
             
             if violated_offence['p_type'] == 'kick':
                 cmd = self.bot.get_command("kick")
@@ -359,7 +358,7 @@ class Moderation(commands.Cog, name = "moderation"):
 
     @warn.autocomplete('reason')
     async def warn_autocomplete(self, itx: discord.Interaction, current: str):
-        autocompletes = await self.bot.pool.fetch("SELECT * FROM autocompletes WHERE guild_id=$1",itx.guild.id)
+        autocompletes = await self.bot.db.fetch('autocompletes_by_guild', itx.guild.id)
         return [discord.app_commands.Choice(name=f"{x['points']} points: {x['reason']}",value=x['reason']) for x in autocompletes]
 
     @commands.cooldown(rate = 1, per = 5, type = BucketType.member)
@@ -371,34 +370,17 @@ class Moderation(commands.Cog, name = "moderation"):
     @commands.has_guild_permissions(moderate_members = True)
     @commands.hybrid_command(description = "Reduces a user's points.")
     async def pardon(self, ctx: commands.Context, member: discord.Member | discord.User, points: int, *, reason: str = "No reason given."):
-        conn = self.bot.pool
         points = -abs(points)
 
         if points < -999 or points == 0:
             return await ctx.send("Invalid number of points", ephemeral = True, delete_after = 5)
 
-        total_points = 0
-        for x in await conn.fetch("SELECT points FROM warns WHERE guild_id=$1 AND user_id=$2", ctx.guild.id, member.id):
-            total_points += x['points']
-            total_points = 0 if total_points < 0 else total_points
+        result = await warn_points.pardon(self.bot.db, ctx.guild.id, member.id, reason, points, ctx.author.id)
 
-        if total_points == 0:
+        if result['total'] is None:
             return await ctx.send("User has 0 warn points already.", ephemeral = True, delete_after = 5)
 
-        await conn.execute("INSERT INTO warns(guild_id, user_id, body, points, created_by, created_on) VALUES($1,$2,$3,$4,$5,$6)",
-        ctx.guild.id, member.id, reason, points, ctx.author.id, discord.utils.utcnow())
-
-        total_points += points
-
-        thresholds = await conn.fetch("SELECT * FROM autopunishments WHERE guild_id=$1 ORDER BY points ASC", ctx.guild.id)
-
-        if len(thresholds) > 0:
-            violated_r = [record for record in thresholds if record['points'] >= total_points]
-
-            for violated_t in violated_r:
-                await conn.execute(f"""UPDATE offences SET pardoned = true
-                WHERE guild_id=$1 AND user_id=$2 AND body LIKE '%{violated_t['points']} points' AND pardoned = false""", 
-                ctx.guild.id, member.id)
+        total_points = result['total']
 
         # making embed        
         warn_em = discord.Embed(color = EMBED_COLOR, title = f"Moderator Action: ` Pardon `",
@@ -409,13 +391,14 @@ class Moderation(commands.Cog, name = "moderation"):
         warn_em.add_field(name = "User points", value = f"`{total_points} points`")
 
         no_max_threshold = "No maximum threshold is set.\nPlease use `/set warning` to setup the warning system."
-        if len(thresholds) > 0:
-            maximum_points = f"`{thresholds[-1]['points']} points`" if 'ban' in thresholds[-1]['p_type'] else f"`{no_max_threshold}`"
+        if result['max_type'] is not None:
+            maximum_points = f"`{result['max_points']} points`" if 'ban' in result['max_type'] else f"`{no_max_threshold}`"
         else:
             maximum_points = no_max_threshold
 
         warn_em.add_field(name = "Maximum points", value = maximum_points)
     
+        self.bot.modlog.log(ctx, warn_em)
         await ctx.send(embed = warn_em)
 
     @commands.cooldown(rate = 1, per = 5, type = BucketType.member)
@@ -424,37 +407,26 @@ class Moderation(commands.Cog, name = "moderation"):
     @commands.hybrid_command(description = "Deletes a user's warn")
     async def delwarn(self, ctx: commands.Context, id: int, *, reason: str = "No reason given"):
         id = abs(id)
-        conn = self.bot.pool
 
-        record = await conn.fetchrow("SELECT * FROM warns WHERE guild_id = $1 AND id = $2", ctx.guild.id, id)
+        record = await warn_points.delete_warn(self.bot.db, ctx.guild.id, id)
 
         if record is None:
             return await ctx.send("Warn with this ID does not exist", ephemeral = True, delete_after = 5)
 
-        await self.bot.pool.execute("DELETE FROM warns WHERE guild_id = $1 AND id = $2", ctx.guild.id, id)
-
-        total_points = 0
-        for x in await conn.fetch("SELECT points FROM warns WHERE guild_id=$1 AND user_id=$2", ctx.guild.id, record['user_id']):
-            total_points += x['points']
-            total_points = 0 if total_points < 0 else total_points
-
-        thresholds = await conn.fetch("SELECT * FROM autopunishments WHERE guild_id=$1 ORDER BY points ASC", ctx.guild.id)
-
-        if len(thresholds) > 0:
-            violated_r = [record for record in thresholds if record['points'] >= total_points]
-
-            for violated_t in violated_r:
-                await conn.execute(f"""UPDATE offences SET pardoned = true
-                WHERE guild_id=$1 AND user_id=$2 AND body LIKE '%{violated_t['points']} points' AND pardoned = false""", 
-                ctx.guild.id, record['user_id'])
+        total_points = record['total']
 
         warn_em = discord.Embed(color = EMBED_COLOR, title = f"Moderator Action: ` Warn delete `",
         description = f"Warn with ID `{record['id']}` has been deleted\n**Reason:** {reason}")
         
-        warn_em.add_field(name = "User", value = f"{await self.bot.fetch_user(record['user_id'])} (ID: {record['user_id']})")
+        users = await self.bot.resolver.fetch_users([record['user_id'], record['created_by']])
+
+        warn_em.add_field(name = "User", value = f"{users[record['user_id']] or 'Deleted user'} (ID: {record['user_id']})")
         warn_em.add_field(name = "Points", value = f"`{record['points']}`")
         warn_em.add_field(name = "Reason", value = record['body'], inline = False)
-        warn_em.add_field(name = "Warned by", value = f"{await self.bot.fetch_user(record['created_by'])} (ID: {record['created_by']})")
+        if record['created_by'] == warn_points.DECAY_AUTHOR:
+            warn_em.add_field(name = "Warned by", value = "Monthly decay")
+        else:
+            warn_em.add_field(name = "Warned by", value = f"{users[record['created_by']] or 'Deleted user'} (ID: {record['created_by']})")
         warn_em.add_field(name = "Warned on", value = discord.utils.format_dt(record['created_on'], 'd'))
         
         
@@ -462,6 +434,7 @@ class Moderation(commands.Cog, name = "moderation"):
 
         warn_em.set_footer(text = f"This user has {total_points} points")
     
+        self.bot.modlog.log(ctx, warn_em)
         await ctx.send(embed = warn_em)
 
     @commands.cooldown(rate = 1, per = 10, type = BucketType.member)
@@ -472,41 +445,34 @@ class Moderation(commands.Cog, name = "moderation"):
         if ctx.interaction:
             await ctx.interaction.response.defer()
         
-        warnings = await self.bot.pool.fetch("SELECT * FROM warns WHERE guild_id = $1 AND user_id = $2 ORDER BY id ASC", ctx.guild.id, member.id)
+        count = await self.bot.db.fetchval('warns_count', ctx.guild.id, member.id)
 
-        if len(warnings) == 0:
+        if count == 0:
             return await ctx.send("This user has no warnings.")
-        total_points = 0
-        for x in warnings:
-            total_points += x['points']
-            total_points = 0 if total_points < 0 else total_points
-
-
-        em = discord.Embed(color = EMBED_COLOR, title = f"Warnings for `{str(member).replace('`','')}`", description = f"User points: `{total_points}`")
-        em_list = [em]
-        field_id = 0
-
-        for rec in warnings:
-            if field_id == 24:
-                em = discord.Embed(color = EMBED_COLOR, title = f"Warnings for `{str(member).replace('`','')}`",
-                description = f"User points: `{total_points}`")
-                em_list.append(em)
-                field_id = 0
-
-            id = rec['id']
-            points = rec['points']
-            mod = await self.bot.fetch_user(rec['created_by'])
-            created_on = discord.utils.format_dt(rec['created_on'], 'F')
-
-            em.add_field(name = f"ID: `{id}`",
-            value = f"**Points:** `{points}`\n**Moderator:** {mod.mention}\n**Warned on:** {created_on}\n**Reason:** {x['body'][:800]}")
-            field_id += 1
-
-        if len(em_list) == 1:
-            await ctx.send(embed = em)
-        else:
-            view = Paginator(ctx.author, em_list)
-            view.msg = await ctx.send(embed = em_list[0], view = view)
+        total_points = await warn_points.get_balance(self.bot.db, ctx.guild.id, member.id)
+
+        async def render(warnings: list, page: int) -> discord.Embed:
+            em = discord.Embed(color = EMBED_COLOR, title = f"Warnings for `{str(member).replace('`','')}`",
+            description = f"User points: `{total_points}`\nWarnings: `{count}`")
+            # one lookup per distinct moderator on the page
+            moderators = await self.bot.resolver.fetch_users(rec['created_by'] for rec in warnings if rec['created_by'] != warn_points.DECAY_AUTHOR)
+
+            for rec in warnings:
+                if rec['created_by'] == warn_points.DECAY_AUTHOR:
+                    mod = "Monthly decay"
+                else:
+                    mod = mention(moderators[rec['created_by']], rec['created_by'])
+                created_on = discord.utils.format_dt(rec['created_on'], 'F')
+
+                # expired points no longer count towards the user's points
+                points = f"~~`{rec['points']}`~~ (expired)" if rec['expired'] else f"`{rec['points']}`"
+
+                em.add_field(name = f"ID: `{rec['id']}`",
+                value = f"**Points:** {points}\n**Moderator:** {mod}\n**Warned on:** {created_on}\n**Reason:** {rec['body'][:800]}")
+
+            return em
+
+        await Paginator(ctx.author, KeysetSource(self.bot.db, 'warns', ctx.guild.id, member.id, count, render)).send(ctx)
     
     @commands.cooldown(rate = 1, per = 10, type = BucketType.member)
     @describe(member = "The user to check the action logs of")
@@ -516,83 +482,72 @@ class Moderation(commands.Cog, name = "moderation"):
         if ctx.interaction:
             await ctx.interaction.response.defer()
         
-        offences = await self.bot.pool.fetch("SELECT * FROM offences WHERE guild_id = $1 AND user_id = $2 ORDER BY id ASC", ctx.guild.id, member.id)
+        actions = await self.bot.db.fetchval('offences_count', ctx.guild.id, member.id)
 
-        if len(offences) == 0:
+        if actions == 0:
             return await ctx.send("This user has no action logs.")
-        
-        actions = len(offences)
 
-        em = discord.Embed(color = EMBED_COLOR, title = f"Action logs for `{str(member).replace('`','')}`",
-        description = f"Actions on this user: `{actions}`")
-        
-        em_list = [em]
-        field_id = 0
-        chars = 0
-
-        for rec in offences:
-            if field_id == 24 or chars > 5000:
-                em = discord.Embed(color = EMBED_COLOR, title = f"Action logs for `{str(member).replace('`','')}`",
-                description = f"Actions on this user: `{actions}`")
-                em_list.append(em)
-                field_id = 0
-                chars = 0
-            else:
-                field_id += 1
-            mod = await self.bot.fetch_user(rec['created_by'])
-            created_on = discord.utils.format_dt(rec['created_on'], 'F')
-
-            name = f"Action: `{rec['punishment']}`"
-            value = f"**Moderator:** {mod.mention}\n**Action on:** {created_on}\n**Reason:** {rec['body'][:900]}"
-
-            em.add_field(name = name, value = value)
-            chars += len(name) + len(value)
-
-        if len(em_list) == 1:
-            await ctx.send(embed = em)
-        else:
-            view = Paginator(ctx.author, em_list)
-            view.msg = await ctx.send(embed = em_list[0], view = view)
+        async def render(offences: list, page: int) -> discord.Embed:
+            em = discord.Embed(color = EMBED_COLOR, title = f"Action logs for `{str(member).replace('`','')}`",
+            description = f"Actions on this user: `{actions}`")
+            moderators = await self.bot.resolver.fetch_users(rec['created_by'] for rec in offences)
+
+            for rec in offences:
+                mod = mention(moderators[rec['created_by']], rec['created_by'])
+                created_on = discord.utils.format_dt(rec['created_on'], 'F')
+
+                em.add_field(name = f"Action: `{rec['punishment']}`",
+                value = f"**Moderator:** {mod}\n**Action on:** {created_on}\n**Reason:** {rec['body'][:900]}")
+
+            return em
+
+        await Paginator(ctx.author, KeysetSource(self.bot.db, 'offences', ctx.guild.id, member.id, actions, render)).send(ctx)
 
 class ModTask(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.data = []
+        # used by ban and unban to update the schedule
+        self.bot.unbans = UnbanScheduler(bot)
         self.mod_task.add_exception_type(asyncpg.PostgresConnectionError)
         self.mod_task.start()
 
+        # every cluster keeps partitions created, so none depends on another staying up; the database serializes them
+        self.partition_task.add_exception_type(asyncpg.PostgresConnectionError)
+        self.partition_task.start()
+
+        # one cluster is enough to decay every guild's points
+        if bot.cluster_id == 0:
+            self.decay_task.add_exception_type(asyncpg.PostgresConnectionError)
+            self.decay_task.start()
+
     def cog_unload(self):
         self.mod_task.cancel()
+        self.partition_task.cancel()
+        self.decay_task.cancel()
+        self.bot.unbans.stop()
 
-    @tasks.loop(minutes = 2)
+    @tasks.loop(seconds = WINDOW.total_seconds() / 2)
     async def mod_task(self):
-        try:
-            banned_users = await self.bot.pool.fetch("SELECT * from banned_users")
-        except asyncpg.UndefinedTableError:
-            banned_users = []
-    
-        for record in banned_users:
-            if record['wait_until'] > discord.utils.utcnow():
-                continue
-            
-            try:
-                guild = await self.bot.fetch_guild(record['guild_id'])
-                user = await self.bot.fetch_user(record['user_id'])
-            except:
-                continue
-
-            try:
-                await guild.unban(user, reason = "Timer expired.")
-            except:
-                pass
-            
-            await self.bot.pool.execute("DELETE FROM banned_users WHERE id = $1", record['id'])
-
+        await self.bot.unbans.load()
 
     @mod_task.before_loop
     async def before_mod_task(self):
         print('waiting...')
         await self.bot.wait_until_ready()
+        self.bot.unbans.start()
+
+    @tasks.loop(hours = 24)
+    async def partition_task(self):
+        created, archived = await partitions.maintain(self.bot.db)
+
+        if created:
+            print(f"Created partitions: {', '.join(created)}")
+        if archived:
+            print(f"Archived partitions: {', '.join(archived)}")
+
+    @tasks.loop(hours = 1)
+    async def decay_task(self):
+        await warn_points.decay(self.bot.db)
 
 async def setup(bot: commands.Bot) -> None:
     await bot.add_cog(Moderation(bot))
@@ -1,7 +1,10 @@
 import discord
 from discord.ext import commands
 from typing import Optional, Literal
-from asyncpg import Connection
+from helper.migrations import migrate, check_plans
+from helper.warn_points import rebuild_balances
+from datetime import timedelta
+import json
 
 class Owner(commands.Cog, command_attrs = dict(hidden = True), description = "Commands for bot owner only."):
     def __init__(self, bot: commands.Bot):
@@ -16,56 +19,56 @@ class Owner(commands.Cog, command_attrs = dict(hidden = True), description = "Co
     @commands.is_owner()
     async def reload(self, ctx, folder, extension):
         """
-        Reloads the extension.
+        Reloads the extension, on every cluster.
         Use `.` if in root directory. 
         """
+        name = extension if folder == '.' else f'{folder}.{extension}'
+
         try:
-            if folder == '.':
-                await self.bot.reload_extension(extension)
-            else:
-                await self.bot.reload_extension(f'{folder}.{extension}')
+            await self.bot.reload_extension(name)
         
         except commands.errors.ExtensionNotFound:
             await ctx.send("Extension does not exist")
         
         else:
+            await self.bot.cluster_bus.broadcast('reload', extension = name)
             await ctx.send("extension has been reloaded!")
 
     @commands.command()
     @commands.is_owner()
     async def load(self, ctx, folder, extension):
         """
-        Load an extension.
+        Load an extension, on every cluster.
         Use `.` if already in root directory.
         """
+        name = extension if folder == '.' else f'{folder}.{extension}'
+
         try:
-            if folder == '.':
-                await self.bot.load_extension(extension)
-            else:
-                await self.bot.load_extension(f'{folder}.{extension}')
+            await self.bot.load_extension(name)
         
         except commands.errors.ExtensionAlreadyLoaded:
             return await ctx.send("Extension already loaded.")
         
+        await self.bot.cluster_bus.broadcast('load', extension = name)
         await ctx.send("Extension has been loaded!")
 
     @commands.command()
     @commands.is_owner()
     async def unload(self, ctx, folder, extension):
         """
-        Unload an extension.
+        Unload an extension, on every cluster.
         Use `.` if already in root directory.
         """
+        name = extension if folder == '.' else f'{folder}.{extension}'
+
         try:
-            if folder == '.':
-                await self.bot.unload_extension(extension)
-            else:
-                await self.bot.unload_extension(f'{folder}.{extension}')
+            await self.bot.unload_extension(name)
         
         except commands.errors.ExtensionNotLoaded or commands.errors.ExtensionNotFound:
             await ctx.send("Extension failed to unload. Check if it exists and was not loaded in the first place.")
         
         else:
+            await self.bot.cluster_bus.broadcast('unload', extension = name)
             await ctx.send("Extension has been unloaded!")
 
     @commands.command()
@@ -80,6 +83,7 @@ class Owner(commands.Cog, command_attrs = dict(hidden = True), description = "Co
         To globally sync, do not suffix with any literal 
         """
         # by Umbra#0009
+        # syncing is done through the API, so running it on the cluster that got the command is enough
 
         # procedure: sync * THEN sync ^ THEN sync
         if not guilds:
@@ -116,6 +120,109 @@ class Owner(commands.Cog, command_attrs = dict(hidden = True), description = "Co
 
         await ctx.send(f"Synced the tree to {ret}/{len(guilds)}.")
 
+    @commands.command()
+    @commands.is_owner()
+    async def clusters(self, ctx: commands.Context):
+        """
+        Shows the status of every cluster, from their latest heartbeats.
+        """
+        records = await self.bot.db.fetch('cluster_status_all')
+
+        em = discord.Embed(title = "Clusters", description = f"This is cluster `{self.bot.cluster_id}`")
+
+        for record in records:
+            latencies = json.loads(record['latencies'])
+            average = round(sum(latencies.values()) / len(latencies)) if latencies else None
+            stale = discord.utils.utcnow() - record['updated_on'] > timedelta(seconds = 90)
+            shards = record['shard_ids']
+
+            em.add_field(name = f"Cluster {record['cluster_id']}{' (not responding)' if stale else ''}",
+            value = f"**Shards:** `{shards[0]}-{shards[-1]}`\n**Guilds:** `{record['guilds']}`\n**Latency:** `{average}ms`\n\
+**Last seen:** {discord.utils.format_dt(record['updated_on'], 'R')}")
+
+        if not records:
+            em.description += "\nNo heartbeats recorded yet."
+
+        await ctx.send(embed = em)
+
+    @commands.command()
+    @commands.is_owner()
+    async def startup(self, ctx: commands.Context):
+        """
+        Shows how long each startup phase took.
+        """
+        report = self.bot.profiler.report()
+        lines = [f"{phase['start']:>8.3f}s  {phase['duration'] or 0:>8.3f}s  {phase['name']}" for phase in report['phases']]
+
+        em = discord.Embed(title = "Startup report", description = f"```   start  duration  phase\n{chr(10).join(lines)[:3900]}```")
+        em.add_field(name = "Ready after", value = f"`{report['ready_after']}s`" if report['ready_after'] is not None else "`Not ready yet`")
+
+        await ctx.send(embed = em)
+
+    @commands.command()
+    @commands.is_owner()
+    async def querystats(self, ctx: commands.Context, count: int = 15):
+        """
+        Shows call counts and latency percentiles (over the last 1000 calls) of the slowest queries on this cluster.
+        """
+        rows = self.bot.db.report()[:count]
+
+        def ms(seconds):
+            return f"{seconds * 1000:.1f}"
+
+        lines = [f"{row['name'][:28]:<28} {row['calls']:>7} {row['errors']:>4} {ms(row['p50']):>7} {ms(row['p95']):>7} {ms(row['p99']):>7}"
+        for row in rows]
+
+        header = f"{'query':<28} {'calls':>7} {'errs':>4} {'p50':>7} {'p95':>7} {'p99':>7}"
+        body = '\n'.join(lines) if lines else "No queries have run yet."
+
+        em = discord.Embed(title = "Query stats (ms)", description = f"```{header}\n{body}"[:4090] + "```")
+
+        await ctx.send(embed = em)
+
+    @commands.command()
+    @commands.is_owner()
+    async def indexcheck(self, ctx: commands.Context):
+        """
+        Checks that the hot queries can use their indexes, from their query plans.
+        """
+        async with self.bot.pool.acquire() as conn:
+            results = await check_plans(conn)
+
+        lines = [f"{'ok' if expected in used else 'MISSING':<8}{name}: {', '.join(sorted(used)) or 'seq scan'}" for name, expected, used in results]
+
+        em = discord.Embed(title = "Index check", description = "```{}```".format('\n'.join(lines)[:4000]))
+
+        await ctx.send(embed = em)
+
+    @commands.command()
+    @commands.is_owner()
+    async def stalls(self, ctx: commands.Context, number: Optional[int]):
+        """
+        Shows the longest event loop stalls on this cluster, or the stack of one of them.
+        """
+        stalls = self.bot.watchdog.worst_stalls()
+
+        if not stalls:
+            return await ctx.send(f"No stalls over {self.bot.watchdog.threshold * 1000:.0f}ms recorded.")
+
+        if number is not None:
+            if not 1 <= number <= len(stalls):
+                return await ctx.send(f"Pick a stall between 1 and {len(stalls)}.")
+
+            stall = stalls[number - 1]
+            em = discord.Embed(title = f"Stall {number}: {stall.duration * 1000:.0f}ms",
+            description = f"**At:** `{stall.callsite}`\n```py\n{stall.format_stack()[-3800:]}```")
+            return await ctx.send(embed = em)
+
+        lines = [f"`{num}.` **{stall.duration * 1000:.0f}ms** {discord.utils.format_dt(stall.started_at, 'R')}\n`{stall.callsite}`"
+        for num, stall in enumerate(stalls, start = 1)]
+
+        em = discord.Embed(title = "Longest event loop stalls", description = '\n'.join(lines))
+        em.set_footer(text = f"Max heartbeat lag: {self.bot.watchdog.max_lag * 1000:.0f}ms. Use stalls <number> for the stack.")
+
+        await ctx.send(embed = em)
+
     @commands.command()
     @commands.is_owner()
     async def test(self, ctx: commands.Context):
@@ -132,115 +239,35 @@ class MasterSetup(commands.Cog, command_attrs = dict(hidden = True), description
     @commands.command()
     @commands.is_owner()
     async def dbsetup(self, ctx: commands.Context):
-        """Setup the database"""
-
-        conn: Connection = self.bot.pool
-
-        # GUILD TABLE
-        await conn.execute("""CREATE TABLE IF NOT EXISTS guild_table (
-            guild_id BIGINT primary key,
-            blacklisted_channels BIGINT [] DEFAULT '{}',
-            offence_message TEXT,
-            prefix varchar (20)
-        )""")
-
-        # WARNS: THRESHOLD PUNISHMENTS
-        await conn.execute("""CREATE TABLE IF NOT EXISTS autopunishments (
-            id bigserial primary key,
-            guild_id BIGINT,
-            points INT NOT NULL,
-            p_type varchar (10) NOT NULL,
-            timer INTERVAL
-        )""")
-
-        # WARNS: WARN REASON AUTOCOMPLETES
-        await conn.execute("""CREATE TABLE IF NOT EXISTS autocompletes(
-            id bigserial primary key,
-            guild_id BIGINT,
-            points INT,
-            reason TEXT
-        )""")
-
-        # VERIFICATION / JOIN ROLES
-        await conn.execute("""CREATE TABLE IF NOT EXISTS join_stats (
-            guild_id BIGINT PRIMARY KEY,
-            verify_role BIGINT,
-            verify_channel BIGINT,
-            verify_message BIGINT,
-            join_role_u BIGINT,
-            join_role_b BIGINT
-            )""")
-
-        # POLLS
-        await conn.execute("""CREATE TABLE IF NOT EXISTS poll_table (
-            id bigserial PRIMARY KEY,
-            message_id BIGINT,
-            creator_id bigint not null,
-            poll_options TEXT [] NOT NULL,
-            multi_option bool DEFAULT true,
-            option_votes INT [],
-            used_users JSON
-        )""")        
-
-        # TAGS
-        await conn.execute("""CREATE TABLE IF NOT EXISTS tags (
-            id bigserial primary key,
-            guild_id BIGINT NOT NULL,
-            tag_name varchar(255) NOT NULL,
-            body TEXT,
-            created_by BIGINT NOT NULL,
-            created_on TIMESTAMP WITH TIME ZONE NOT NULL,
-            aliases varchar(255) []
-        )""")
-
-        # BANNED USERS
-        await conn.execute("""CREATE TABLE IF NOT EXISTS banned_users (
-            id bigserial primary key,
-            user_id BIGINT NOT NULL,
-            guild_id BIGINT NOT NULL,
-            wait_until TIMESTAMP WITH TIME ZONE
-        )""")
-
-        # WARNS LOGGING
-        await conn.execute("""CREATE TABLE IF NOT EXISTS warns (
-            id bigserial primary key,
-            guild_id BIGINT NOT NULL,
-            user_id BIGINT NOT NULL,
-            body TEXT,
-            points INT,
-            created_by BIGINT NOT NULL,
-            created_on TIMESTAMP WITH TIME ZONE NOT NULL
-        )""")
-
-        # OFFENCE LOGGING
-        await conn.execute("""CREATE TABLE IF NOT EXISTS offences (
-            id bigserial primary key,
-            guild_id BIGINT NOT NULL,
-            user_id BIGINT NOT NULL,
-            punishment varchar (100) NOT NULL,
-            body TEXT,
-            pardoned bool DEFAULT FALSE,
-            created_by BIGINT NOT NULL,
-            created_on TIMESTAMP WITH TIME ZONE NOT NULL
-        )""")
-
-        # MARKOV TRIGRAM LOGGER
-        await conn.execute("""CREATE TABLE IF NOT EXISTS markov_table (
-            guild_id BIGINT primary key,
-            channel_id BIGINT,
-            trigrams TEXT [] DEFAULT '{}'
-        )""")
+        """Setup the database, applying any migrations that have not run yet (these also run at startup)"""
+
+        async with self.bot.pool.acquire() as conn:
+            applied = await migrate(conn)
+
+        if applied:
+            # pool connections prepared their statements against the old schema
+            await self.bot.pool.expire_connections()
+            return await ctx.send("Applied migrations:\n" + '\n'.join(f"`{version}` {name}" for version, name in applied))
 
         await ctx.send("Done!")
 
+    @commands.command()
+    @commands.is_owner()
+    async def rebuildbalances(self, ctx: commands.Context):
+        """Recomputes every user's warn point balance from the warns table."""
+        msg = await ctx.send("Rebuilding warn balances...")
+        count = await rebuild_balances(self.bot.db)
+        await msg.edit(content = f"Rebuilt {count} warn balances.")
+
     @commands.command()
     @commands.guild_only()
     @commands.is_owner()
     async def register(self, ctx: commands.Context):
         """Register current guild to guild table."""
 
-        if await self.bot.pool.fetchval("SELECT * FROM guild_table WHERE guild_id = $1", ctx.guild.id) is None:
-            await self.bot.pool.execute("INSERT INTO guild_table (guild_id) VALUES ($1)", ctx.guild.id)
+        if await self.bot.db.fetchrow('guild_table_get', ctx.guild.id) is None:
+            await self.bot.db.execute('guild_insert', ctx.guild.id)
+            await self.bot.guild_cache.refresh(ctx.guild.id)
             return await ctx.send("Done!")
         
         await ctx.send("This guild is already registered.")
@@ -1,7 +1,7 @@
 import discord
 from discord.ext import commands
 from discord.ext.commands.cooldowns import BucketType
-from asyncpg import Connection
+from helper.queries import Database
 from typing import Optional
 from random import choice
 
@@ -18,7 +18,7 @@ class Tags(commands.Cog, name = "tags", description = "Tags return specified tex
         if ctx.channel.type == discord.ChannelType.private:
             return False
 
-        b_c = await self.bot.pool.fetchval("SELECT blacklisted_channels FROM guild_table WHERE guild_id = $1", ctx.guild.id)
+        b_c = self.bot.guild_cache.get_value(ctx.guild.id, 'blacklisted_channels')
 
         if b_c is not None and ctx.channel.id in b_c:
             return False
@@ -32,9 +32,9 @@ class Tags(commands.Cog, name = "tags", description = "Tags return specified tex
 
     @tag.command(name = "create", description = "Creates a tag with a given unique name. If using text command, quote the name parameter")
     async def t_create(self, ctx: commands.Context, name: str, *, content: str):
-        conn: Connection = self.bot.pool
+        db: Database = self.bot.db
 
-        server_tags = await conn.fetch("SELECT tag_name, aliases FROM tags WHERE guild_id = $1", ctx.guild.id)
+        server_tags = await db.fetch('tags_names', ctx.guild.id)
         
         name = name.strip().lower()
 
@@ -48,25 +48,24 @@ class Tags(commands.Cog, name = "tags", description = "Tags return specified tex
 
         content = discord.utils.escape_mentions(content)
 
-        await conn.execute("INSERT INTO tags(guild_id, tag_name, body, created_by, created_on, aliases) VALUES($1,$2,$3,$4,$5,$6)",
-        ctx.guild.id, name, content, ctx.author.id, discord.utils.utcnow(), [])
+        await db.execute('tag_insert', ctx.guild.id, name, content, ctx.author.id, discord.utils.utcnow(), [])
 
         await ctx.send("Tag has been created")
 
     @tag.command(name = "delete", description = "Deletes a tag, or all of a user, or an alias. Should be either administrator or tag owner to do so")
     async def t_delete(self, ctx: commands.Context, user: Optional[discord.Member], *, name: Optional[str]):
-        conn: Connection = self.bot.pool
+        db: Database = self.bot.db
         if name is not None:
             name = name.strip().lower()
 
         if user is not None:
             if ctx.author.guild_permissions.administrator or ctx.author == user:
-                await conn.execute("DELETE FROM tags WHERE created_by = $1 and guild_id = $2", user.id, ctx.guild.id)
+                await db.execute('tags_delete_by_user', user.id, ctx.guild.id)
                 return await ctx.send("Tag(s) have been deleted")
             else:
                 return await ctx.send("You do not have permission to delete this user's tags", ephemeral = True, delete_after = 5)
 
-        server_tags = await conn.fetch("SELECT * FROM tags WHERE guild_id = $1", ctx.guild.id)
+        server_tags = await db.fetch('tags_by_guild', ctx.guild.id)
     
         for server_tag in server_tags:
             if name in server_tag['aliases']:
@@ -76,7 +75,7 @@ class Tags(commands.Cog, name = "tags", description = "Tags return specified tex
                     aliases:list = server_tag['aliases']
                     aliases.remove(name)
 
-                    await conn.execute("UPDATE tags SET aliases = $1 WHERE id = $2", aliases, tag_id)
+                    await db.execute('tag_set_aliases', aliases, tag_id)
 
                     return await ctx.send("Alias has been removed")
                 
@@ -87,7 +86,7 @@ class Tags(commands.Cog, name = "tags", description = "Tags return specified tex
                 tag_id = server_tag['id']
 
                 if server_tag['created_by'] == ctx.author.id or ctx.author.guild_permissions.administrator:
-                    await conn.execute("DELETE FROM tags WHERE id = $1", tag_id)
+                    await db.execute('tag_delete', tag_id)
                     return await ctx.send("Done!")
                 else:
                     return await ctx.send("You do not have permission to delete this user's tag", ephemeral = True, delete_after = 5)
@@ -96,10 +95,10 @@ class Tags(commands.Cog, name = "tags", description = "Tags return specified tex
 
     @tag.command(name = "edit", description = "Edits the tag content. Should be tag owner to do so")
     async def t_edit(self, ctx: commands.Context, name: str, *, new_content: str):
-        conn: Connection = self.bot.pool
+        db: Database = self.bot.db
         name = name.strip().lower()
 
-        record = await conn.fetchrow("SELECT * FROM tags WHERE tag_name = $1 and guild_id = $2", name, ctx.guild.id)
+        record = await db.fetchrow('tag_get', name, ctx.guild.id)
 
         if record is None:
             return await ctx.send("Tag with this name does not exist", ephemeral = True, delete_after = 5)
@@ -109,22 +108,22 @@ class Tags(commands.Cog, name = "tags", description = "Tags return specified tex
 
         content = discord.utils.escape_mentions(new_content)
 
-        await conn.execute("UPDATE tags SET body = $1 WHERE id = $2", content, record['id'])
+        await db.execute('tag_set_body', content, record['id'])
 
         await ctx.send("Tag has been edited")
 
     @tag.command(name = "alias", descriptiom = "Creates an alias for an existing tag. 10 aliases maximum per tag.")
     async def t_alias(self, ctx: commands.Context, name: str, *, alias: str):
         
-        conn: Connection = self.bot.pool
+        db: Database = self.bot.db
         name = name.strip().lower()
         alias = alias.strip().lower()
 
         if len(alias) > 255:
             return await ctx.send("Tag alias is too long. Keep it under 255 characters", ephemeral = True, delete_after = 5)
 
-        record = await conn.fetchrow("SELECT * FROM tags WHERE tag_name = $1 and guild_id = $2", name, ctx.guild.id)
-        server_aliases = await conn.fetch("SELECT tag_name, aliases FROM tags WHERE guild_id = $1", ctx.guild.id)
+        record = await db.fetchrow('tag_get', name, ctx.guild.id)
+        server_aliases = await db.fetch('tags_names', ctx.guild.id)
         
         if record is None:
             return await ctx.send("Tag with this name does not exist", ephemeral = True, delete_after = 5)
@@ -140,14 +139,13 @@ class Tags(commands.Cog, name = "tags", description = "Tags return specified tex
 
         aliases.append(alias)
 
-        await conn.execute("UPDATE tags SET aliases = $1 WHERE id = $2", aliases, record['id'])
+        await db.execute('tag_set_aliases', aliases, record['id'])
 
         await ctx.send("Tag has been aliased")
 
     @tag.command(name = "view", description = "View a tag's content, either with its name or alias")
     async def t_view(self, ctx: commands.Context, *, name: str):
-        tag = await self.bot.pool.fetchval("SELECT body FROM tags WHERE guild_id = $1 AND (tag_name = $2 or $2 = ANY(aliases))",
-        ctx.guild.id, name.strip().lower())
+        tag = await self.bot.db.fetchval('tag_lookup_body', ctx.guild.id, name.strip().lower())
 
         if tag is None:
             return await ctx.send("Tag does not exist.", ephemeral = True, delete_after = 5)
@@ -157,44 +155,35 @@ class Tags(commands.Cog, name = "tags", description = "Tags return specified tex
     @tag.command(name = "claim", description = "Claim a tag, if the owner has left the server")
     async def t_claim(self, ctx: commands.Context, *, name: str):
 
-        tag = await self.bot.pool.fetchrow("SELECT * FROM tags WHERE guild_id = $1 AND (tag_name = $2 or $2 = ANY(aliases))",
-        ctx.guild.id, name.strip().lower())
+        tag = await self.bot.db.fetchrow('tag_lookup', ctx.guild.id, name.strip().lower())
 
         if tag is None:
             return await ctx.send("Tag does not exist.", ephemeral = True, delete_after = 5)
 
-        try:
-            await ctx.guild.fetch_member(tag['created_by'])
-        except discord.errors.NotFound:
-            pass
-        else:
+        if await self.bot.resolver.member(ctx.guild, tag['created_by']) is not None:
             return await ctx.send("Member is in server", ephemeral = True, delete_after = 5)
 
-        await self.bot.pool.execute("UPDATE tags SET created_by = $1 WHERE id = $2", ctx.author.id, tag['id'])
+        await self.bot.db.execute('tag_set_owner', ctx.author.id, tag['id'])
 
         await ctx.send("Tag has been claimed")
 
     @tag.command(name = "info", description = "Get info for a tag")
     async def t_info(self, ctx: commands.Context, *, name: str):
         
-        tag = await self.bot.pool.fetchrow("SELECT * FROM tags WHERE guild_id = $1 AND (tag_name = $2 or $2 = ANY(aliases))",
-        ctx.guild.id, name.strip().lower())
+        tag = await self.bot.db.fetchrow('tag_lookup', ctx.guild.id, name.strip().lower())
 
         if tag is None:
             return await ctx.send("Tag with this name/alias does not exist", ephemeral = True, delete_after = 5)
         
-        try:
-            author = await self.bot.fetch_user(tag['created_by'])
+        author = await self.bot.resolver.user(tag['created_by'])
+
+        if author is not None:
             mention_author = author.mention
-        except discord.errors.NotFound:
+        else:
             author = tag['created_by']
             mention_author = author
         
-        try:
-            await ctx.guild.fetch_member(tag['created_by'])
-            still = True
-        except discord.errors.NotFound:
-            still = False
+        still = await self.bot.resolver.member(ctx.guild, tag['created_by']) is not None
 
         em = discord.Embed(color = discord.Color.from_str("#ddb857"), title = tag['tag_name'],
         description = f"""**Created by**: {mention_author} (`{author}` is {'still' if still else 'not'} in server)
@@ -209,8 +198,7 @@ class Tags(commands.Cog, name = "tags", description = "Tags return specified tex
 
     @tag.command(name = "transfer", description = "Transfers a tag to another user. Need to be administrator or tag owner.")
     async def t_transfer(self, ctx: commands.Context, member: discord.Member, *, name: str):
-        tag = await self.bot.pool.fetchrow("SELECT * FROM tags WHERE guild_id = $1 AND (tag_name = $2 or $2 = ANY(aliases))",
-        ctx.guild.id, name.strip().lower())
+        tag = await self.bot.db.fetchrow('tag_lookup', ctx.guild.id, name.strip().lower())
 
         if tag is None:
             return await ctx.send("Tag with this name/alias does not exist", ephemeral = True, delete_after = 5)
@@ -220,7 +208,7 @@ class Tags(commands.Cog, name = "tags", description = "Tags return specified tex
         else:
             return await ctx.send("You need to be tag owner or administrator to transfer this tag.", ephemeral = True, delete_after = 5)
 
-        await self.bot.pool.execute("UPDATE tags SET created_by = $1 WHERE id = $2", member.id, tag['id'])
+        await self.bot.db.execute('tag_set_owner', member.id, tag['id'])
 
         await ctx.send(f"Tag has been transferred to `{member}`")
 
@@ -232,7 +220,7 @@ class PUtility(commands.Cog, name = "public utility"):
         if ctx.channel.type == discord.ChannelType.private:
             return False
 
-        b_c = await self.bot.pool.fetchval("SELECT blacklisted_channels FROM guild_table WHERE guild_id = $1", ctx.guild.id)
+        b_c = self.bot.guild_cache.get_value(ctx.guild.id, 'blacklisted_channels')
 
         if b_c is not None and ctx.channel.id in b_c:
             return False
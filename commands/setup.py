@@ -1,11 +1,15 @@
 import discord
 from discord.ext import commands
 from discord.ext.commands.cooldowns import BucketType
-from typing import Optional
+from typing import Optional, Literal
 from helper.setup_views import AdditionalMessage, VerificationView, WarnView
 from helper.other import time_unparser
+from helper.raid import MAX_JOINS
+from helper.export import export
 
 EMBED_COLOR = discord.Color.from_str("#9fca77")
+# DMs get the upload limit of a server without boosts
+DM_FILESIZE_LIMIT = 8 * 1024 * 1024
 
 class Setup(commands.Cog, name = "setup"):
     def __init__(self, bot: commands.Bot) -> None:
@@ -19,7 +23,7 @@ class Setup(commands.Cog, name = "setup"):
         if ctx.author.guild_permissions.administrator:
             return True
         elif ctx.command.name == "prefix" and len(ctx.args) == 0:
-            prefix = await self.bot.pool.fetchval("SELECT prefix FROM guild_table WHERE guild_id = $1", ctx.guild.id)
+            prefix = self.bot.guild_cache.get_value(ctx.guild.id, 'prefix')
             return await ctx.send(f"Prefix for this server is **`{prefix if prefix is not None else '-'}`**", delete_after = 10)
         else:
             await ctx.send("You do not have permissions to run this command.", ephemeral = True, delete_after = 5)
@@ -29,26 +33,24 @@ class Setup(commands.Cog, name = "setup"):
     @commands.command(description = "Get or set the prefix")
     async def prefix(self, ctx: commands.Context, *, prefix: Optional[str]):
         if prefix is None:
-
-            try:
-                prefix = await self.bot.pool.fetchval("SELECT prefix FROM guild_table WHERE guild_id = $1", ctx.guild.id)
-            except:
-                prefix = None
+            prefix = self.bot.guild_cache.get_value(ctx.guild.id, 'prefix')
         
             return await ctx.send(f"Prefix for this server is **`{prefix if prefix is not None else '-'}`**", delete_after = 10)
         
         if len(prefix) > 20:
             return await ctx.send("Prefix is too long. Keep it under 20 characters.", delete_after = 5)
         
-        await self.bot.pool.execute("UPDATE guild_table SET prefix = $1 WHERE guild_id = $2", prefix, ctx.guild.id)
+        await self.bot.db.execute('guild_set_prefix', prefix, ctx.guild.id)
+        await self.bot.guild_cache.refresh(ctx.guild.id)
 
         await ctx.send(f"New prefix for the bot is: `{prefix}`")
 
     @commands.cooldown(rate = 1, per = 10, type = BucketType.member)
     @commands.hybrid_command(description = "Blacklist/whitelist channels from using commands.")
     async def blacklist(self, ctx: commands.Context, channels: commands.Greedy[discord.TextChannel] = None):
-        b_c = await self.bot.pool.fetchval("SELECT blacklisted_channels FROM guild_table WHERE guild_id = $1", ctx.guild.id)
-        b_c = b_c if b_c is not None else []
+        # copied, so the cached record is not changed before the update goes through
+        b_c = self.bot.guild_cache.get_value(ctx.guild.id, 'blacklisted_channels')
+        b_c = list(b_c) if b_c is not None else []
 
         if channels is not None:
             for channel in channels:
@@ -59,7 +61,8 @@ class Setup(commands.Cog, name = "setup"):
                 else:
                     b_c.append(channel.id)
             
-            await self.bot.pool.execute("UPDATE guild_table SET blacklisted_channels = $1 WHERE guild_id = $2", b_c, ctx.guild.id)
+            await self.bot.db.execute('guild_set_blacklist', b_c, ctx.guild.id)
+            await self.bot.guild_cache.refresh(ctx.guild.id)
 
         desc_list = [ctx.guild.get_channel(c).mention for c in b_c] if len(b_c) > 0 else ['None']
         em = discord.Embed(color = EMBED_COLOR, title = "Blacklisted channels", description = '\n'.join(desc_list))
@@ -75,22 +78,23 @@ class Setup(commands.Cog, name = "setup"):
     @set.command(description = "Set the additional DM message sent to the user during moderator actions", aliases = ['dm', 'dms'])
     async def message(self, ctx: commands.Context):
         
-        add_msg = await self.bot.pool.fetchval("SELECT offence_message FROM guild_table WHERE guild_id = $1", ctx.guild.id)
+        add_msg = self.bot.guild_cache.get_value(ctx.guild.id, 'offence_message')
         
         em = discord.Embed(color = EMBED_COLOR, title = "Additional message:", description = add_msg if add_msg is not None else 'None has been set')
         em.set_footer(text = "Set the additional DM message sent to the user during moderator actions (such as appeal server/form link)")
         
-        view = AdditionalMessage(ctx.author, self.bot.pool)
+        view = AdditionalMessage(ctx.author, self.bot)
         view.msg = await ctx.send(embed = em, view = view)
 
     @commands.cooldown(rate = 1, per = 5, type = BucketType.member)
     @set.command(description = "Setup verification for the server.", aliases = ['verify'])
     async def verification(self, ctx: commands.Context):
-        join_stats = await self.bot.pool.fetchrow("SELECT * FROM join_stats WHERE guild_id = $1", ctx.guild.id)
+        join_stats = self.bot.join_cache.get(ctx.guild.id)
 
         if join_stats is None:
-            await self.bot.pool.execute("INSERT INTO join_stats (guild_id) VALUES ($1)", ctx.guild.id)
-            join_stats = await self.bot.pool.fetchrow("SELECT * FROM join_stats WHERE guild_id = $1", ctx.guild.id)
+            await self.bot.db.execute('join_stats_insert', ctx.guild.id)
+            await self.bot.join_cache.refresh(ctx.guild.id)
+            join_stats = self.bot.join_cache.get(ctx.guild.id)
 
         try:
             channel = await ctx.guild.fetch_channel(join_stats['verify_channel'])
@@ -117,7 +121,7 @@ optionally add another role (use `/joinrole` for that)")
         else:
             cancel_button_disabled = False
 
-        view = VerificationView(ctx.author, self.bot.pool, cancel_button_disabled)
+        view = VerificationView(ctx.author, self.bot, cancel_button_disabled)
         view.msg = await ctx.send(embed = em, view = view)
 
     @commands.cooldown(rate = 1, per = 5, type = BucketType.member)
@@ -133,27 +137,29 @@ optionally add another role (use `/joinrole` for that)")
         if disable is None:
             disable = False
         
-        join_stats = await self.bot.pool.fetchrow("SELECT * FROM join_stats WHERE guild_id = $1", ctx.guild.id)
-
-        if join_stats is None:
-            await self.bot.pool.execute("INSERT INTO join_stats (guild_id) VALUES ($1)", ctx.guild.id)
+        if self.bot.join_cache.get(ctx.guild.id) is None:
+            await self.bot.db.execute('join_stats_insert', ctx.guild.id)
+            await self.bot.join_cache.refresh(ctx.guild.id)
 
         if disable:
-            await self.bot.pool.execute("UPDATE join_stats SET join_role_u = NULL, join_role_b = NULL where guild_id = $1", ctx.guild.id)
+            await self.bot.db.execute('join_stats_clear_joinroles', ctx.guild.id)
+            await self.bot.join_cache.refresh(ctx.guild.id)
 
         if user_role is not None and not disable:
             if user_role.guild == ctx.guild and user_role < ctx.guild.me.roles[-1]:
-                await self.bot.pool.execute("UPDATE join_stats SET join_role_u = $1 WHERE guild_id = $2", user_role.id, ctx.guild.id)
+                await self.bot.db.execute('join_stats_set_user_role', user_role.id, ctx.guild.id)
+                await self.bot.join_cache.refresh(ctx.guild.id)
             else:
                 return await ctx.send("User role is inaccessible. Make sure it is below my top role.", ephemeral = True, delete_after = 5)
 
         if bot_role is not None and not disable:
             if bot_role.guild == ctx.guild and bot_role < ctx.guild.me.roles[-1]:
-                await self.bot.pool.execute("UPDATE join_stats SET join_role_b = $1 WHERE guild_id = $2", bot_role.id, ctx.guild.id)
+                await self.bot.db.execute('join_stats_set_bot_role', bot_role.id, ctx.guild.id)
+                await self.bot.join_cache.refresh(ctx.guild.id)
             else:
                 return await ctx.send("Bot role is inaccessible. Make sure it is below my top role.", ephemeral = True, delete_after = 5)
                 
-        join_stats = await self.bot.pool.fetchrow("SELECT * FROM join_stats WHERE guild_id = $1", ctx.guild.id)
+        join_stats = self.bot.join_cache.get(ctx.guild.id)
 
         if join_stats['join_role_u'] is None and join_stats['join_role_b'] is None:
             status = "Disabled"
@@ -167,20 +173,168 @@ optionally add another role (use `/joinrole` for that)")
 
         await ctx.send(embed = em)
 
+    @commands.cooldown(rate = 1, per = 5, type = BucketType.member)
+    @set.command(description = "Setup raid detection: a raid is this many joins within this many seconds", aliases = ['raids', 'antiraid'])
+    @discord.app_commands.describe(
+        joins = "Number of joins (2-50)",
+        seconds = "Within this many seconds (1-600)",
+        account_age = "Only count accounts younger than this many days. 0 counts every join",
+        action = "alert only; verify: send raid joiners to verification; lockdown: pause invites and messages",
+        channel = "Channel to send raid alerts to",
+        disable = "Set to true to turn raid detection off"
+    )
+    async def raid(self, ctx: commands.Context, joins: Optional[int], seconds: Optional[int], account_age: Optional[int],
+    action: Optional[Literal['alert', 'verify', 'lockdown']], channel: Optional[discord.TextChannel], disable: Optional[bool]):
+        if disable:
+            await self.bot.db.execute('raid_settings_delete', ctx.guild.id)
+            await self.bot.raid_cache.refresh(ctx.guild.id)
+            self.bot.raid_detector.end(ctx.guild.id)
+
+            return await ctx.send(embed = discord.Embed(color = EMBED_COLOR, title = "Disabled: Raid detection"))
+
+        settings = self.bot.raid_cache.get(ctx.guild.id)
+
+        joins = joins if joins is not None else (settings['joins'] if settings is not None else 10)
+        seconds = seconds if seconds is not None else (settings['seconds'] if settings is not None else 10)
+        action = action if action is not None else (settings['action'] if settings is not None else 'alert')
+        alert_channel = channel.id if channel is not None else (settings['alert_channel'] if settings is not None else None)
+
+        if account_age is None:
+            account_age = settings['account_age'] if settings is not None else None
+        elif account_age <= 0:
+            account_age = None
+
+        if not 2 <= joins <= MAX_JOINS or not 1 <= seconds <= 600:
+            return await ctx.send(f"Joins should be between 2 and {MAX_JOINS}, and seconds between 1 and 600.", ephemeral = True, delete_after = 5)
+
+        if action == 'verify' and self.bot.join_cache.get_value(ctx.guild.id, 'verify_role') is None:
+            return await ctx.send("Setup verification first, with `/set verification`.", ephemeral = True, delete_after = 5)
+
+        await self.bot.db.execute('raid_settings_set', ctx.guild.id, joins, seconds, account_age, action, alert_channel)
+        await self.bot.raid_cache.refresh(ctx.guild.id)
+
+        em = discord.Embed(color = EMBED_COLOR, title = "Enabled: Raid detection",
+        description = f"**Raid:** {joins} joins within {seconds} seconds\n" +
+        f"**Counted accounts:** {f'younger than {account_age} days' if account_age is not None else 'all'}\n" +
+        f"**Action:** {action}\n**Alert channel:** {f'<#{alert_channel}>' if alert_channel is not None else 'None'}")
+
+        await ctx.send(embed = em)
+
+    @commands.cooldown(rate = 1, per = 5, type = BucketType.member)
+    @set.command(description = "Setup warn point decay: points expire after a number of days, and/or decay monthly", aliases = ['expiry'])
+    @discord.app_commands.describe(
+        expire_days = "Warns older than this many days stop counting. 0 turns expiry off",
+        monthly_points = "Points taken off every 30 days. 0 turns monthly decay off",
+        disable = "Set to true to turn decay off. Points that already decayed stay decayed"
+    )
+    async def decay(self, ctx: commands.Context, expire_days: Optional[int], monthly_points: Optional[int], disable: Optional[bool]):
+        if disable:
+            await self.bot.db.execute('warn_decay_delete', ctx.guild.id)
+            return await ctx.send(embed = discord.Embed(color = EMBED_COLOR, title = "Disabled: Warn decay"))
+
+        settings = await self.bot.db.fetchrow('warn_decay_get', ctx.guild.id)
+
+        if expire_days is None:
+            expire_days = settings['expire_days'] if settings is not None else None
+        elif expire_days <= 0:
+            expire_days = None
+
+        if monthly_points is None:
+            monthly_points = settings['monthly_points'] if settings is not None else None
+        elif monthly_points <= 0:
+            monthly_points = None
+
+        if (expire_days is not None and expire_days > 3650) or (monthly_points is not None and monthly_points > 999):
+            return await ctx.send("Expiry should be at most 3650 days, and monthly decay at most 999 points.", ephemeral = True, delete_after = 5)
+
+        if expire_days is None and monthly_points is None:
+            await self.bot.db.execute('warn_decay_delete', ctx.guild.id)
+            return await ctx.send(embed = discord.Embed(color = EMBED_COLOR, title = "Disabled: Warn decay"))
+
+        # the first month counts from now, not from before decay was turned on
+        if monthly_points is not None and (settings is None or settings['monthly_points'] is None):
+            await self.bot.db.execute('warn_balances_restart_decay', ctx.guild.id, discord.utils.utcnow())
+
+        await self.bot.db.execute('warn_decay_set', ctx.guild.id, expire_days, monthly_points)
+
+        em = discord.Embed(color = EMBED_COLOR, title = "Enabled: Warn decay",
+        description = f"**Warns expire after:** {f'{expire_days} days' if expire_days is not None else 'Never'}\n" +
+        f"**Monthly decay:** {f'{monthly_points} points every 30 days' if monthly_points is not None else 'None'}")
+        em.set_footer(text = "Decay is applied every hour")
+
+        await ctx.send(embed = em)
+
+    @commands.cooldown(rate = 1, per = 5, type = BucketType.member)
+    @set.command(description = "Set the channel that gets a copy of every moderator action", aliases = ['modlogs', 'logs'])
+    @discord.app_commands.describe(channel = "The mod-log channel. Leave empty to turn the mod-log off")
+    async def modlog(self, ctx: commands.Context, channel: Optional[discord.TextChannel]):
+        await self.bot.db.execute('guild_set_modlog', channel.id if channel is not None else None, ctx.guild.id)
+        await self.bot.guild_cache.refresh(ctx.guild.id)
+
+        if channel is None:
+            return await ctx.send(embed = discord.Embed(color = EMBED_COLOR, title = "Disabled: Mod-log"))
+
+        em = discord.Embed(color = EMBED_COLOR, title = "Enabled: Mod-log", description = f"**Channel:** {channel.mention}")
+        em.set_footer(text = "Actions are sent in batches, a few seconds after they happen")
+
+        await ctx.send(embed = em)
+
+    @commands.cooldown(rate = 1, per = 5, type = BucketType.member)
+    @commands.hybrid_command(description = "Ends a detected raid, lifting the lockdown if there is one", aliases = ['unlockdown'])
+    async def endraid(self, ctx: commands.Context):
+        self.bot.raid_detector.end(ctx.guild.id)
+        unlocked = await self.bot.raid_detector.unlock(ctx.guild)
+
+        await ctx.send("Raid ended. " + ("Lockdown has been lifted." if unlocked else "There was no lockdown to lift."))
+
+    # not `modlogs export`: `modlogs` is already an alias of `offences`, which a group of that name would take over
+    @commands.cooldown(rate = 1, per = 300, type = BucketType.guild)
+    @commands.hybrid_command(name = "export", description = "Export the server's full warn or offence history as gzipped files")
+    async def export_history(self, ctx: commands.Context, table: Literal['warns', 'offences'], file_type: Literal['csv', 'jsonl'] = 'csv'):
+        # prefix commands cannot reply ephemerally, so the history goes to the author's DMs instead of the channel
+        async def send(**kwargs):
+            if ctx.interaction is None:
+                return await ctx.author.send(**kwargs)
+            return await ctx.send(ephemeral = True, **kwargs)
+
+        if ctx.interaction is None:
+            try:
+                await send(content = f"Exporting the {table} of **{ctx.guild.name}**...")
+            except discord.HTTPException:
+                return await ctx.send("I could not DM you. Allow DMs from this server, or use `/export`.", delete_after = 10)
+
+            await ctx.send("The export will be sent to your DMs.", delete_after = 10)
+            limit = DM_FILESIZE_LIMIT
+        else:
+            await ctx.defer(ephemeral = True)
+            limit = ctx.guild.filesize_limit
+
+        rows, chunks = await export(self.bot.db, ctx.guild, table, file_type, limit)
+
+        try:
+            files = chunks.finish()
+            await send(content = f"Exported **{rows}** {table} in {len(files)} file{'s' if len(files) > 1 else ''}.")
+
+            # the upload limit is per message, so each part goes in its own
+            for filename, file in files:
+                await send(file = discord.File(file, filename = filename))
+        finally:
+            chunks.close()
+
     @commands.cooldown(rate = 1, per = 5, type = BucketType.member)
     @set.command(name = "warning", description = "Setup the warning system.", aliases = ['warnings'])
     async def s_warning(self, ctx: commands.Context):
         '''
         Set up warning thresholds and autocompletes
         '''
-        conn = self.bot.pool
+        db = self.bot.db
         
         # EMBED DEFINITION
         em = discord.Embed(color = EMBED_COLOR, title = "Warnings")
 
         # SETTING UP FIELD 0, THRESHOLDS
         async def field_0():
-            info = await conn.fetch("SELECT * FROM autopunishments WHERE guild_id=$1 ORDER BY points ASC", ctx.guild.id)
+            info = await db.fetch('thresholds_by_guild', ctx.guild.id)
             info_dict = {"kick": "Kick", "mute": "Timeout ", "ban": "Permanent ban", "bant": "Ban "}
             threshold_value = [] # list of thresholds, unparsed
 
@@ -202,7 +356,7 @@ optionally add another role (use `/joinrole` for that)")
 
         # SETTING UP FIELD 1, AUTOCOMPLETES
         async def field_1(max_points_rec):
-            autocomplete_info = await conn.fetch("SELECT * FROM autocompletes WHERE guild_id=$1", ctx.guild.id)
+            autocomplete_info = await db.fetch('autocompletes_by_guild', ctx.guild.id)
             
             autocomplete_val = []
             if autocomplete_info == []:
@@ -216,7 +370,7 @@ optionally add another role (use `/joinrole` for that)")
 
             return f"{maximum}\n\n**Autocomplete**\n{autocomplete_val}"
 
-        max_points_rec = await conn.fetchrow("SELECT * FROM autopunishments WHERE guild_id=$1 AND p_type = 'ban'", ctx.guild.id)
+        max_points_rec = await db.fetchrow('threshold_ban', ctx.guild.id)
 
         em.add_field(name = "Maximum", value = await field_1(max_points_rec))
 
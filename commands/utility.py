@@ -5,11 +5,12 @@ from discord import app_commands
 from typing import Optional, Literal
 from datetime import timedelta
 from helper import poll_views
-from helper.other import Paginator, ColorParser
+from helper.other import Paginator, ChunkSource, ColorParser
 import aiohttp
 
 
 EMBED_COLOR = discord.Color.from_str("#ddb857")
+EMOTES_PER_FIELD = 7
 
 class MUtility(commands.Cog, name = "moderator utility", description = "Utility commands for moderators"):
     def __init__(self, bot: commands.Bot) -> None:
@@ -19,7 +20,7 @@ class MUtility(commands.Cog, name = "moderator utility", description = "Utility
         if ctx.channel.type == discord.ChannelType.private:
             return False
 
-        b_c = await self.bot.pool.fetchval("SELECT blacklisted_channels FROM guild_table WHERE guild_id = $1", ctx.guild.id)
+        b_c = self.bot.guild_cache.get_value(ctx.guild.id, 'blacklisted_channels')
 
         if b_c is not None and ctx.channel.id in b_c:
             return False
@@ -457,38 +458,23 @@ class MUtility(commands.Cog, name = "moderator utility", description = "Utility
     @commands.has_guild_permissions(moderate_members = True)
     @commands.hybrid_command(description = "Shows all emotes for the current server", aliases = ['emojis'])
     async def emotes(self, ctx: commands.Context):
-        em = discord.Embed(color = EMBED_COLOR, title = "All emotes for this server", description = "Click on the index for the URL")
-        em_list = [em]
-        value = ""
-        em.add_field(name = "_ _", value = "_ _", inline = False)
-        field_id = 0
-        chars = 0
-
-        for num, emote in enumerate(ctx.guild.emojis):
-            if len(value) > 900:
-                em.set_field_at(field_id, name = "_ _", value = value, inline = False)
-
-                if field_id == 24 or chars > 5600:
-                    em = discord.Embed(color = EMBED_COLOR)
-                    em_list.append(em)
-                    field_id = 0
-                    chars = 0
-                else:
-                    field_id += 1
+        async def render(page_emotes: list, page: int) -> discord.Embed:
+            if page == 1:
+                em = discord.Embed(color = EMBED_COLOR, title = "All emotes for this server", description = "Click on the index for the URL")
+            else:
+                em = discord.Embed(color = EMBED_COLOR)
+
+            # an emote is at most ~130 characters, so a field stays under 1024 and a page under 6000
+            for i in range(0, len(page_emotes), EMOTES_PER_FIELD):
+                value = ''.join(f"{emote} [`[{num}]`]({emote.url}) " for num, emote in page_emotes[i:i + EMOTES_PER_FIELD])
+                em.add_field(name = "_ _", value = value, inline = False)
 
-                value = ""
+            if not page_emotes:
                 em.add_field(name = "_ _", value = "_ _", inline = False)
 
-            value += f"{emote} [`[{num+1}]`]({emote.url}) "
-            chars += len(value)
-            
-        em.set_field_at(field_id, name = "_ _", value = value, inline = False)
-        
-        if len(em_list) == 1:
-            await ctx.send(embed = em)
-        else:
-            view = Paginator(ctx.author, em_list)
-            view.msg = await ctx.send(embed = em_list[0], view = view)
+            return em
+
+        await Paginator(ctx.author, ChunkSource(list(enumerate(ctx.guild.emojis, 1)), EMOTES_PER_FIELD * 5, render)).send(ctx)
             
     @commands.cooldown(rate = 1, per = 10, type = BucketType.member)
     @commands.has_guild_permissions(manage_nicknames = True)
@@ -632,15 +618,22 @@ Leave the message parameter empty (and don't reply to a message) to execute with
 
         em.set_footer(text = f"Created by {ctx.author}")
 
-        view = poll_views.Poll(len(option_list), self.bot.pool)
+        # the row is made first, as its ID is part of the button custom_ids
+        poll_id = await self.bot.db.fetchval('poll_insert', ctx.author.id, body_list, multi_option, [0] * len(option_list), '{}')
 
-        view.msg = await channel.send(embed = em, view = view)
+        view = poll_views.Poll(poll_id, len(option_list))
 
-        await ctx.send("Done!", ephemeral = True, delete_after = 5)
+        try:
+            msg = await channel.send(embed = em, view = view)
+        except:
+            await self.bot.db.execute('poll_delete', poll_id)
+            raise
+        finally:
+            view.stop()
+
+        await self.bot.db.execute('poll_set_message', msg.id, poll_id)
 
-        await self.bot.pool.execute(
-        "INSERT INTO poll_table (message_id, creator_id, poll_options, multi_option, option_votes, used_users) VALUES ($1,$2,$3,$4,$5,$6)",
-        view.msg.id, ctx.author.id, body_list, multi_option, [0] * len(option_list), '{}')
+        await ctx.send("Done!", ephemeral = True, delete_after = 5)
 
 
 async def setup(bot: commands.Bot):
@@ -0,0 +1,76 @@
+import asyncio
+import discord
+from discord.ext import commands
+
+"""
+Per-guild sets of banned user IDs, so checking one user does not page through the guild's whole ban list.
+A guild's set is loaded once, in the background, the first time it is needed, and kept current by the
+member ban and unban events (see main.py). Until it is loaded, checks fall back to fetching the one ban.
+"""
+
+class BanIndex:
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.guilds = {} # {guild_id: set of banned user IDs}, only for fully loaded guilds
+        self._loading = {} # {guild_id: Task}
+        self._pending = {} # {guild_id: [(user_id, banned)]}, events that arrived while the guild was loading
+
+    def contains(self, guild_id: int, user_id: int) -> bool | None:
+        """Whether the user is banned, or None if the guild is not loaded"""
+        bans = self.guilds.get(guild_id)
+        return user_id in bans if bans is not None else None
+
+    async def is_banned(self, guild: discord.Guild, user_id: int) -> bool:
+        banned = self.contains(guild.id, user_id)
+        if banned is not None:
+            return banned
+
+        self._load_later(guild)
+
+        try:
+            await guild.fetch_ban(discord.Object(user_id))
+        except discord.NotFound:
+            return False
+        return True
+
+    def update(self, guild_id: int, user_id: int, banned: bool):
+        if guild_id in self._pending:
+            self._pending[guild_id].append((user_id, banned))
+
+        bans = self.guilds.get(guild_id)
+        if bans is None:
+            return
+
+        if banned:
+            bans.add(user_id)
+        else:
+            bans.discard(user_id)
+
+    def forget(self, guild_id: int):
+        self.guilds.pop(guild_id, None)
+
+    def _load_later(self, guild: discord.Guild):
+        if guild.id in self._loading or not guild.me.guild_permissions.ban_members:
+            return
+
+        self._pending[guild.id] = []
+        task = self._loading[guild.id] = asyncio.create_task(self._load(guild))
+        task.add_done_callback(lambda _: self._loading.pop(guild.id, None))
+
+    async def _load(self, guild: discord.Guild):
+        try:
+            bans = {entry.user.id async for entry in guild.bans(limit = None)}
+        except discord.HTTPException:
+            # tried again the next time the guild is checked
+            return
+        finally:
+            pending = self._pending.pop(guild.id)
+
+        # bans and unbans that happened while the list was being paged through
+        for user_id, banned in pending:
+            if banned:
+                bans.add(user_id)
+            else:
+                bans.discard(user_id)
+
+        self.guilds[guild.id] = bans
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+"""
+Runs one Discord action per target (mass ban, kick, timeout) with bounded concurrency.
+discord.py's HTTP client already waits out each rate limit bucket; a few workers keep requests queued on the
+bucket instead of hundreds of them waiting at once, and their throughput is the bucket's rate either way.
+"""
+
+class BulkAction:
+    def __init__(self, targets: list, action, concurrency: int = 4):
+        self.targets = targets
+        self.action = action # awaited with each target; raising counts the target as failed
+        self.concurrency = concurrency
+
+        self.done = [] # targets the action succeeded for
+        self.failed = [] # [(target, exception)]
+        self.started = None
+
+    @property
+    def finished(self) -> int:
+        return len(self.done) + len(self.failed)
+
+    @property
+    def rate(self) -> float:
+        """Targets finished per second"""
+        elapsed = time.perf_counter() - self.started if self.started is not None else 0
+        return self.finished / elapsed if elapsed > 0 else 0.0
+
+    async def run(self, on_progress = None, interval: float = 2):
+        """Runs the action for every target. `on_progress(self)` is awaited every `interval` seconds while running"""
+        self.started = time.perf_counter()
+        queue = asyncio.Queue()
+        for target in self.targets:
+            queue.put_nowait(target)
+
+        workers = [asyncio.create_task(self._work(queue)) for _ in range(min(self.concurrency, len(self.targets)))]
+        progress = asyncio.create_task(self._report(on_progress, interval)) if on_progress is not None else None
+
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            if progress is not None:
+                progress.cancel()
+
+    async def _work(self, queue: asyncio.Queue):
+        while not queue.empty():
+            target = queue.get_nowait()
+
+            try:
+                await self.action(target)
+            except Exception as error:
+                self.failed.append((target, error))
+            else:
+                self.done.append(target)
+
+    async def _report(self, on_progress, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await on_progress(self)
+            except:
+                pass
@@ -0,0 +1,72 @@
+import discord
+from discord.ext import commands, tasks
+import asyncpg
+import json
+import math
+import traceback, sys
+from helper.pg_listener import PGListener
+
+"""
+Coordination between cluster processes (see launcher.py).
+Owner commands that change a single process (reload, load, unload) are broadcast over postgres NOTIFY
+so every cluster applies them, and each cluster writes a heartbeat row to cluster_status for the `clusters` command.
+"""
+
+CHANNEL = 'cluster_command'
+
+class ClusterBus:
+    def __init__(self, bot: commands.Bot, listener: PGListener):
+        self.bot = bot
+        self.listener = listener
+
+    async def start(self):
+        await self.listener.listen(CHANNEL, self._on_notification)
+
+    async def broadcast(self, command: str, **kwargs):
+        payload = json.dumps({'origin': self.bot.cluster_id, 'command': command, **kwargs})
+        await self.listener.notify(CHANNEL, payload)
+
+    async def _on_notification(self, payload: str):
+        data = json.loads(payload)
+
+        if data['origin'] == self.bot.cluster_id:
+            return
+
+        command = data['command']
+
+        try:
+            if command == 'reload':
+                await self.bot.reload_extension(data['extension'])
+            elif command == 'load':
+                await self.bot.load_extension(data['extension'])
+            elif command == 'unload':
+                await self.bot.unload_extension(data['extension'])
+        except commands.ExtensionError as error:
+            print(f'Cluster {self.bot.cluster_id} failed to {command} {data.get("extension")}:', file=sys.stderr)
+            traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+
+class ClusterStatus(commands.Cog, command_attrs = dict(hidden = True)):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.heartbeat.add_exception_type(asyncpg.PostgresConnectionError)
+        self.heartbeat.start()
+
+    def cog_unload(self):
+        self.heartbeat.cancel()
+
+    @tasks.loop(seconds = 30)
+    async def heartbeat(self):
+        # a shard's latency is inf (or nan) until its first heartbeat is acknowledged; such shards are left out
+        latencies = {str(shard_id): round(latency * 1000) for shard_id, latency in self.bot.latencies if math.isfinite(latency)}
+
+        try:
+            await self.bot.db.execute('cluster_heartbeat', self.bot.cluster_id, sorted(self.bot.shards.keys()), len(self.bot.guilds), json.dumps(latencies), discord.utils.utcnow())
+        except asyncpg.UndefinedTableError:
+            pass
+
+    @heartbeat.before_loop
+    async def before_heartbeat(self):
+        await self.bot.wait_until_ready()
+
+async def setup(bot: commands.Bot) -> None:
+    await bot.add_cog(ClusterStatus(bot))
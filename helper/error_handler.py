@@ -18,6 +18,8 @@ class CommandErrorHandler(commands.Cog, command_attrs = dict(hidden = True)):
         '''
         Outputs an error
         '''
+        # failed hybrid commands run as slash commands do not reach the after invoke hook
+        self.bot.metrics.command_finished(ctx)
 
         # This prevents any commands with local handlers being handled here in on_command_error.
         if hasattr(ctx.command, 'on_error'):
@@ -39,23 +41,30 @@ class CommandErrorHandler(commands.Cog, command_attrs = dict(hidden = True)):
         if isinstance(error, ignored):
             return
 
+        command_name = ctx.command.qualified_name if ctx.command is not None else None
+
         if isinstance(error,commands.MissingRequiredArgument):
+            self.bot.metrics.command_error(command_name, 'missing_argument')
             await ctx.send(f"You have not typed the required arguments!\nView `help {ctx.command.name}` to learn more.", delete_after = 5, ephemeral = True)
         
         elif isinstance(error,commands.BadArgument) or isinstance(error, discord.app_commands.errors.TransformerError):
+            self.bot.metrics.command_error(command_name, 'bad_argument')
             await ctx.send(f"You have not typed the arguments correctly!\nView `help {ctx.command.name}` to learn more.", delete_after = 5, ephemeral = True)
         
         elif isinstance(error,commands.CommandOnCooldown):
+            self.bot.metrics.command_error(command_name, 'cooldown')
             now = datetime.now() + timedelta(seconds=error.retry_after)
             await ctx.send(f"You can use this command again **{discord.utils.format_dt(now,'R')}**",delete_after = 5 ,ephemeral = True)
         
         elif isinstance(error, commands.MissingPermissions) or isinstance(error, commands.BotMissingPermissions):
+            self.bot.metrics.command_error(command_name, 'missing_permissions')
             await ctx.send("You do not have permissions to run this command.", ephemeral = True, delete_after = 5)
         
         elif isinstance(error,commands.CheckFailure) or isinstance(error, discord.errors.NotFound):
-            pass
+            self.bot.metrics.command_error(command_name, 'check_failure' if isinstance(error, commands.CheckFailure) else 'not_found')
 
         else:
+            self.bot.metrics.command_error(command_name, type(error).__name__)
             print('Ignoring exception in command {}:'.format(ctx.command), file=sys.stderr)
             traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
 
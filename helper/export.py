@@ -0,0 +1,135 @@
+import tempfile
+import zlib
+import discord
+
+"""
+Exports a guild's warns or offences for `export`. Rows are streamed out of Postgres with COPY ... TO STDOUT
+and gzipped as they arrive into temporary files on disk, each kept under the upload limit and split only between
+rows, so every part is a complete file of its own. Memory use does not grow with the number of rows.
+"""
+
+COLUMNS = {
+    'warns': ['id', 'user_id', 'points', 'expired', 'body', 'created_by', 'created_on'],
+    'offences': ['id', 'user_id', 'punishment', 'body', 'pardoned', 'created_by', 'created_on']
+}
+# zlib holds back some compressed output until the part is finished
+SIZE_MARGIN = 256 * 1024
+
+def export_query(table: str, file_type: str) -> str:
+    query = f"SELECT {', '.join(COLUMNS[table])} FROM {table} WHERE guild_id = $1 ORDER BY id"
+
+    if file_type == 'jsonl':
+        return f"SELECT row_to_json(t) FROM ({query}) t"
+    return query
+
+def copy_options(file_type: str) -> dict:
+    if file_type == 'jsonl':
+        # JSON has its newlines escaped and is written unquoted, one object per line
+        return {'format': 'csv', 'quote': '\x01', 'delimiter': '\x02'}
+    return {'format': 'csv'}
+
+class ChunkedExport:
+    """Receives COPY output through `write` and gzips it into parts of under `limit` bytes"""
+    def __init__(self, name: str, table: str, file_type: str, limit: int):
+        self.name = name
+        self.file_type = file_type
+        self.limit = limit - SIZE_MARGIN
+        self.header = (','.join(COLUMNS[table]) + '\n').encode() if file_type == 'csv' else b''
+
+        self.parts = [] # finished temporary files
+        self._file = None
+        self._compressor = None
+        self._partial = b'' # output after the last complete row
+
+    async def write(self, data: bytes):
+        buffer = self._partial + data
+        end = self._row_end(buffer)
+        self._partial = buffer[end:]
+
+        if end > 0:
+            self._write_rows(buffer[:end])
+
+    def finish(self) -> list:
+        """Finishes the last part. Returns the parts as [(filename, file)], rewound"""
+        if self._partial:
+            self._write_rows(self._partial)
+            self._partial = b''
+
+        if self._file is not None or not self.parts:
+            self._finish_part()
+
+        extension = 'csv' if self.file_type == 'csv' else 'jsonl'
+        files = []
+
+        for number, file in enumerate(self.parts, 1):
+            file.seek(0)
+            suffix = f'-part{number}' if len(self.parts) > 1 else ''
+            files.append((f'{self.name}{suffix}.{extension}.gz', file))
+
+        return files
+
+    def close(self):
+        for file in self.parts:
+            file.close()
+        if self._file is not None:
+            self._file.close()
+
+    def _row_end(self, buffer: bytes) -> int:
+        """Position after the last complete row in `buffer`, which starts at a row"""
+        if self.file_type != 'csv' or b'"' not in buffer:
+            return buffer.rfind(b'\n') + 1
+
+        # CSV fields can hold newlines inside quotes; a newline ends a row only after an even number of quotes
+        quoted = False
+        end = 0
+        position = 0
+
+        while True:
+            newline = buffer.find(b'\n', position)
+            if newline == -1:
+                return end
+
+            if buffer.count(b'"', position, newline) % 2 == 1:
+                quoted = not quoted
+            if not quoted:
+                end = newline + 1
+            position = newline + 1
+
+    def _write_rows(self, rows: bytes):
+        # rows are counted at their uncompressed size, so a part never goes over the limit
+        if self._file is not None and self._file.tell() + len(rows) > self.limit:
+            self._finish_part()
+
+        if self._file is None:
+            self._start_part()
+
+        self._file.write(self._compressor.compress(rows))
+
+    def _start_part(self):
+        self._file = tempfile.TemporaryFile()
+        self._compressor = zlib.compressobj(wbits = 31) # gzip
+        self._file.write(self._compressor.compress(self.header))
+
+    def _finish_part(self):
+        if self._file is None:
+            # an empty export still gets a file, with only the header
+            self._start_part()
+
+        self._file.write(self._compressor.flush())
+        self.parts.append(self._file)
+        self._file = None
+        self._compressor = None
+
+async def export(db, guild: discord.Guild, table: str, file_type: str, limit: int) -> tuple:
+    """Streams the guild's rows of `table` into gzipped parts of under `limit` bytes. Returns (number of rows, ChunkedExport)"""
+    name = f'{table}-{guild.id}-{discord.utils.utcnow():%Y%m%d}'
+    chunks = ChunkedExport(name, table, file_type, limit)
+
+    try:
+        status = await db.copy_query(f'export {table}', export_query(table, file_type), guild.id,
+        output = chunks.write, **copy_options(file_type))
+    except:
+        chunks.close()
+        raise
+
+    return int(status.split()[-1]), chunks
@@ -0,0 +1,52 @@
+import asyncpg
+from helper.pg_listener import PGListener
+from helper.queries import Database
+
+class GuildCache:
+    """
+    In-process copy of a per-guild settings table (keyed by guild_id).
+    Writers call `refresh` after updating the table, which reloads the row here and
+    notifies every other process through postgres LISTEN/NOTIFY.
+    The table needs `{table}_all` and `{table}_get` queries in helper.queries
+    """
+    def __init__(self, db: Database, listener: PGListener, table: str):
+        self.db = db
+        self.listener = listener
+        self.table = table
+        self.channel = f"{table}_changed"
+        self.records = {} # {guild_id: Record}
+
+    async def start(self):
+        await self.listener.listen(self.channel, self._on_notification)
+        self.listener.on_reconnect(self.load)
+        await self.load()
+
+    async def load(self):
+        try:
+            records = await self.db.fetch(f'{self.table}_all')
+        except asyncpg.UndefinedTableError:
+            records = []
+
+        self.records = {record['guild_id']: record for record in records}
+
+    def get(self, guild_id: int) -> asyncpg.Record | None:
+        return self.records.get(guild_id)
+
+    def get_value(self, guild_id: int, column: str):
+        record = self.records.get(guild_id)
+        return record[column] if record is not None else None
+
+    async def refresh(self, guild_id: int):
+        await self._reload(guild_id)
+        await self.listener.notify(self.channel, str(guild_id))
+
+    async def _reload(self, guild_id: int):
+        record = await self.db.fetchrow(f'{self.table}_get', guild_id)
+
+        if record is None:
+            self.records.pop(guild_id, None)
+        else:
+            self.records[guild_id] = record
+
+    async def _on_notification(self, payload: str):
+        await self._reload(int(payload))
@@ -0,0 +1,86 @@
+import asyncio
+import discord
+from helper.queries import Database
+
+"""
+Page sources for a user's warns and offences, for helper.other.Paginator.
+Rows are fetched a page at a time with keyset pagination on id (the page after the previous page's last id,
+or before the next page's first id), so no page costs more than PAGE_SIZE rows however long the history is.
+Embeds are rendered only when their page is shown, and the next page's rows are fetched in the background.
+"""
+
+# a field is up to about 1100 characters (a 900 character reason, a 100 character punishment and the rest),
+# and an embed can hold 6000 in all
+PAGE_SIZE = 5
+MAX_ID = 2**63 - 1
+
+class KeysetSource:
+    """
+    Pages of `table` rows for one user, using the `{table}_page_after` and `{table}_page_before` queries.
+    `render(rows, page)` is awaited to make a page's embed
+    """
+    def __init__(self, db: Database, table: str, guild_id: int, user_id: int, count: int, render, page_size: int = PAGE_SIZE):
+        self.db = db
+        self.table = table
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.count = count
+        self.render = render
+        self.page_size = page_size
+        self.page_count = max(1, -(-count // page_size))
+
+        self.rows = {} # {page: rows}, only around the page last shown
+        self._fetching = {} # {page: Task}
+
+    async def get_page(self, page: int) -> discord.Embed:
+        rows = await self._rows(page)
+
+        # the pages the buttons can reach next are always next to a page in self.rows
+        self.rows = {number: rows for number, rows in self.rows.items() if abs(number - page) <= 1}
+        self.prefetch(page + 1)
+
+        return await self.render(rows, page)
+
+    def prefetch(self, page: int):
+        if 1 <= page <= self.page_count and page not in self.rows and page not in self._fetching:
+            self._fetching[page] = asyncio.create_task(self._fetch(page))
+
+    async def _rows(self, page: int) -> list:
+        if page in self.rows:
+            return self.rows[page]
+
+        self.prefetch(page)
+        return await self._fetching[page]
+
+    async def _fetch(self, page: int) -> list:
+        try:
+            rows = await self._query(page)
+        finally:
+            self._fetching.pop(page, None)
+
+        self.rows[page] = rows
+        return rows
+
+    async def _query(self, page: int) -> list:
+        before = self.rows.get(page - 1)
+        after = self.rows.get(page + 1)
+
+        if page == 1:
+            return await self._after(0, self.page_size)
+        if before:
+            return await self._after(before[-1]['id'], self.page_size)
+        if after:
+            return await self._before(after[0]['id'], self.page_size)
+        if page == self.page_count:
+            return await self._before(MAX_ID, self.count - (page - 1) * self.page_size)
+
+        # not next to a known page; walk from the previous one
+        await self._rows(page - 1)
+        return await self._after(self.rows[page - 1][-1]['id'], self.page_size) if self.rows[page - 1] else []
+
+    async def _after(self, id: int, limit: int) -> list:
+        return await self.db.fetch(f'{self.table}_page_after', self.guild_id, self.user_id, id, limit)
+
+    async def _before(self, id: int, limit: int) -> list:
+        rows = await self.db.fetch(f'{self.table}_page_before', self.guild_id, self.user_id, id, limit)
+        return rows[::-1]
@@ -1,43 +1,53 @@
 import discord
+import asyncio
+from discord.ext.commands import Bot
 from random import choices
 import string
 from captcha.image import ImageCaptcha
 
 class VerifyMessageView(discord.ui.View):
-    def __init__(self, pool):
+    """
+    Component layout for the verification message. Like poll_views.Poll, stop it once sent;
+    the 'verify:here' custom_id is dispatched by helper.router
+    """
+    def __init__(self):
         super().__init__(timeout = None)
-        self.pool = pool
-    
-    async def interaction_check(self, itx: discord.Interaction, /) -> bool:
-        verify_role = await self.pool.fetchval("SELECT verify_role FROM join_stats WHERE guild_id = $1", itx.guild_id)
-        role = itx.guild.get_role(verify_role) if verify_role is not None else None
+        self.add_item(discord.ui.Button(label = 'Verify here', custom_id = 'verify:here', style = discord.ButtonStyle.green))
 
-        if role is None or role > itx.guild.me.roles[-1]:
-            await itx.response.send_message("Role for verification is inaccesible", ephemeral = True)
-            return False
-        
-        if role in itx.user.roles:
-            return True
-        
-        await itx.response.send_message(f"You need the {role.mention} role for verification.", ephemeral = True)
+async def dispatch(bot: Bot, itx: discord.Interaction, args: list):
+    if args == ['here'] and await verify_check(bot, itx):
+        await verify_here(bot, itx)
+
+async def verify_check(bot: Bot, itx: discord.Interaction) -> bool:
+    verify_role = bot.join_cache.get_value(itx.guild_id, 'verify_role')
+    role = itx.guild.get_role(verify_role) if verify_role is not None else None
+
+    if role is None or role > itx.guild.me.roles[-1]:
+        await itx.response.send_message("Role for verification is inaccesible", ephemeral = True)
         return False
+    
+    if role in itx.user.roles:
+        return True
+    
+    await itx.response.send_message(f"You need the {role.mention} role for verification.", ephemeral = True)
+    return False
 
-    @discord.ui.button(label = 'Verify here', custom_id = 'verify_here', style = discord.ButtonStyle.green)
-    async def verify_here(self, itx: discord.Interaction, button: discord.ui.Button):
-        role_ids = await self.pool.fetchrow("SELECT verify_role, join_role_u FROM join_stats WHERE guild_id = $1", itx.guild_id)
-        vrole = itx.guild.get_role(role_ids['verify_role'])
-        jrole = itx.guild.get_role(role_ids['join_role_u']) if role_ids['join_role_u'] is not None else None
+async def verify_here(bot: Bot, itx: discord.Interaction):
+    role_ids = bot.join_cache.get(itx.guild_id)
+    vrole = itx.guild.get_role(role_ids['verify_role'])
+    jrole = itx.guild.get_role(role_ids['join_role_u']) if role_ids['join_role_u'] is not None else None
 
-        code = ''.join(choices(string.ascii_uppercase + string.digits, k = 5))
-        image = ImageCaptcha()
+    code = ''.join(choices(string.ascii_uppercase + string.digits, k = 5))
+    image = ImageCaptcha()
 
-        image_bytes = image.generate(code)
+    # drawing the image takes long enough to hold up the event loop
+    image_bytes = await asyncio.to_thread(image.generate, code)
 
-        view = VerifyModalView(vrole = vrole, jrole = jrole, code = code)
-        await itx.response.send_message("**Enter the code given in the image below**", 
-        file = discord.File(image_bytes, "v_code.png"), ephemeral = True, view = view)
+    view = VerifyModalView(vrole = vrole, jrole = jrole, code = code)
+    await itx.response.send_message("**Enter the code given in the image below**", 
+    file = discord.File(image_bytes, "v_code.png"), ephemeral = True, view = view)
 
-        view.msg = await itx.original_response()
+    view.msg = await itx.original_response()
 
 class VerifyModalView(discord.ui.View):
     def __init__(self, *, vrole, jrole, code):
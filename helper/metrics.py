@@ -0,0 +1,222 @@
+import discord
+from discord import app_commands
+from discord.ext import commands
+from aiohttp import web
+from bisect import bisect_left
+from os import getenv
+import time
+
+"""
+Command, event and database timings in the Prometheus text format.
+Recording is always on (it is a few dict updates per command/event); the HTTP endpoint only runs
+when METRICS_PORT is set, and listens on METRICS_HOST (127.0.0.1 by default) at /metrics.
+Each cluster (see launcher.py) listens on METRICS_PORT + its cluster ID.
+"""
+
+PREFIX = 'arellis'
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Counter:
+    def __init__(self, name: str, description: str, labels: tuple = ()):
+        self.name = f'{PREFIX}_{name}'
+        self.description = description
+        self.labels = labels
+        self.values = {} # {label values: count}
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        lines += [f'{self.name}{_labels(self.labels, values)} {count}' for values, count in self.values.items()]
+        return lines
+
+class Collected:
+    """
+    Read from `read` (returning {label values: value}) whenever the metrics are scraped,
+    for values kept elsewhere. `kind` is the Prometheus type, gauge or counter
+    """
+    def __init__(self, name: str, description: str, read, labels: tuple = (), kind: str = 'gauge'):
+        self.name = f'{PREFIX}_{name}'
+        self.description = description
+        self.read = read
+        self.labels = labels
+        self.kind = kind
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}']
+        lines += [f'{self.name}{_labels(self.labels, values)} {value}' for values, value in self.read().items()]
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, description: str, labels: tuple = (), buckets: tuple = BUCKETS):
+        self.name = f'{PREFIX}_{name}'
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {} # {label values: [count per bucket (last is +Inf), sum]}
+
+    def observe(self, value: float, *label_values):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+
+        for values, series in self.values.items():
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                total += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labels, values, le)} {total}')
+
+            lines.append(f'{self.name}_sum{_labels(self.labels, values)} {series[-1]}')
+            lines.append(f'{self.name}_count{_labels(self.labels, values)} {total}')
+
+        return lines
+
+class Metrics:
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+        self.commands = Histogram('command_duration_seconds', "Time to run a command, from after its checks pass", ('command', 'kind', 'status'))
+        self.command_errors = Counter('command_errors_total', "Command errors, by the error handler's classification", ('command', 'error'))
+        self.events = Histogram('event_duration_seconds', "Time spent in each event listener", ('event', 'listener'))
+        self.pool_wait = Histogram('pool_acquire_wait_seconds', "Time waited for a database connection from the pool")
+        self.loop_lag = Histogram('event_loop_lag_seconds', "How late the event loop watchdog's heartbeat ran")
+
+        self.metrics = [
+            self.commands, self.command_errors, self.events, self.pool_wait, self.loop_lag,
+            Collected('pool_connections', "Database pool connections", self._pool_sizes, ('state',)),
+            Collected('db_queries_total', "Calls of each named query", lambda: self._query_stats('calls'), ('query',), 'counter'),
+            Collected('db_query_errors_total', "Failed calls of each named query", lambda: self._query_stats('errors'), ('query',), 'counter'),
+            Collected('guilds', "Guilds on this cluster", lambda: {(): len(self.bot.guilds)}),
+        ]
+
+    # TEXT AND HYBRID COMMANDS
+
+    async def before_invoke(self, ctx: commands.Context):
+        ctx.metrics_start = time.perf_counter()
+
+    async def after_invoke(self, ctx: commands.Context):
+        self.command_finished(ctx)
+
+    def command_finished(self, ctx: commands.Context):
+        """
+        Records the command once; also called by the error handler,
+        since hybrid commands run as slash commands skip the after invoke hook when they fail
+        """
+        start = getattr(ctx, 'metrics_start', None)
+        if start is None or ctx.command is None:
+            return
+
+        ctx.metrics_start = None
+        kind = 'slash' if ctx.interaction is not None else 'text'
+        self.commands.observe(time.perf_counter() - start, ctx.command.qualified_name, kind, 'error' if ctx.command_failed else 'ok')
+
+    def command_error(self, command_name: str | None, error: str):
+        self.command_errors.inc(command_name or 'none', error)
+
+    # APP COMMANDS (see MetricsTree)
+
+    def app_command_finished(self, itx: discord.Interaction, command, failed: bool):
+        start = itx.extras.pop('metrics_start', None)
+        if start is None:
+            return
+
+        name = command.qualified_name if command is not None else 'unknown'
+        self.commands.observe(time.perf_counter() - start, name, 'app', 'error' if failed else 'ok')
+
+    # EVENTS, EVENT LOOP AND DATABASE
+
+    def event_finished(self, event_name: str, coro, duration: float):
+        self.events.observe(duration, event_name, getattr(coro, '__qualname__', event_name))
+
+    def pool_acquired(self, waited: float):
+        self.pool_wait.observe(waited)
+
+    def loop_lagged(self, lag: float):
+        self.loop_lag.observe(lag)
+
+    def _pool_sizes(self) -> dict:
+        pool = getattr(self.bot, 'pool', None)
+        if pool is None:
+            return {}
+
+        size = pool.get_size()
+        idle = pool.get_idle_size()
+        return {('in_use',): size - idle, ('idle',): idle, ('max',): pool.get_max_size()}
+
+    def _query_stats(self, field: str) -> dict:
+        db = getattr(self.bot, 'db', None)
+        if db is None:
+            return {}
+
+        return {(name,): getattr(stats, field) for name, stats in db.stats.items() if stats.calls}
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+class MetricsTree(app_commands.CommandTree):
+    """
+    Times app commands from when the tree accepts the interaction.
+    Hybrid commands are left to the before/after invoke hooks, which see them as commands
+    """
+    async def interaction_check(self, itx: discord.Interaction, /) -> bool:
+        itx.extras['metrics_start'] = time.perf_counter()
+        return True
+
+    async def on_error(self, itx: discord.Interaction, error: app_commands.AppCommandError, /) -> None:
+        if not isinstance(itx.command, commands.hybrid.HybridAppCommand):
+            self.client.metrics.app_command_finished(itx, itx.command, True)
+            self.client.metrics.command_error(getattr(itx.command, 'qualified_name', None), type(error).__name__)
+
+        await super().on_error(itx, error)
+
+class MetricsServer(commands.Cog, command_attrs = dict(hidden = True)):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.runner = None
+
+    async def cog_load(self):
+        port = getenv("METRICS_PORT")
+        if port is None:
+            return
+
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+
+        self.runner = web.AppRunner(app, access_log = None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, getenv("METRICS_HOST", "127.0.0.1"), int(port) + self.bot.cluster_id).start()
+
+    async def cog_unload(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(text = self.bot.metrics.render(), headers = {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    @commands.Cog.listener()
+    async def on_app_command_completion(self, itx: discord.Interaction, command):
+        if not isinstance(command, commands.hybrid.HybridAppCommand):
+            self.bot.metrics.app_command_finished(itx, command, False)
+
+async def setup(bot: commands.Bot) -> None:
+    await bot.add_cog(MetricsServer(bot))
@@ -0,0 +1,838 @@
+import asyncpg
+import json
+from datetime import datetime, timezone
+from helper.queries import QUERIES
+
+"""
+Versioned schema migrations, applied in order at startup (and by dbsetup).
+Applied versions are recorded in schema_version. Migrations are never edited once released; add a new one instead.
+"""
+
+# taken while migrating, so clusters starting together do not apply the same migration twice
+LOCK_ID = 4_716_118
+
+MIGRATIONS = [
+    (1, "baseline tables", """
+        CREATE TABLE IF NOT EXISTS guild_table (
+            guild_id BIGINT primary key,
+            blacklisted_channels BIGINT [] DEFAULT '{}',
+            offence_message TEXT,
+            prefix varchar (20)
+        );
+
+        CREATE TABLE IF NOT EXISTS autopunishments (
+            id bigserial primary key,
+            guild_id BIGINT,
+            points INT NOT NULL,
+            p_type varchar (10) NOT NULL,
+            timer INTERVAL
+        );
+
+        CREATE TABLE IF NOT EXISTS autocompletes(
+            id bigserial primary key,
+            guild_id BIGINT,
+            points INT,
+            reason TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS join_stats (
+            guild_id BIGINT PRIMARY KEY,
+            verify_role BIGINT,
+            verify_channel BIGINT,
+            verify_message BIGINT,
+            join_role_u BIGINT,
+            join_role_b BIGINT
+        );
+
+        CREATE TABLE IF NOT EXISTS poll_table (
+            id bigserial PRIMARY KEY,
+            message_id BIGINT,
+            creator_id bigint not null,
+            poll_options TEXT [] NOT NULL,
+            multi_option bool DEFAULT true,
+            option_votes INT [],
+            used_users JSON
+        );
+
+        CREATE TABLE IF NOT EXISTS tags (
+            id bigserial primary key,
+            guild_id BIGINT NOT NULL,
+            tag_name varchar(255) NOT NULL,
+            body TEXT,
+            created_by BIGINT NOT NULL,
+            created_on TIMESTAMP WITH TIME ZONE NOT NULL,
+            aliases varchar(255) []
+        );
+
+        CREATE TABLE IF NOT EXISTS banned_users (
+            id bigserial primary key,
+            user_id BIGINT NOT NULL,
+            guild_id BIGINT NOT NULL,
+            wait_until TIMESTAMP WITH TIME ZONE
+        );
+
+        CREATE TABLE IF NOT EXISTS warns (
+            id bigserial primary key,
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            body TEXT,
+            points INT,
+            created_by BIGINT NOT NULL,
+            created_on TIMESTAMP WITH TIME ZONE NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS offences (
+            id bigserial primary key,
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            punishment varchar (100) NOT NULL,
+            body TEXT,
+            pardoned bool DEFAULT FALSE,
+            created_by BIGINT NOT NULL,
+            created_on TIMESTAMP WITH TIME ZONE NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS cluster_status (
+            cluster_id INT primary key,
+            shard_ids INT [] NOT NULL,
+            guilds INT NOT NULL,
+            latencies JSON,
+            updated_on TIMESTAMP WITH TIME ZONE NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS markov_table (
+            guild_id BIGINT primary key,
+            channel_id BIGINT,
+            trigrams TEXT [] DEFAULT '{}'
+        );
+    """),
+
+    (2, "indexes for guild and user lookups", """
+        -- warnings/offences of a user, in id order; the points sum, pardon and threshold checks
+        CREATE INDEX IF NOT EXISTS warns_guild_user_idx ON warns (guild_id, user_id, id);
+        CREATE INDEX IF NOT EXISTS offences_guild_user_idx ON offences (guild_id, user_id, id);
+
+        -- tag by name, and by alias (aliases @> ARRAY[name])
+        CREATE INDEX IF NOT EXISTS tags_guild_name_idx ON tags (guild_id, tag_name);
+        CREATE INDEX IF NOT EXISTS tags_aliases_idx ON tags USING GIN (aliases);
+
+        -- expired temporary bans, and removing a user's ban
+        CREATE INDEX IF NOT EXISTS banned_users_wait_until_idx ON banned_users (wait_until);
+        CREATE INDEX IF NOT EXISTS banned_users_guild_user_idx ON banned_users (guild_id, user_id);
+
+        CREATE INDEX IF NOT EXISTS autopunishments_guild_points_idx ON autopunishments (guild_id, points);
+        CREATE INDEX IF NOT EXISTS autocompletes_guild_idx ON autocompletes (guild_id);
+
+        -- legacy poll buttons are looked up by message
+        CREATE INDEX IF NOT EXISTS poll_table_message_idx ON poll_table (message_id);
+    """),
+
+    (3, "warn point balances", """
+        CREATE TABLE IF NOT EXISTS warn_balances (
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            points INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id)
+        );
+
+        -- the running total clamped at zero equals the plain total minus the lowest (negative) running total
+        INSERT INTO warn_balances (guild_id, user_id, points)
+        SELECT guild_id, user_id, MAX(total) - LEAST(MIN(running), 0) FROM (
+            SELECT guild_id, user_id,
+            SUM(COALESCE(points, 0)) OVER (PARTITION BY guild_id, user_id ORDER BY id) AS running,
+            SUM(COALESCE(points, 0)) OVER (PARTITION BY guild_id, user_id) AS total
+            FROM warns
+        ) prefix
+        GROUP BY guild_id, user_id
+        ON CONFLICT (guild_id, user_id) DO UPDATE SET points = EXCLUDED.points;
+    """),
+
+    (4, "link threshold offences to their threshold", """
+        ALTER TABLE offences ADD COLUMN IF NOT EXISTS autopunishment_id BIGINT REFERENCES autopunishments (id) ON DELETE SET NULL;
+        ALTER TABLE offences ADD COLUMN IF NOT EXISTS threshold_points INT;
+
+        -- threshold offences used to be recognised by their reason text only
+        UPDATE offences SET threshold_points = substring(body FROM '^Exceeded warn limit - ([0-9]+) points$')::int
+        WHERE body ~ '^Exceeded warn limit - [0-9]+ points$';
+
+        UPDATE offences SET autopunishment_id = autopunishments.id FROM autopunishments
+        WHERE offences.threshold_points IS NOT NULL AND autopunishments.guild_id = offences.guild_id
+        AND autopunishments.points = offences.threshold_points;
+
+        CREATE INDEX IF NOT EXISTS offences_active_threshold_idx ON offences (guild_id, user_id, threshold_points)
+        WHERE pardoned = false AND threshold_points IS NOT NULL;
+    """),
+    # warn, pardon and delwarn each run as one call (see helper.warn_points). Locking the balance row first
+    # serialises concurrent changes to a user's points, so two warns never both see the total from before the other
+    (5, "warn, pardon and delete warn functions", """
+        CREATE OR REPLACE FUNCTION warn_user(_guild_id BIGINT, _user_id BIGINT, _reason TEXT, _points INT,
+            _created_by BIGINT, _created_on TIMESTAMP WITH TIME ZONE,
+            OUT points INT, OUT total INT, OUT threshold_id BIGINT, OUT threshold_points INT, OUT threshold_type VARCHAR,
+            OUT threshold_timer INTERVAL, OUT max_points INT, OUT max_type VARCHAR, OUT offence_message TEXT)
+        LANGUAGE plpgsql AS $$
+        #variable_conflict use_column
+        DECLARE
+            amount INT;
+            crossed RECORD;
+        BEGIN
+            -- a reason matching an autocomplete takes its points
+            SELECT a.points INTO amount FROM autocompletes a
+            WHERE a.guild_id = _guild_id AND strpos(a.reason, _reason) > 0 ORDER BY a.id LIMIT 1;
+
+            amount := COALESCE(amount, _points, 1);
+            points := amount;
+
+            SELECT g.offence_message INTO offence_message FROM guild_table g WHERE g.guild_id = _guild_id;
+            SELECT a.points, a.p_type INTO max_points, max_type FROM autopunishments a
+            WHERE a.guild_id = _guild_id ORDER BY a.points DESC LIMIT 1;
+
+            -- invalid points: nothing is logged and total stays NULL
+            IF amount > 999 OR amount <= 0 THEN
+                RETURN;
+            END IF;
+
+            INSERT INTO warn_balances (guild_id, user_id) VALUES (_guild_id, _user_id)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET points = warn_balances.points;
+
+            INSERT INTO warns (guild_id, user_id, body, points, created_by, created_on)
+            VALUES (_guild_id, _user_id, _reason, amount, _created_by, _created_on);
+
+            UPDATE warn_balances b SET points = GREATEST(b.points + amount, 0)
+            WHERE b.guild_id = _guild_id AND b.user_id = _user_id RETURNING b.points INTO total;
+
+            -- the highest threshold reached, unless its punishment was already given and not pardoned
+            SELECT a.id, a.points, a.p_type, a.timer INTO crossed FROM autopunishments a
+            WHERE a.guild_id = _guild_id AND a.points <= total ORDER BY a.points DESC LIMIT 1;
+
+            IF FOUND AND NOT EXISTS (SELECT 1 FROM offences o WHERE o.guild_id = _guild_id AND o.user_id = _user_id
+                AND o.threshold_points = crossed.points AND o.pardoned = false) THEN
+                threshold_id := crossed.id;
+                threshold_points := crossed.points;
+                threshold_type := crossed.p_type;
+                threshold_timer := crossed.timer;
+            END IF;
+        END $$;
+
+        CREATE OR REPLACE FUNCTION pardon_user(_guild_id BIGINT, _user_id BIGINT, _reason TEXT, _points INT,
+            _created_by BIGINT, _created_on TIMESTAMP WITH TIME ZONE,
+            OUT total INT, OUT max_points INT, OUT max_type VARCHAR)
+        LANGUAGE plpgsql AS $$
+        #variable_conflict use_column
+        BEGIN
+            SELECT a.points, a.p_type INTO max_points, max_type FROM autopunishments a
+            WHERE a.guild_id = _guild_id ORDER BY a.points DESC LIMIT 1;
+
+            INSERT INTO warn_balances (guild_id, user_id) VALUES (_guild_id, _user_id)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET points = warn_balances.points
+            RETURNING warn_balances.points INTO total;
+
+            -- nothing to pardon: nothing is logged and total is NULL
+            IF total = 0 THEN
+                total := NULL;
+                RETURN;
+            END IF;
+
+            INSERT INTO warns (guild_id, user_id, body, points, created_by, created_on)
+            VALUES (_guild_id, _user_id, _reason, _points, _created_by, _created_on);
+
+            UPDATE warn_balances b SET points = GREATEST(b.points + _points, 0)
+            WHERE b.guild_id = _guild_id AND b.user_id = _user_id RETURNING b.points INTO total;
+
+            UPDATE offences o SET pardoned = true
+            WHERE o.guild_id = _guild_id AND o.user_id = _user_id AND o.threshold_points >= total AND o.pardoned = false;
+        END $$;
+
+        CREATE OR REPLACE FUNCTION delete_warn(_guild_id BIGINT, _warn_id BIGINT,
+            OUT id BIGINT, OUT user_id BIGINT, OUT points INT, OUT body TEXT,
+            OUT created_by BIGINT, OUT created_on TIMESTAMP WITH TIME ZONE, OUT total INT)
+        LANGUAGE plpgsql AS $$
+        #variable_conflict use_column
+        DECLARE
+            deleted RECORD;
+        BEGIN
+            SELECT w.user_id INTO deleted FROM warns w WHERE w.guild_id = _guild_id AND w.id = _warn_id;
+
+            -- no such warn: id is NULL
+            IF NOT FOUND THEN
+                RETURN;
+            END IF;
+
+            INSERT INTO warn_balances (guild_id, user_id) VALUES (_guild_id, deleted.user_id)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET points = warn_balances.points;
+
+            DELETE FROM warns w WHERE w.guild_id = _guild_id AND w.id = _warn_id
+            RETURNING w.id, w.user_id, w.points, w.body, w.created_by, w.created_on
+            INTO id, user_id, points, body, created_by, created_on;
+
+            -- deleted by someone else while waiting for the lock
+            IF NOT FOUND THEN
+                RETURN;
+            END IF;
+
+            -- the clamped total cannot be undone step by step, so it is recomputed from the remaining warns
+            SELECT COALESCE(MAX(prefix.total) - LEAST(MIN(prefix.running), 0), 0) INTO total FROM (
+                SELECT SUM(COALESCE(w.points, 0)) OVER (ORDER BY w.id) AS running, SUM(COALESCE(w.points, 0)) OVER () AS total
+                FROM warns w WHERE w.guild_id = _guild_id AND w.user_id = deleted.user_id
+            ) prefix;
+
+            UPDATE warn_balances b SET points = total WHERE b.guild_id = _guild_id AND b.user_id = deleted.user_id;
+
+            UPDATE offences o SET pardoned = true
+            WHERE o.guild_id = _guild_id AND o.user_id = deleted.user_id AND o.threshold_points >= total AND o.pardoned = false;
+        END $$;
+    """),
+    (6, "raid detection settings", """
+        CREATE TABLE IF NOT EXISTS raid_settings (
+            guild_id BIGINT primary key,
+            joins INT NOT NULL DEFAULT 10,
+            seconds INT NOT NULL DEFAULT 10,
+            account_age INT,
+            action varchar (20) NOT NULL DEFAULT 'alert',
+            alert_channel BIGINT
+        );
+    """),
+
+    # partitions are {table}_YYYY_MM, by UTC month; helper.partitions keeps upcoming months created and archives old ones
+    (7, "partition warns and offences by month", """
+        CREATE SCHEMA IF NOT EXISTS modlog_archive;
+
+        CREATE OR REPLACE FUNCTION create_month_partitions(_table text, _from timestamptz, _to timestamptz) RETURNS SETOF text AS $$
+        DECLARE
+            start_on timestamp := date_trunc('month', _from AT TIME ZONE 'UTC');
+            part text;
+        BEGIN
+            WHILE start_on AT TIME ZONE 'UTC' < _to LOOP
+                part := _table || '_' || to_char(start_on, 'YYYY_MM');
+
+                IF to_regclass(part) IS NULL THEN
+                    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)', part, _table,
+                    start_on AT TIME ZONE 'UTC', (start_on + interval '1 month') AT TIME ZONE 'UTC');
+                    RETURN NEXT part;
+                END IF;
+
+                start_on := start_on + interval '1 month';
+            END LOOP;
+        END $$ LANGUAGE plpgsql;
+
+        -- partitions that end by _before are detached and moved to the modlog_archive schema
+        CREATE OR REPLACE FUNCTION archive_month_partitions(_table text, _before timestamptz) RETURNS SETOF text AS $$
+        DECLARE
+            part text;
+        BEGIN
+            FOR part IN SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = _table::regclass ORDER BY c.relname LOOP
+                IF (to_date(right(part, 7), 'YYYY_MM') + interval '1 month') AT TIME ZONE 'UTC' <= _before THEN
+                    EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', _table, part);
+                    EXECUTE format('ALTER TABLE %I SET SCHEMA modlog_archive', part);
+                    RETURN NEXT part;
+                END IF;
+            END LOOP;
+        END $$ LANGUAGE plpgsql;
+
+        -- the existing rows are copied into partitions covering them; ids keep coming from the same sequences
+        ALTER TABLE warns RENAME TO warns_unpartitioned;
+        ALTER INDEX warns_pkey RENAME TO warns_unpartitioned_pkey;
+        ALTER INDEX warns_guild_user_idx RENAME TO warns_unpartitioned_guild_user_idx;
+        ALTER SEQUENCE warns_id_seq OWNED BY NONE;
+
+        CREATE TABLE warns (
+            id BIGINT NOT NULL DEFAULT nextval('warns_id_seq'),
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            body TEXT,
+            points INT,
+            created_by BIGINT NOT NULL,
+            created_on TIMESTAMP WITH TIME ZONE NOT NULL,
+            PRIMARY KEY (id, created_on)
+        ) PARTITION BY RANGE (created_on);
+
+        ALTER SEQUENCE warns_id_seq OWNED BY warns.id;
+        CREATE INDEX warns_guild_user_idx ON warns (guild_id, user_id, id);
+
+        SELECT create_month_partitions('warns', COALESCE((SELECT min(created_on) FROM warns_unpartitioned), now()), now() + interval '3 months');
+        INSERT INTO warns (id, guild_id, user_id, body, points, created_by, created_on)
+        SELECT id, guild_id, user_id, body, points, created_by, created_on FROM warns_unpartitioned;
+        DROP TABLE warns_unpartitioned;
+
+        ALTER TABLE offences RENAME TO offences_unpartitioned;
+        ALTER INDEX offences_pkey RENAME TO offences_unpartitioned_pkey;
+        ALTER INDEX offences_guild_user_idx RENAME TO offences_unpartitioned_guild_user_idx;
+        ALTER INDEX offences_active_threshold_idx RENAME TO offences_unpartitioned_active_threshold_idx;
+        ALTER SEQUENCE offences_id_seq OWNED BY NONE;
+
+        CREATE TABLE offences (
+            id BIGINT NOT NULL DEFAULT nextval('offences_id_seq'),
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            punishment varchar (100) NOT NULL,
+            body TEXT,
+            pardoned bool DEFAULT FALSE,
+            created_by BIGINT NOT NULL,
+            created_on TIMESTAMP WITH TIME ZONE NOT NULL,
+            autopunishment_id BIGINT REFERENCES autopunishments (id) ON DELETE SET NULL,
+            threshold_points INT,
+            PRIMARY KEY (id, created_on)
+        ) PARTITION BY RANGE (created_on);
+
+        ALTER SEQUENCE offences_id_seq OWNED BY offences.id;
+        CREATE INDEX offences_guild_user_idx ON offences (guild_id, user_id, id);
+        CREATE INDEX offences_active_threshold_idx ON offences (guild_id, user_id, threshold_points)
+        WHERE pardoned = false AND threshold_points IS NOT NULL;
+
+        SELECT create_month_partitions('offences', COALESCE((SELECT min(created_on) FROM offences_unpartitioned), now()), now() + interval '3 months');
+        INSERT INTO offences (id, guild_id, user_id, punishment, body, pardoned, created_by, created_on, autopunishment_id, threshold_points)
+        SELECT id, guild_id, user_id, punishment, body, pardoned, created_by, created_on, autopunishment_id, threshold_points FROM offences_unpartitioned;
+        DROP TABLE offences_unpartitioned;
+    """),
+
+    (8, "mod-log channel", """
+        ALTER TABLE guild_table ADD COLUMN IF NOT EXISTS modlog_channel BIGINT;
+    """),
+
+    # run by helper.warn_points.decay; balances are locked before warns, in the same order as warn, pardon and delwarn
+    (9, "warn point decay", """
+        CREATE TABLE IF NOT EXISTS warn_decay (
+            guild_id BIGINT primary key,
+            expire_days INT,
+            monthly_points INT
+        );
+
+        -- expired warns are still listed, but their points have been taken off the balance
+        ALTER TABLE warns ADD COLUMN IF NOT EXISTS expired bool NOT NULL DEFAULT false;
+        -- only the warns that can still expire, so the sweep never reads the ones it is done with
+        CREATE INDEX IF NOT EXISTS warns_decay_idx ON warns (guild_id, created_on) WHERE expired = false AND points > 0;
+
+        -- points taken off by the monthly decay since decayed_on started counting, kept so a recomputed balance
+        -- can take them off again
+        ALTER TABLE warn_balances ADD COLUMN IF NOT EXISTS decayed INT NOT NULL DEFAULT 0;
+        ALTER TABLE warn_balances ADD COLUMN IF NOT EXISTS decayed_on TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now();
+
+        -- expires up to _batch of the oldest due warns of each guild. Returns the number expired
+        CREATE OR REPLACE FUNCTION expire_warns(_now TIMESTAMP WITH TIME ZONE, _batch INT) RETURNS INT
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            due RECORD;
+        BEGIN
+            SELECT array_agg(w.id) AS ids, array_agg(w.created_on) AS created_ons,
+            array_agg(d.guild_id) AS guild_ids, array_agg(w.user_id) AS user_ids INTO due
+            FROM warn_decay d CROSS JOIN LATERAL (
+                SELECT w.id, w.user_id, w.created_on FROM warns w
+                WHERE w.guild_id = d.guild_id AND w.expired = false AND w.points > 0
+                AND w.created_on < _now - make_interval(days => d.expire_days)
+                ORDER BY w.created_on LIMIT _batch
+            ) w
+            WHERE d.expire_days IS NOT NULL;
+
+            IF due.ids IS NULL THEN
+                RETURN 0;
+            END IF;
+
+            PERFORM 1 FROM warn_balances b
+            WHERE (b.guild_id, b.user_id) IN (SELECT * FROM unnest(due.guild_ids, due.user_ids))
+            ORDER BY b.guild_id, b.user_id FOR UPDATE;
+
+            WITH expired AS (
+                UPDATE warns w SET expired = true FROM unnest(due.ids, due.created_ons) AS e(id, created_on)
+                WHERE w.id = e.id AND w.created_on = e.created_on AND w.expired = false
+                RETURNING w.guild_id, w.user_id, w.points
+            ), balances AS (
+                UPDATE warn_balances b SET points = GREATEST(b.points - t.points, 0)
+                FROM (SELECT guild_id, user_id, SUM(points) AS points FROM expired GROUP BY guild_id, user_id) t
+                WHERE b.guild_id = t.guild_id AND b.user_id = t.user_id
+                RETURNING b.guild_id, b.user_id, b.points
+            )
+            -- as with pardons, threshold punishments above the new balance can be given again
+            UPDATE offences o SET pardoned = true FROM balances b
+            WHERE o.guild_id = b.guild_id AND o.user_id = b.user_id AND o.threshold_points >= b.points AND o.pardoned = false;
+
+            RETURN array_length(due.ids, 1);
+        END $$;
+
+        -- takes monthly_points off for every 30 days since decayed_on. Returns the number of balances changed
+        CREATE OR REPLACE FUNCTION decay_balances(_now TIMESTAMP WITH TIME ZONE) RETURNS INT
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            changed INT;
+        BEGIN
+            WITH due AS (
+                SELECT b.guild_id, b.user_id, p.periods, p.periods * d.monthly_points AS amount
+                FROM warn_decay d JOIN warn_balances b ON b.guild_id = d.guild_id
+                CROSS JOIN LATERAL (SELECT floor(extract(epoch FROM _now - b.decayed_on) / 2592000)::int AS periods) p
+                WHERE d.monthly_points IS NOT NULL AND b.decayed_on <= _now - interval '30 days'
+            ), balances AS (
+                UPDATE warn_balances b SET points = GREATEST(b.points - due.amount, 0),
+                decayed = b.decayed + LEAST(b.points, due.amount),
+                -- a balance that reaches zero starts its next period afresh
+                decayed_on = CASE WHEN b.points > due.amount THEN b.decayed_on + due.periods * interval '30 days' ELSE _now END
+                FROM due WHERE b.guild_id = due.guild_id AND b.user_id = due.user_id
+                RETURNING b.guild_id, b.user_id, b.points
+            ), pardoned AS (
+                UPDATE offences o SET pardoned = true FROM balances b
+                WHERE o.guild_id = b.guild_id AND o.user_id = b.user_id AND o.threshold_points >= b.points AND o.pardoned = false
+            )
+            SELECT COUNT(*) INTO changed FROM balances;
+
+            RETURN changed;
+        END $$;
+
+        -- recomputes from the warns that have not expired, less the monthly decay
+        CREATE OR REPLACE FUNCTION delete_warn(_guild_id BIGINT, _warn_id BIGINT,
+            OUT id BIGINT, OUT user_id BIGINT, OUT points INT, OUT body TEXT,
+            OUT created_by BIGINT, OUT created_on TIMESTAMP WITH TIME ZONE, OUT total INT)
+        LANGUAGE plpgsql AS $$
+        #variable_conflict use_column
+        DECLARE
+            deleted RECORD;
+            balance_decayed INT;
+        BEGIN
+            SELECT w.user_id INTO deleted FROM warns w WHERE w.guild_id = _guild_id AND w.id = _warn_id;
+
+            -- no such warn: id is NULL
+            IF NOT FOUND THEN
+                RETURN;
+            END IF;
+
+            INSERT INTO warn_balances (guild_id, user_id) VALUES (_guild_id, deleted.user_id)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET points = warn_balances.points
+            RETURNING warn_balances.decayed INTO balance_decayed;
+
+            DELETE FROM warns w WHERE w.guild_id = _guild_id AND w.id = _warn_id
+            RETURNING w.id, w.user_id, w.points, w.body, w.created_by, w.created_on
+            INTO id, user_id, points, body, created_by, created_on;
+
+            -- deleted by someone else while waiting for the lock
+            IF NOT FOUND THEN
+                RETURN;
+            END IF;
+
+            -- the clamped total cannot be undone step by step, so it is recomputed from the remaining warns
+            SELECT GREATEST(COALESCE(MAX(prefix.total) - LEAST(MIN(prefix.running), 0), 0) - balance_decayed, 0) INTO total FROM (
+                SELECT SUM(COALESCE(w.points, 0)) OVER (ORDER BY w.id) AS running, SUM(COALESCE(w.points, 0)) OVER () AS total
+                FROM warns w WHERE w.guild_id = _guild_id AND w.user_id = deleted.user_id AND w.expired = false
+            ) prefix;
+
+            UPDATE warn_balances b SET points = total WHERE b.guild_id = _guild_id AND b.user_id = deleted.user_id;
+
+            UPDATE offences o SET pardoned = true
+            WHERE o.guild_id = _guild_id AND o.user_id = deleted.user_id AND o.threshold_points >= total AND o.pardoned = false;
+        END $$;
+    """),
+
+    # monthly decay is logged as negative warns (created_by 0), like pardons, so every balance is the clamped running
+    # total of its warns that have not expired, and recompute_balances is the one way it is recomputed
+    (10, "log warn decay as warns", """
+        -- points taken off so far, kept as a decay warn after the user's other warns
+        INSERT INTO warns (guild_id, user_id, body, points, created_by, created_on)
+        SELECT guild_id, user_id, 'Monthly decay', -decayed, 0, now() FROM warn_balances WHERE decayed > 0;
+
+        ALTER TABLE warn_balances DROP COLUMN decayed;
+
+        CREATE OR REPLACE FUNCTION recompute_balances(_guild_ids BIGINT[], _user_ids BIGINT[]) RETURNS VOID
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            WITH totals AS (
+                SELECT u.guild_id, u.user_id, COALESCE(MAX(prefix.total) - LEAST(MIN(prefix.running), 0), 0) AS points
+                FROM (SELECT DISTINCT * FROM unnest(_guild_ids, _user_ids) AS u(guild_id, user_id)) u
+                LEFT JOIN LATERAL (
+                    SELECT SUM(COALESCE(w.points, 0)) OVER (ORDER BY w.id) AS running, SUM(COALESCE(w.points, 0)) OVER () AS total
+                    FROM warns w WHERE w.guild_id = u.guild_id AND w.user_id = u.user_id AND w.expired = false
+                ) prefix ON true
+                GROUP BY u.guild_id, u.user_id
+            ), balances AS (
+                UPDATE warn_balances b SET points = t.points FROM totals t
+                WHERE b.guild_id = t.guild_id AND b.user_id = t.user_id
+                RETURNING b.guild_id, b.user_id, b.points
+            )
+            -- as with pardons, threshold punishments above the new balance can be given again
+            UPDATE offences o SET pardoned = true FROM balances b
+            WHERE o.guild_id = b.guild_id AND o.user_id = b.user_id AND o.threshold_points >= b.points AND o.pardoned = false;
+        END $$;
+
+        CREATE OR REPLACE FUNCTION warn_user(_guild_id BIGINT, _user_id BIGINT, _reason TEXT, _points INT,
+            _created_by BIGINT, _created_on TIMESTAMP WITH TIME ZONE,
+            OUT points INT, OUT total INT, OUT threshold_id BIGINT, OUT threshold_points INT, OUT threshold_type VARCHAR,
+            OUT threshold_timer INTERVAL, OUT max_points INT, OUT max_type VARCHAR, OUT offence_message TEXT)
+        LANGUAGE plpgsql AS $$
+        #variable_conflict use_column
+        DECLARE
+            amount INT;
+            crossed RECORD;
+        BEGIN
+            -- a reason matching an autocomplete takes its points
+            SELECT a.points INTO amount FROM autocompletes a
+            WHERE a.guild_id = _guild_id AND strpos(a.reason, _reason) > 0 ORDER BY a.id LIMIT 1;
+
+            amount := COALESCE(amount, _points, 1);
+            points := amount;
+
+            SELECT g.offence_message INTO offence_message FROM guild_table g WHERE g.guild_id = _guild_id;
+            SELECT a.points, a.p_type INTO max_points, max_type FROM autopunishments a
+            WHERE a.guild_id = _guild_id ORDER BY a.points DESC LIMIT 1;
+
+            -- invalid points: nothing is logged and total stays NULL
+            IF amount > 999 OR amount <= 0 THEN
+                RETURN;
+            END IF;
+
+            INSERT INTO warn_balances (guild_id, user_id) VALUES (_guild_id, _user_id)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET points = warn_balances.points;
+
+            INSERT INTO warns (guild_id, user_id, body, points, created_by, created_on)
+            VALUES (_guild_id, _user_id, _reason, amount, _created_by, _created_on);
+
+            -- a balance going up from zero starts its monthly decay period here
+            UPDATE warn_balances b SET points = GREATEST(b.points + amount, 0),
+            decayed_on = CASE WHEN b.points = 0 THEN _created_on ELSE b.decayed_on END
+            WHERE b.guild_id = _guild_id AND b.user_id = _user_id RETURNING b.points INTO total;
+
+            -- the highest threshold reached, unless its punishment was already given and not pardoned
+            SELECT a.id, a.points, a.p_type, a.timer INTO crossed FROM autopunishments a
+            WHERE a.guild_id = _guild_id AND a.points <= total ORDER BY a.points DESC LIMIT 1;
+
+            IF FOUND AND NOT EXISTS (SELECT 1 FROM offences o WHERE o.guild_id = _guild_id AND o.user_id = _user_id
+                AND o.threshold_points = crossed.points AND o.pardoned = false) THEN
+                threshold_id := crossed.id;
+                threshold_points := crossed.points;
+                threshold_type := crossed.p_type;
+                threshold_timer := crossed.timer;
+            END IF;
+        END $$;
+
+        CREATE OR REPLACE FUNCTION expire_warns(_now TIMESTAMP WITH TIME ZONE, _batch INT) RETURNS INT
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            due RECORD;
+        BEGIN
+            SELECT array_agg(w.id) AS ids, array_agg(w.created_on) AS created_ons,
+            array_agg(d.guild_id) AS guild_ids, array_agg(w.user_id) AS user_ids INTO due
+            FROM warn_decay d CROSS JOIN LATERAL (
+                SELECT w.id, w.user_id, w.created_on FROM warns w
+                WHERE w.guild_id = d.guild_id AND w.expired = false AND w.points > 0
+                AND w.created_on < _now - make_interval(days => d.expire_days)
+                ORDER BY w.created_on LIMIT _batch
+            ) w
+            WHERE d.expire_days IS NOT NULL;
+
+            IF due.ids IS NULL THEN
+                RETURN 0;
+            END IF;
+
+            PERFORM 1 FROM warn_balances b
+            WHERE (b.guild_id, b.user_id) IN (SELECT * FROM unnest(due.guild_ids, due.user_ids))
+            ORDER BY b.guild_id, b.user_id FOR UPDATE;
+
+            UPDATE warns w SET expired = true FROM unnest(due.ids, due.created_ons) AS e(id, created_on)
+            WHERE w.id = e.id AND w.created_on = e.created_on AND w.expired = false;
+
+            -- a separate statement, so the recompute sees the warns as expired. Points an earlier pardon or decay
+            -- already cancelled are not taken off twice
+            PERFORM recompute_balances(due.guild_ids, due.user_ids);
+
+            RETURN array_length(due.ids, 1);
+        END $$;
+
+        CREATE OR REPLACE FUNCTION decay_balances(_now TIMESTAMP WITH TIME ZONE) RETURNS INT
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            changed INT;
+        BEGIN
+            WITH due AS (
+                SELECT b.guild_id, b.user_id, p.periods, LEAST(b.points, p.periods * d.monthly_points) AS amount
+                FROM warn_decay d JOIN warn_balances b ON b.guild_id = d.guild_id
+                CROSS JOIN LATERAL (SELECT floor(extract(epoch FROM _now - b.decayed_on) / 2592000)::int AS periods) p
+                WHERE d.monthly_points IS NOT NULL AND b.points > 0 AND b.decayed_on <= _now - interval '30 days'
+                ORDER BY b.guild_id, b.user_id
+                FOR UPDATE OF b
+            ), logged AS (
+                INSERT INTO warns (guild_id, user_id, body, points, created_by, created_on)
+                SELECT due.guild_id, due.user_id, 'Monthly decay', -due.amount, 0, _now FROM due
+            ), balances AS (
+                -- balances at zero are left alone; their next period starts with their next warn
+                UPDATE warn_balances b SET points = b.points - due.amount, decayed_on = b.decayed_on + due.periods * interval '30 days'
+                FROM due WHERE b.guild_id = due.guild_id AND b.user_id = due.user_id
+                RETURNING b.guild_id, b.user_id, b.points
+            ), pardoned AS (
+                UPDATE offences o SET pardoned = true FROM balances b
+                WHERE o.guild_id = b.guild_id AND o.user_id = b.user_id AND o.threshold_points >= b.points AND o.pardoned = false
+            )
+            SELECT COUNT(*) INTO changed FROM balances;
+
+            RETURN changed;
+        END $$;
+
+        CREATE OR REPLACE FUNCTION delete_warn(_guild_id BIGINT, _warn_id BIGINT,
+            OUT id BIGINT, OUT user_id BIGINT, OUT points INT, OUT body TEXT,
+            OUT created_by BIGINT, OUT created_on TIMESTAMP WITH TIME ZONE, OUT total INT)
+        LANGUAGE plpgsql AS $$
+        #variable_conflict use_column
+        DECLARE
+            deleted RECORD;
+        BEGIN
+            SELECT w.user_id INTO deleted FROM warns w WHERE w.guild_id = _guild_id AND w.id = _warn_id;
+
+            -- no such warn: id is NULL
+            IF NOT FOUND THEN
+                RETURN;
+            END IF;
+
+            INSERT INTO warn_balances (guild_id, user_id) VALUES (_guild_id, deleted.user_id)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET points = warn_balances.points;
+
+            DELETE FROM warns w WHERE w.guild_id = _guild_id AND w.id = _warn_id
+            RETURNING w.id, w.user_id, w.points, w.body, w.created_by, w.created_on
+            INTO id, user_id, points, body, created_by, created_on;
+
+            -- deleted by someone else while waiting for the lock
+            IF NOT FOUND THEN
+                RETURN;
+            END IF;
+
+            -- the clamped total cannot be undone step by step, so it is recomputed from the remaining warns
+            PERFORM recompute_balances(ARRAY[_guild_id], ARRAY[deleted.user_id]);
+            SELECT b.points INTO total FROM warn_balances b WHERE b.guild_id = _guild_id AND b.user_id = deleted.user_id;
+        END $$;
+
+        -- balances already took off points a pardon had cancelled when a warn expired, so every one is recomputed
+        UPDATE warn_balances SET points = 0;
+
+        INSERT INTO warn_balances (guild_id, user_id, points)
+        SELECT guild_id, user_id, MAX(total) - LEAST(MIN(running), 0) FROM (
+            SELECT guild_id, user_id,
+            SUM(COALESCE(points, 0)) OVER (PARTITION BY guild_id, user_id ORDER BY id) AS running,
+            SUM(COALESCE(points, 0)) OVER (PARTITION BY guild_id, user_id) AS total
+            FROM warns WHERE expired = false
+        ) prefix
+        GROUP BY guild_id, user_id
+        ON CONFLICT (guild_id, user_id) DO UPDATE SET points = EXCLUDED.points;
+    """),
+
+    (11, "serialize partition changes and recompute balances on archive", """
+        -- every cluster ensures its partitions at startup, so concurrent calls wait for each other
+        CREATE OR REPLACE FUNCTION create_month_partitions(_table text, _from timestamptz, _to timestamptz) RETURNS SETOF text AS $$
+        DECLARE
+            start_on timestamp := date_trunc('month', _from AT TIME ZONE 'UTC');
+            part text;
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext('month_partitions'));
+
+            WHILE start_on AT TIME ZONE 'UTC' < _to LOOP
+                part := _table || '_' || to_char(start_on, 'YYYY_MM');
+
+                IF to_regclass(part) IS NULL THEN
+                    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)', part, _table,
+                    start_on AT TIME ZONE 'UTC', (start_on + interval '1 month') AT TIME ZONE 'UTC');
+                    RETURN NEXT part;
+                END IF;
+
+                start_on := start_on + interval '1 month';
+            END LOOP;
+        END $$ LANGUAGE plpgsql;
+
+        -- archived warns no longer count, so the balances of the users they belonged to are recomputed without them
+        CREATE OR REPLACE FUNCTION archive_month_partitions(_table text, _before timestamptz) RETURNS SETOF text AS $$
+        DECLARE
+            part text;
+            users RECORD;
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext('month_partitions'));
+
+            IF _table = 'warns' THEN
+                -- balances before warns, as in warn_user; warns and pardons wait until the archive is done
+                LOCK TABLE warn_balances IN EXCLUSIVE MODE;
+            END IF;
+
+            FOR part IN SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = _table::regclass ORDER BY c.relname LOOP
+                IF (to_date(right(part, 7), 'YYYY_MM') + interval '1 month') AT TIME ZONE 'UTC' <= _before THEN
+                    IF _table = 'warns' THEN
+                        EXECUTE format('SELECT array_agg(guild_id) AS guild_ids, array_agg(user_id) AS user_ids
+                        FROM (SELECT DISTINCT guild_id, user_id FROM %I) p', part) INTO users;
+                    END IF;
+
+                    EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', _table, part);
+                    EXECUTE format('ALTER TABLE %I SET SCHEMA modlog_archive', part);
+
+                    IF _table = 'warns' THEN
+                        PERFORM recompute_balances(COALESCE(users.guild_ids, '{}'), COALESCE(users.user_ids, '{}'));
+                    END IF;
+
+                    RETURN NEXT part;
+                END IF;
+            END LOOP;
+        END $$ LANGUAGE plpgsql;
+    """),
+]
+
+async def migrate(conn: asyncpg.Connection) -> list:
+    """Applies every migration that has not been applied yet. Returns the (version, name) of those applied"""
+    await conn.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+        version INT primary key,
+        name TEXT NOT NULL,
+        applied_on TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+    )""")
+
+    applied = []
+    await conn.execute("SELECT pg_advisory_lock($1)", LOCK_ID)
+
+    try:
+        done = {record['version'] for record in await conn.fetch("SELECT version FROM schema_version")}
+
+        for version, name, sql in MIGRATIONS:
+            if version in done:
+                continue
+
+            async with conn.transaction():
+                await conn.execute(sql)
+                await conn.execute("INSERT INTO schema_version (version, name) VALUES ($1, $2)", version, name)
+
+            applied.append((version, name))
+
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", LOCK_ID)
+
+    return applied
+
+# query name: (sample arguments, index expected to be used)
+PLAN_CHECKS = {
+    'warns_count': ((0, 0), 'warns_guild_user_idx'),
+    'warns_page_after': ((0, 0, 0, 10), 'warns_guild_user_idx'),
+    'warns_page_before': ((0, 0, 0, 10), 'warns_guild_user_idx'),
+    'warn_balance_get': ((0, 0), 'warn_balances_pkey'),
+    'offences_count': ((0, 0), 'offences_guild_user_idx'),
+    'offences_page_after': ((0, 0, 0, 10), 'offences_guild_user_idx'),
+    'tag_get': (('', 0), 'tags_guild_name_idx'),
+    'tag_lookup': ((0, ''), 'tags_aliases_idx'),
+    'banned_due': ((datetime.now(timezone.utc), 1, [0]), 'banned_users_wait_until_idx'),
+    'banned_delete_user': ((0, 0), 'banned_users_guild_user_idx'),
+    'thresholds_by_guild': ((0,), 'autopunishments_guild_points_idx'),
+    'autocompletes_by_guild': ((0,), 'autocompletes_guild_idx'),
+    'poll_get_by_message': ((0,), 'poll_table_message_idx'),
+}
+
+def _plan_indexes(plan: dict, parents: dict) -> set:
+    # scans of a partition's index are reported as the partitioned table's index they belong to
+    indexes = {parents.get(plan['Index Name'], plan['Index Name'])} if 'Index Name' in plan else set()
+    for child in plan.get('Plans', []):
+        indexes |= _plan_indexes(child, parents)
+    return indexes
+
+async def check_plans(conn: asyncpg.Connection) -> list:
+    """
+    EXPLAINs the PLAN_CHECKS queries and returns [(query name, expected index, indexes used)].
+    Sequential scans are disabled for the check: on small tables the planner prefers them anyway,
+    so this confirms each index can serve its query rather than what the planner picks today.
+    Nothing is executed, since EXPLAIN without ANALYZE only plans
+    """
+    results = []
+
+    async with conn.transaction():
+        await conn.execute("SET LOCAL enable_seqscan = off")
+
+        parents = {record['index']: record['parent'] for record in await conn.fetch("""SELECT c.relname AS index, p.relname AS parent
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent WHERE c.relkind = 'i'""")}
+
+        for name, (args, expected) in PLAN_CHECKS.items():
+            plan = json.loads(await conn.fetchval(f"EXPLAIN (FORMAT JSON) {QUERIES[name]}", *args))
+            results.append((name, expected, _plan_indexes(plan[0]['Plan'], parents)))
+
+    return results
@@ -0,0 +1,75 @@
+import asyncio
+import sys
+import traceback
+import discord
+from collections import deque
+from discord.ext import commands
+
+"""
+Copies moderation embeds to each guild's mod-log channel (`set modlog`). Embeds are queued per guild and sent up to
+10 per message, as many as fit in Discord's 6000 character limit per message. A guild's queue is flushed by one task
+at a time, which waits COALESCE_DELAY after the first embed so a burst (a mass action) goes out in few messages,
+and then sends one message after another, so the channel's rate limit is never exceeded.
+"""
+
+EMBEDS_PER_MESSAGE = 10
+CHARACTERS_PER_MESSAGE = 6000
+COALESCE_DELAY = 2
+# a guild's oldest embeds are dropped beyond this, if the channel cannot keep up
+MAX_QUEUED = 5000
+
+class ModLog:
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.queues = {} # {guild_id: deque of embeds}
+        self._flushing = {} # {guild_id: Task}
+
+    def log(self, ctx: commands.Context, embed: discord.Embed):
+        """Queues a copy of the embed for the guild's mod-log channel, with the channel it came from as the footer"""
+        if self.bot.guild_cache.get_value(ctx.guild.id, 'modlog_channel') is None:
+            return
+
+        embed = embed.copy()
+        embed.set_footer(text = f"#{ctx.channel}")
+        embed.timestamp = discord.utils.utcnow()
+
+        self.queues.setdefault(ctx.guild.id, deque(maxlen = MAX_QUEUED)).append(embed)
+
+        if ctx.guild.id not in self._flushing:
+            self._flushing[ctx.guild.id] = asyncio.create_task(self._flush(ctx.guild))
+
+    def _batch(self, queue: deque) -> list:
+        batch = []
+        characters = 0
+
+        while queue and len(batch) < EMBEDS_PER_MESSAGE and (not batch or characters + len(queue[0]) <= CHARACTERS_PER_MESSAGE):
+            characters += len(queue[0])
+            batch.append(queue.popleft())
+
+        return batch
+
+    async def _flush(self, guild: discord.Guild):
+        try:
+            await asyncio.sleep(COALESCE_DELAY)
+            queue = self.queues[guild.id]
+
+            while queue:
+                channel_id = self.bot.guild_cache.get_value(guild.id, 'modlog_channel')
+                channel = guild.get_channel(channel_id) if channel_id is not None else None
+
+                if channel is None:
+                    break
+
+                try:
+                    await channel.send(embeds = self._batch(queue))
+                except (discord.Forbidden, discord.NotFound):
+                    # the bot cannot post there; the setting is kept, in case the permissions are fixed
+                    break
+                except Exception as error:
+                    print(f'Mod log delivery in guild {guild.id} failed:', file = sys.stderr)
+                    traceback.print_exception(type(error), error, error.__traceback__, file = sys.stderr)
+
+        finally:
+            # with no await after the last check of the queue, nothing is queued without a task to send it
+            self.queues.pop(guild.id, None)
+            self._flushing.pop(guild.id, None)
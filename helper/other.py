@@ -2,19 +2,61 @@ import discord
 from discord.ext import commands
 from typing import List, Optional, Literal
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from helper.outbox import dm_footer
 
 
+class ListSource:
+    """Pages that are already built, for Paginator"""
+    def __init__(self, list_of_embeds: List[discord.Embed]):
+        self.list_of_embeds = list_of_embeds
+        self.page_count = len(list_of_embeds)
+
+    async def get_page(self, page: int) -> discord.Embed:
+        return self.list_of_embeds[page - 1]
+
+class ChunkSource:
+    """
+    Pages of `per_page` items each, for Paginator. `render(items, page)` is awaited to make a page's embed,
+    so only the pages shown are ever built
+    """
+    def __init__(self, items: list, per_page: int, render):
+        self.items = items
+        self.per_page = per_page
+        self.render = render
+        self.page_count = max(1, -(-len(items) // per_page))
+
+    async def get_page(self, page: int) -> discord.Embed:
+        start = (page - 1) * self.per_page
+        return await self.render(self.items[start:start + self.per_page], page)
+
 class Paginator(discord.ui.View):
-    def __init__(self, author: discord.User, list_of_embeds: List[discord.Embed]):
+    """
+    `pages` is a list of embeds, or a page source: an object with `page_count` and an async `get_page(page)`
+    (pages numbered from 1) returning the embed, for pages rendered only when shown.
+    The last CACHE_SIZE rendered pages are kept, so going back and forth does not render them again
+    """
+    CACHE_SIZE = 5
+
+    def __init__(self, author: discord.User, pages):
         super().__init__(timeout = 60)
-        self.list_of_embeds = list_of_embeds
+        self.source = ListSource(pages) if isinstance(pages, list) else pages
         self.author = author
         self.page_number = 1
+        self.cache = OrderedDict() # {page: embed}, least recently shown first
+
+        self.update_buttons()
         
-        for child in self.children:
-            if child.custom_id == 'page_num':
-                child.label = f'1/{len(self.list_of_embeds)}'
-        
+    async def send(self, ctx: commands.Context):
+        """Sends the first page, with the buttons only if there is more than one page"""
+        embed = await self.get_page(1)
+
+        if self.source.page_count == 1:
+            self.stop()
+            await ctx.send(embed = embed)
+        else:
+            self.msg = await ctx.send(embed = embed, view = self)
+
     async def on_timeout(self) -> None:
         for child in self.children:
             child.disabled = True
@@ -26,42 +68,38 @@ class Paginator(discord.ui.View):
         if itx.user == self.author:
             return True
         await itx.response.send_message("You are not authorized for this interaction.", ephemeral = True)
+
+    def update_buttons(self):
+        self.first_page.disabled = self.previous_page.disabled = self.page_number == 1
+        self.next_page.disabled = self.last_page.disabled = self.page_number == self.source.page_count
+        self.page_num.label = f"{self.page_number}/{self.source.page_count}"
+
+    async def get_page(self, page: int) -> discord.Embed:
+        embed = self.cache.get(page)
+
+        if embed is None:
+            embed = self.cache[page] = await self.source.get_page(page)
+            if len(self.cache) > self.CACHE_SIZE:
+                self.cache.popitem(last = False)
+
+        self.cache.move_to_end(page)
+        return embed
+
+    async def show_page(self, itx: discord.Interaction, page: int):
+        self.page_number = page
+        self.update_buttons()
+
+        # rendering a page can query the database and fetch users, which may take longer than the 3s Discord allows
+        await itx.response.defer()
+        await itx.edit_original_response(embed = await self.get_page(page), view = self)
     
     @discord.ui.button(label = "First page", disabled = True, style = discord.ButtonStyle.blurple, custom_id = 'first_page')
     async def first_page(self, itx: discord.Interaction, button: discord.ui.Button):
-        self.page_number = 1
-
-        for child in self.children:
-            if child.custom_id == 'previous_page':
-                child.disabled = True
-            elif child.custom_id == 'page_num':
-                child.label = f"1/{len(self.list_of_embeds)}"
-            else:
-                child.disabled = False
-        
-        button.disabled = True
-
-        await self.msg.edit(embed = self.list_of_embeds[0], view = self)
-        await itx.response.send_message("You are on first page", ephemeral = True, delete_after = 1)
+        await self.show_page(itx, 1)
     
     @discord.ui.button(label = "Previous page", disabled = True, style = discord.ButtonStyle.blurple, custom_id = 'previous_page')
     async def previous_page(self, itx: discord.Interaction, button: discord.ui.Button):
-        
-        self.page_number -= 1
-
-        for child in self.children:
-            if child.custom_id == 'first_page' and self.page_number == 1:
-                child.disabled = True
-            elif child.custom_id == 'page_num':
-                child.label = f"{self.page_number}/{len(self.list_of_embeds)}"
-            else:
-                child.disabled = False
-        
-        if self.page_number == 1:
-            button.disabled = True
-
-        await self.msg.edit(embed = self.list_of_embeds[self.page_number - 1], view = self)
-        await itx.response.send_message(f"You are on page {self.page_number}", ephemeral = True, delete_after = 1)
+        await self.show_page(itx, self.page_number - 1)
 
     @discord.ui.button(label = "pg", disabled = True, style = discord.ButtonStyle.grey, custom_id = 'page_num')
     async def page_num(self, itx: discord.Interaction, button: discord.ui.Button):
@@ -69,39 +107,11 @@ class Paginator(discord.ui.View):
 
     @discord.ui.button(label = "Next page", style = discord.ButtonStyle.blurple, custom_id = 'next_page')
     async def next_page(self, itx: discord.Interaction, button: discord.ui.Button):
-        
-        self.page_number += 1
-
-        for child in self.children:
-            if child.custom_id == 'last_page' and self.page_number == len(self.list_of_embeds):
-                child.disabled = True
-            elif child.custom_id == 'page_num':
-                child.label = f"{self.page_number}/{len(self.list_of_embeds)}"
-            else:
-                child.disabled = False
-        
-        if self.page_number == len(self.list_of_embeds):
-            button.disabled = True
-
-        await self.msg.edit(embed = self.list_of_embeds[self.page_number - 1], view = self)
-        await itx.response.send_message(f"You are on page {self.page_number}", ephemeral = True, delete_after = 1)
+        await self.show_page(itx, self.page_number + 1)
 
     @discord.ui.button(label = "Last page", style = discord.ButtonStyle.blurple, custom_id = 'last_page')
     async def last_page(self, itx: discord.Interaction, button: discord.ui.Button):
-        self.page_number = len(self.list_of_embeds)
-
-        for child in self.children:
-            if child.custom_id == 'next_page':
-                child.disabled = True
-            elif child.custom_id == 'page_num':
-                child.label = f"{self.page_number}/{len(self.list_of_embeds)}"
-            else:
-                child.disabled = False
-        
-        button.disabled = True
-
-        await self.msg.edit(embed = self.list_of_embeds[self.page_number - 1], view = self)
-        await itx.response.send_message(f"You are on page {self.page_number}", ephemeral = True, delete_after = 1)
+        await self.show_page(itx, self.source.page_count)
 
 EMBED_COLOR = discord.Color.from_str("#9fca77")
 
@@ -141,19 +151,23 @@ until: datetime = None) -> discord.Embed:
 
     return dm_em
 
-def offence_embed_maker(action: str, action_past: str,  user: discord.Member | discord.User, mod: discord.Member, reason: str, sent: bool,
+def offence_embed_maker(action: str, action_past: str,  user: discord.Member | discord.User | discord.Object, mod: discord.Member, reason: str, sent: bool | None,
 until: datetime = None) -> discord.Embed:
+    # users that are not cached (from mass actions) are only known by ID
+    user_text = f"{user} (ID: {user.id})" if not isinstance(user, discord.Object) else f"ID: {user.id}"
+
     em = discord.Embed(color = EMBED_COLOR, title = f"Moderator Action: ` {action} `",
-    description = f"User **`{user} (ID: {user.id})`** has been {action_past}.\n**Reason:** {reason}")
+    description = f"User **`{user_text}`** has been {action_past}.\n**Reason:** {reason}")
 
     em.set_author(name = str(mod), icon_url = mod.display_avatar.url)
     
     if until is not None:
-        em.description = f"""User **`{user} (ID: {user.id})`** has been {action_past}.
+        em.description = f"""User **`{user_text}`** has been {action_past}.
 **Ends {discord.utils.format_dt(until,'R')}**
 **Reason:** {reason}"""
 
-    em.set_footer(text = f"DM to the user {'has been sent' if sent else 'could not be sent'}")
+    # None while the DM is still in the outbox
+    em.set_footer(text = dm_footer(sent))
 
     return em
 
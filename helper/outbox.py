@@ -0,0 +1,93 @@
+import asyncio
+import sys
+import traceback
+import discord
+
+"""
+Background delivery of moderation DMs, so a slow or closed DM channel does not hold up the action or the reply.
+`send` queues the DM and returns a future that resolves to whether it was delivered; `report` edits the
+moderator's response embed once it resolves. Each attempt has its own timeout. Rate limited and server error
+attempts are retried a bounded number of times; others fail at once, and a timed out one is dropped, since it
+may have been delivered.
+"""
+
+WORKERS = 4
+RETRIES = 2
+TIMEOUT = 5
+MAX_QUEUED = 1000
+
+def dm_footer(sent: bool | None) -> str:
+    if sent is None:
+        return "DM to the user is being sent"
+    return f"DM to the user {'has been sent' if sent else 'could not be sent'}"
+
+class DMOutbox:
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize = MAX_QUEUED)
+        self._workers = []
+        self._reports = set()
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._work()) for _ in range(WORKERS)]
+
+    def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+
+    def send(self, user: discord.abc.User, embed: discord.Embed) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+
+        try:
+            self.queue.put_nowait((user, embed, future))
+        except asyncio.QueueFull:
+            future.set_result(False)
+
+        return future
+
+    def report(self, future: asyncio.Future, message: discord.Message | None, embed: discord.Embed):
+        """Sets the embed's footer to the DM's result and edits the message with it, once the DM is done"""
+        if message is None:
+            return
+
+        task = asyncio.create_task(self._report(future, message, embed))
+        self._reports.add(task)
+        task.add_done_callback(self._reports.discard)
+
+    async def _report(self, future: asyncio.Future, message: discord.Message, embed: discord.Embed):
+        embed.set_footer(text = dm_footer(await asyncio.shield(future)))
+
+        try:
+            await message.edit(embed = embed)
+        except discord.HTTPException:
+            pass
+
+    async def _work(self):
+        while True:
+            user, embed, future = await self.queue.get()
+
+            try:
+                sent = await self._deliver(user, embed)
+            except Exception as error:
+                sent = False
+                traceback.print_exception(type(error), error, error.__traceback__, file = sys.stderr)
+
+            if not future.done():
+                future.set_result(sent)
+
+    async def _deliver(self, user: discord.abc.User, embed: discord.Embed) -> bool:
+        for attempt in range(RETRIES + 1):
+            try:
+                await asyncio.wait_for(user.send(embed = embed), TIMEOUT)
+                return True
+            except asyncio.TimeoutError:
+                # the DM may have gone through anyway, and sending it again could send it twice
+                print(f'DM to user {user.id} timed out, not retrying', file = sys.stderr)
+                return False
+            except discord.HTTPException as error:
+                # only rate limits and Discord's own errors are worth retrying; DMs closed (403) and the like are not
+                if error.status != 429 and error.status < 500:
+                    return False
+                if attempt < RETRIES:
+                    await asyncio.sleep(2 ** attempt)
+
+        return False
@@ -0,0 +1,36 @@
+from os import getenv
+
+"""
+warns and offences are range partitioned by month of created_on (migration 7), as {table}_YYYY_MM. Queries still
+name the parent tables, so the layout only matters here. A row with no partition to go in cannot be inserted, so every
+cluster runs `ensure` at startup and `maintain` daily from the moderation task, keeping the next MONTHS_AHEAD months
+of partitions created. The database functions take a lock, so clusters doing this at once wait for each other.
+
+With MODLOG_RETENTION_MONTHS set, partitions older than that many months are detached and moved to the
+modlog_archive schema. Archived warns and offences are no longer shown or exported, and no longer count towards
+points: the balances of the users with archived warns are recomputed without them. Dump or drop the archived tables by hand.
+"""
+
+PARTITIONED = ['warns', 'offences']
+MONTHS_AHEAD = 3
+RETENTION_MONTHS = int(getenv("MODLOG_RETENTION_MONTHS", 0)) # 0 keeps everything attached
+
+async def ensure(db) -> list:
+    """Creates the partitions for this month and the next MONTHS_AHEAD months that are missing. Returns those created"""
+    created = []
+
+    for table in PARTITIONED:
+        created += [record[0] for record in await db.fetch('partitions_create', table, MONTHS_AHEAD)]
+
+    return created
+
+async def maintain(db) -> tuple:
+    """Creates upcoming partitions and archives expired ones. Returns (partitions created, partitions archived)"""
+    created = await ensure(db)
+    archived = []
+
+    if RETENTION_MONTHS > 0:
+        for table in PARTITIONED:
+            archived += [record[0] for record in await db.fetch('partitions_archive', table, RETENTION_MONTHS)]
+
+    return created, archived
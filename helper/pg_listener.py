@@ -0,0 +1,105 @@
+import asyncio
+import asyncpg
+import traceback, sys
+
+class PGListener:
+    """
+    Holds a single dedicated connection for postgres LISTEN/NOTIFY.
+    Callbacks are coroutine functions that receive the notification payload (str)
+    """
+    def __init__(self, pool: asyncpg.Pool):
+        self.pool = pool
+        self.conn = None
+        self.callbacks = {} # {channel: [callback]}
+        self.reconnect_callbacks = []
+        self._closed = False
+        # LISTEN runs on the one connection, which cannot run two operations at once
+        self._lock = asyncio.Lock()
+        self._tasks = set() # callbacks and reconnects in progress, kept so they are not garbage collected
+
+    async def start(self):
+        async with self._lock:
+            self.conn = await self.pool.acquire()
+            self.conn.add_termination_listener(self._on_termination)
+
+            for channel in self.callbacks:
+                await self.conn.add_listener(channel, self._on_notification)
+
+    async def listen(self, channel: str, callback):
+        if channel not in self.callbacks:
+            self.callbacks[channel] = []
+            async with self._lock:
+                if self.conn is not None:
+                    await self.conn.add_listener(channel, self._on_notification)
+
+        self.callbacks[channel].append(callback)
+
+    def on_reconnect(self, callback):
+        """
+        Notifications sent while the connection was down are lost,
+        so anything caching data should reload fully here
+        """
+        self.reconnect_callbacks.append(callback)
+
+    async def notify(self, channel: str, payload: str):
+        await self.pool.execute("SELECT pg_notify($1, $2)", channel, payload)
+
+    async def close(self):
+        self._closed = True
+        if self.conn is None:
+            return
+        try:
+            await self.pool.release(self.conn)
+        except:
+            pass
+        self.conn = None
+
+    def _on_notification(self, conn, pid, channel, payload):
+        for callback in self.callbacks.get(channel, []):
+            self._start(self._run(callback, payload))
+
+    def _on_termination(self, conn):
+        if not self._closed:
+            self._start(self._reconnect())
+
+    def _start(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+
+        if not task.cancelled() and task.exception() is not None:
+            error = task.exception()
+            print('Ignoring exception in listener task:', file=sys.stderr)
+            traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+
+    async def _run(self, callback, *args):
+        try:
+            await callback(*args)
+        except Exception as error:
+            print('Ignoring exception in listener callback {}:'.format(callback), file=sys.stderr)
+            traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+
+    async def _drop_connection(self):
+        try:
+            await self.pool.release(self.conn)
+        except:
+            pass
+        self.conn = None
+
+    async def _reconnect(self):
+        await self._drop_connection()
+
+        while not self._closed:
+            try:
+                await self.start()
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                await self._drop_connection()
+                await asyncio.sleep(5)
+            else:
+                break
+
+        for callback in self.reconnect_callbacks:
+            await self._run(callback)
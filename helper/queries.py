@@ -0,0 +1,317 @@
+import asyncpg
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+"""
+Every query the bot runs at runtime, by name.
+Database prepares all of them once per connection (through the pool's init hook) and keeps call counts and latencies per query.
+Tables and indexes are created by helper.migrations.
+"""
+
+QUERIES = {
+    # GUILD TABLE
+    'guild_table_all': "SELECT * FROM guild_table",
+    'guild_table_get': "SELECT * FROM guild_table WHERE guild_id = $1",
+    'guild_insert': "INSERT INTO guild_table (guild_id) VALUES ($1) ON CONFLICT DO NOTHING",
+    'guild_set_prefix': "UPDATE guild_table SET prefix = $1 WHERE guild_id = $2",
+    'guild_set_blacklist': "UPDATE guild_table SET blacklisted_channels = $1 WHERE guild_id = $2",
+    'guild_set_offence_message': "UPDATE guild_table SET offence_message = $1 WHERE guild_id = $2",
+    'guild_set_modlog': "UPDATE guild_table SET modlog_channel = $1 WHERE guild_id = $2",
+
+    # VERIFICATION / JOIN ROLES
+    'join_stats_all': "SELECT * FROM join_stats",
+    'join_stats_get': "SELECT * FROM join_stats WHERE guild_id = $1",
+    'join_stats_insert': "INSERT INTO join_stats (guild_id) VALUES ($1) ON CONFLICT DO NOTHING",
+    'join_stats_set_verification': "UPDATE join_stats SET verify_role = $1, verify_channel = $2, verify_message = $3 WHERE guild_id = $4",
+    'join_stats_clear_verification': "UPDATE join_stats SET verify_role = NULL, verify_channel = NULL, verify_message = NULL WHERE guild_id = $1",
+    'join_stats_clear_joinroles': "UPDATE join_stats SET join_role_u = NULL, join_role_b = NULL WHERE guild_id = $1",
+    'join_stats_set_user_role': "UPDATE join_stats SET join_role_u = $1 WHERE guild_id = $2",
+    'join_stats_set_bot_role': "UPDATE join_stats SET join_role_b = $1 WHERE guild_id = $2",
+
+    # RAID DETECTION (see helper.raid)
+    'raid_settings_all': "SELECT * FROM raid_settings",
+    'raid_settings_get': "SELECT * FROM raid_settings WHERE guild_id = $1",
+    'raid_settings_set': """INSERT INTO raid_settings (guild_id, joins, seconds, account_age, action, alert_channel) VALUES ($1,$2,$3,$4,$5,$6)
+        ON CONFLICT (guild_id) DO UPDATE SET joins = EXCLUDED.joins, seconds = EXCLUDED.seconds, account_age = EXCLUDED.account_age,
+        action = EXCLUDED.action, alert_channel = EXCLUDED.alert_channel""",
+    'raid_settings_delete': "DELETE FROM raid_settings WHERE guild_id = $1",
+
+    # WARNS: THRESHOLD PUNISHMENTS
+    'thresholds_by_guild': "SELECT * FROM autopunishments WHERE guild_id = $1 ORDER BY points ASC",
+    'thresholds_exist': "SELECT EXISTS (SELECT 1 FROM autopunishments WHERE guild_id = $1)",
+    'threshold_ban': "SELECT * FROM autopunishments WHERE guild_id = $1 AND p_type = 'ban'",
+    'threshold_insert': "INSERT INTO autopunishments (guild_id, points, p_type, timer) VALUES ($1,$2,$3,$4)",
+    'threshold_delete': "DELETE FROM autopunishments WHERE id = $1",
+
+    # WARNS: WARN REASON AUTOCOMPLETES
+    'autocompletes_by_guild': "SELECT * FROM autocompletes WHERE guild_id = $1",
+    'autocompletes_exist': "SELECT EXISTS (SELECT 1 FROM autocompletes WHERE guild_id = $1)",
+    'autocompletes_count': "SELECT COUNT(*) FROM autocompletes WHERE guild_id = $1",
+    'autocomplete_insert': "INSERT INTO autocompletes (guild_id, points, reason) VALUES ($1,$2,$3)",
+    'autocomplete_delete': "DELETE FROM autocompletes WHERE id = $1",
+
+    # POLLS
+    'poll_get': "SELECT * FROM poll_table WHERE id = $1",
+    'poll_get_by_message': "SELECT * FROM poll_table WHERE message_id = $1",
+    'poll_insert': """INSERT INTO poll_table (creator_id, poll_options, multi_option, option_votes, used_users)
+        VALUES ($1,$2,$3,$4,$5) RETURNING id""",
+    'poll_set_message': "UPDATE poll_table SET message_id = $1 WHERE id = $2",
+    'poll_vote': "UPDATE poll_table SET option_votes = $1, used_users = $2 WHERE id = $3",
+    'poll_delete': "DELETE FROM poll_table WHERE id = $1",
+
+    # TAGS
+    'tags_names': "SELECT tag_name, aliases FROM tags WHERE guild_id = $1",
+    'tags_by_guild': "SELECT * FROM tags WHERE guild_id = $1",
+    'tag_get': "SELECT * FROM tags WHERE tag_name = $1 AND guild_id = $2",
+    # the alias check is written as containment so the GIN index on aliases can be used
+    'tag_lookup': "SELECT * FROM tags WHERE guild_id = $1 AND (tag_name = $2 OR aliases @> ARRAY[$2]::varchar(255)[])",
+    'tag_lookup_body': "SELECT body FROM tags WHERE guild_id = $1 AND (tag_name = $2 OR aliases @> ARRAY[$2]::varchar(255)[])",
+    'tag_insert': "INSERT INTO tags (guild_id, tag_name, body, created_by, created_on, aliases) VALUES ($1,$2,$3,$4,$5,$6)",
+    'tag_set_body': "UPDATE tags SET body = $1 WHERE id = $2",
+    'tag_set_aliases': "UPDATE tags SET aliases = $1 WHERE id = $2",
+    'tag_set_owner': "UPDATE tags SET created_by = $1 WHERE id = $2",
+    'tag_delete': "DELETE FROM tags WHERE id = $1",
+    'tags_delete_by_user': "DELETE FROM tags WHERE created_by = $1 AND guild_id = $2",
+
+    # BANNED USERS
+    # timed bans ending by $1, in guilds on shards $3 of $2 (see helper.unbans)
+    'banned_due': """SELECT * FROM banned_users WHERE wait_until <= $1 AND (guild_id >> 22) % $2 = ANY($3::int[])
+        ORDER BY wait_until""",
+    'banned_insert': "INSERT INTO banned_users (user_id, guild_id, wait_until) VALUES ($1,$2,$3) RETURNING id",
+    'banned_delete': "DELETE FROM banned_users WHERE id = $1",
+    'banned_delete_user': "DELETE FROM banned_users WHERE user_id = $1 AND guild_id = $2",
+    'banned_delete_users': "DELETE FROM banned_users WHERE user_id = ANY($1::bigint[]) AND guild_id = $2",
+
+    # WARNS LOGGING
+    # pages of a user's warns (see helper.history): the page after an id, or before it in reverse
+    'warns_count': "SELECT COUNT(*) FROM warns WHERE guild_id = $1 AND user_id = $2",
+    'warns_page_after': "SELECT * FROM warns WHERE guild_id = $1 AND user_id = $2 AND id > $3 ORDER BY id ASC LIMIT $4",
+    'warns_page_before': "SELECT * FROM warns WHERE guild_id = $1 AND user_id = $2 AND id < $3 ORDER BY id DESC LIMIT $4",
+
+    # WARN BALANCES (see helper.warn_points)
+    'warn_balance_get': "SELECT points FROM warn_balances WHERE guild_id = $1 AND user_id = $2",
+    'warns_expire': "SELECT expire_warns($1, $2)",
+    'warn_balances_decay': "SELECT decay_balances($1)",
+    'warn_balances_restart_decay': "UPDATE warn_balances SET decayed_on = $2 WHERE guild_id = $1",
+    'warn_decay_get': "SELECT * FROM warn_decay WHERE guild_id = $1",
+    'warn_decay_set': """INSERT INTO warn_decay (guild_id, expire_days, monthly_points) VALUES ($1,$2,$3)
+        ON CONFLICT (guild_id) DO UPDATE SET expire_days = EXCLUDED.expire_days, monthly_points = EXCLUDED.monthly_points""",
+    'warn_decay_delete': "DELETE FROM warn_decay WHERE guild_id = $1",
+    # one call each for warn, pardon and delwarn; the functions are defined in migration 5
+    'warn_user': "SELECT * FROM warn_user($1,$2,$3,$4,$5,$6)",
+    'pardon_user': "SELECT * FROM pardon_user($1,$2,$3,$4,$5,$6)",
+    'delete_warn': "SELECT * FROM delete_warn($1,$2)",
+    # the same warn for many users (masswarn), in one transaction: the balance rows are locked first, in user ID order,
+    # as warn_user locks them before the warns, so concurrent warns cannot deadlock; user IDs must be distinct
+    'warn_balances_lock_many': """INSERT INTO warn_balances (guild_id, user_id)
+        SELECT $1, user_id FROM unnest($2::bigint[]) AS user_id ORDER BY user_id
+        ON CONFLICT (guild_id, user_id) DO UPDATE SET points = warn_balances.points""",
+    'warns_insert_many': """WITH inserted AS (
+            INSERT INTO warns (guild_id, user_id, body, points, created_by, created_on)
+            SELECT $1, user_id, $3, $4, $5, $6 FROM unnest($2::bigint[]) AS user_id RETURNING user_id
+        )
+        UPDATE warn_balances b SET points = GREATEST(b.points + $4, 0),
+        decayed_on = CASE WHEN b.points = 0 THEN $6 ELSE b.decayed_on END
+        FROM inserted WHERE b.guild_id = $1 AND b.user_id = inserted.user_id""",
+
+    # OFFENCE LOGGING
+    'offence_insert': """INSERT INTO offences (guild_id, user_id, punishment, body, created_by, created_on, autopunishment_id, threshold_points)
+        VALUES ($1,$2,$3,$4,$5,$6,$7,$8) RETURNING id""",
+    'offence_delete': "DELETE FROM offences WHERE id = $1",
+    'offences_count': "SELECT COUNT(*) FROM offences WHERE guild_id = $1 AND user_id = $2",
+    'offences_page_after': "SELECT * FROM offences WHERE guild_id = $1 AND user_id = $2 AND id > $3 ORDER BY id ASC LIMIT $4",
+    'offences_page_before': "SELECT * FROM offences WHERE guild_id = $1 AND user_id = $2 AND id < $3 ORDER BY id DESC LIMIT $4",
+
+    # MODLOG PARTITIONS (see helper.partitions)
+    'partitions_create': "SELECT create_month_partitions($1, now(), now() + make_interval(months => $2))",
+    'partitions_archive': "SELECT archive_month_partitions($1, now() - make_interval(months => $2))",
+
+    # CLUSTER HEARTBEATS
+    'cluster_heartbeat': """INSERT INTO cluster_status (cluster_id, shard_ids, guilds, latencies, updated_on) VALUES ($1,$2,$3,$4,$5)
+        ON CONFLICT (cluster_id) DO UPDATE SET shard_ids = EXCLUDED.shard_ids, guilds = EXCLUDED.guilds,
+        latencies = EXCLUDED.latencies, updated_on = EXCLUDED.updated_on""",
+    'cluster_status_all': "SELECT * FROM cluster_status ORDER BY cluster_id",
+
+    # MARKOV TRIGRAM LOGGER
+    'markov_get': "SELECT * FROM markov_table WHERE guild_id = $1",
+    'markov_exists': "SELECT EXISTS (SELECT 1 FROM markov_table WHERE guild_id = $1)",
+    'markov_insert': "INSERT INTO markov_table (guild_id, channel_id) VALUES ($1, $2)",
+    'markov_set_channel': "UPDATE markov_table SET channel_id = $1 WHERE guild_id = $2",
+    'markov_set_trigrams': "UPDATE markov_table SET trigrams = $1 WHERE guild_id = $2",
+}
+
+class BotConnection(asyncpg.Connection):
+    # asyncpg.Connection uses __slots__; this subclass does not, so the prepared statements can be kept on the connection
+    pass
+
+class QueryStats:
+    def __init__(self, samples: int = 1000):
+        self.calls = 0
+        self.errors = 0
+        self.latencies = deque(maxlen = samples) # seconds, most recent calls only
+
+    def percentile(self, percent: float) -> float | None:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+class Database:
+    """
+    Runs the named queries in QUERIES.
+    Pass `conn` to run on an acquired connection (e.g. inside a transaction), otherwise one is taken from the pool.
+    """
+    def __init__(self):
+        self.pool = None
+        self.stats = {name: QueryStats() for name in QUERIES}
+        self.on_acquire = None # called with the seconds waited for a pool connection
+
+    async def create_pool(self, **kwargs) -> asyncpg.Pool:
+        self.pool = await asyncpg.create_pool(connection_class = BotConnection, init = self.init_connection, **kwargs)
+        return self.pool
+
+    async def init_connection(self, conn: BotConnection):
+        conn.statements = {}
+
+        for name in QUERIES:
+            try:
+                await self.prepare(conn, name)
+            except asyncpg.UndefinedTableError:
+                # before dbsetup has been run; prepared when first used instead
+                pass
+
+    async def prepare(self, conn: BotConnection, name: str) -> asyncpg.prepared_stmt.PreparedStatement:
+        statement = await conn.prepare(QUERIES[name])
+        conn.statements[name] = statement
+        return statement
+
+    async def fetch(self, name: str, *args, conn: BotConnection = None) -> list:
+        return await self._run(name, 'fetch', args, conn)
+
+    async def fetchrow(self, name: str, *args, conn: BotConnection = None) -> asyncpg.Record | None:
+        return await self._run(name, 'fetchrow', args, conn)
+
+    async def fetchval(self, name: str, *args, conn: BotConnection = None):
+        return await self._run(name, 'fetchval', args, conn)
+
+    async def execute(self, name: str, *args, conn: BotConnection = None) -> str:
+        return await self._run(name, 'execute', args, conn)
+
+    async def executemany(self, name: str, args: list, conn: BotConnection = None):
+        return await self._run(name, 'executemany', (args,), conn)
+
+    async def copy_records(self, table: str, columns: list, records: list, conn: BotConnection = None) -> str:
+        """COPYs rows into a table, for batches too large to insert a row at a time. Recorded as `copy {table}`"""
+        if conn is None:
+            async with self.transaction() as conn:
+                return await self.copy_records(table, columns, records, conn = conn)
+
+        stats = self.stats.setdefault(f'copy {table}', QueryStats())
+        stats.calls += 1
+        start = time.perf_counter()
+
+        try:
+            return await conn.copy_records_to_table(table, records = records, columns = columns)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.latencies.append(time.perf_counter() - start)
+
+    async def copy_query(self, name: str, query: str, *args, output, conn: BotConnection = None, **options) -> str:
+        """COPYs a query's rows out, passing each chunk of output to `output`. Recorded as `copy {name}`"""
+        if conn is None:
+            start = time.perf_counter()
+
+            async with self.pool.acquire() as conn:
+                if self.on_acquire is not None:
+                    self.on_acquire(time.perf_counter() - start)
+
+                return await self.copy_query(name, query, *args, output = output, conn = conn, **options)
+
+        stats = self.stats.setdefault(f'copy {name}', QueryStats())
+        stats.calls += 1
+        start = time.perf_counter()
+
+        try:
+            return await conn.copy_from_query(query, *args, output = output, **options)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.latencies.append(time.perf_counter() - start)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Acquires a connection and starts a transaction on it. Pass the connection to the query methods as `conn`"""
+        start = time.perf_counter()
+
+        async with self.pool.acquire() as conn:
+            if self.on_acquire is not None:
+                self.on_acquire(time.perf_counter() - start)
+
+            async with conn.transaction():
+                yield conn
+
+    async def _run(self, name: str, method: str, args: tuple, conn: BotConnection | None):
+        if conn is not None:
+            return await self._run_on(conn, name, method, args)
+
+        start = time.perf_counter()
+
+        async with self.pool.acquire() as conn:
+            if self.on_acquire is not None:
+                self.on_acquire(time.perf_counter() - start)
+
+            return await self._run_on(conn, name, method, args)
+
+    async def _run_on(self, conn: BotConnection, name: str, method: str, args: tuple):
+        stats = self.stats[name]
+        stats.calls += 1
+        start = time.perf_counter()
+
+        try:
+            try:
+                return await self._call(conn, name, method, args)
+
+            except (asyncpg.InvalidCachedStatementError, asyncpg.OutdatedSchemaCacheError):
+                # the table changed since the statement was prepared. Inside a transaction
+                # the error has already aborted it, so it can only be retried outside of one
+                if conn.is_in_transaction():
+                    raise
+                await self.prepare(conn, name)
+                return await self._call(conn, name, method, args)
+
+        except Exception:
+            stats.errors += 1
+            raise
+
+        finally:
+            stats.latencies.append(time.perf_counter() - start)
+
+    async def _call(self, conn: BotConnection, name: str, method: str, args: tuple):
+        statement = conn.statements.get(name)
+
+        if statement is None:
+            statement = await self.prepare(conn, name)
+
+        # prepared statements have no execute(); fetch and return the status like Connection.execute does
+        if method == 'execute':
+            await statement.fetch(*args)
+            return statement.get_statusmsg()
+
+        return await getattr(statement, method)(*args)
+
+    def report(self) -> list:
+        """Per query stats, slowest p95 first, for queries that have been called"""
+        rows = []
+        for name, stats in self.stats.items():
+            if stats.calls == 0:
+                continue
+            rows.append({
+                'name': name, 'calls': stats.calls, 'errors': stats.errors,
+                'p50': stats.percentile(50), 'p95': stats.percentile(95), 'p99': stats.percentile(99)
+            })
+
+        return sorted(rows, key = lambda row: row['p95'] or 0, reverse = True)
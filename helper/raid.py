@@ -0,0 +1,148 @@
+import asyncio
+import sys
+import time
+import traceback
+import discord
+from collections import deque
+from datetime import timedelta
+from discord.ext import commands
+
+"""
+Join-rate raid detection. For each guild with raid settings (`set raid`), the last `joins` counted joins are kept
+in a ring buffer; a raid is when they all happened within `seconds`. Only accounts younger than `account_age` days
+are counted, when that is set. Each join costs a cache lookup and a deque append, and memory is bounded by
+MAX_JOINS per configured guild.
+
+Actions, each also sending an alert to the alert channel:
+alert - only the alert
+verify - raid joiners get the verification role (`set verification`), as every new member does during the raid
+lockdown - invites are paused and @everyone cannot send messages, until `endraid`
+"""
+
+MAX_JOINS = 50
+# a raid lasts until nobody counted has joined for this long
+RAID_QUIET = 300
+EMBED_COLOR = discord.Color.from_str('#e27a7a')
+
+class RaidDetector:
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.joins = {} # {guild_id: deque of (monotonic time, member ID)}
+        self.raids = {} # {guild_id: monotonic time of the last counted join}, for guilds in a raid
+        self.locked = {} # {guild_id: (@everyone permissions, invites disabled)} from before a lockdown
+        self._tasks = set()
+
+    def in_raid(self, guild_id: int) -> bool:
+        last_join = self.raids.get(guild_id)
+
+        if last_join is None:
+            return False
+        if time.monotonic() - last_join > RAID_QUIET:
+            del self.raids[guild_id]
+            return False
+        return True
+
+    def on_join(self, member: discord.Member) -> bool:
+        """Records the join. Returns whether the guild is in a raid"""
+        settings = self.bot.raid_cache.get(member.guild.id)
+
+        if settings is None or member.bot:
+            return False
+
+        if settings['account_age'] is not None and discord.utils.utcnow() - member.created_at > timedelta(days = settings['account_age']):
+            return self.in_raid(member.guild.id)
+
+        now = time.monotonic()
+        joins = self.joins.get(member.guild.id)
+        if joins is None or joins.maxlen != settings['joins']:
+            joins = self.joins[member.guild.id] = deque(joins or (), maxlen = settings['joins'])
+
+        joins.append((now, member.id))
+
+        if self.in_raid(member.guild.id):
+            self.raids[member.guild.id] = now
+            return True
+
+        if len(joins) == joins.maxlen and now - joins[0][0] <= settings['seconds']:
+            self.raids[member.guild.id] = now
+            self._start(self._raid_started(member.guild, settings, [member_id for _, member_id in joins]))
+            return True
+
+        return False
+
+    def end(self, guild_id: int):
+        self.raids.pop(guild_id, None)
+        self.joins.pop(guild_id, None)
+
+    async def lockdown(self, guild: discord.Guild):
+        """Pauses invites and stops @everyone from sending messages"""
+        self.locked.setdefault(guild.id, (guild.default_role.permissions, 'INVITES_DISABLED' in guild.features))
+
+        permissions = discord.Permissions(guild.default_role.permissions.value)
+        permissions.update(send_messages = False, send_messages_in_threads = False, create_public_threads = False, add_reactions = False)
+
+        await guild.default_role.edit(permissions = permissions, reason = "Raid lockdown")
+        await guild.edit(invites_disabled = True, reason = "Raid lockdown")
+
+    async def unlock(self, guild: discord.Guild) -> bool:
+        """Restores what lockdown changed. Returns False if the guild is not locked down"""
+        if guild.id not in self.locked:
+            return False
+
+        permissions, invites_disabled = self.locked.pop(guild.id)
+
+        await guild.default_role.edit(permissions = permissions, reason = "Raid lockdown lifted")
+        await guild.edit(invites_disabled = invites_disabled, reason = "Raid lockdown lifted")
+        return True
+
+    def _start(self, coro):
+        # joins are not held up by the alert and the lockdown
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _raid_started(self, guild: discord.Guild, settings, member_ids: list):
+        try:
+            if settings['action'] == 'verify':
+                await self._verify(guild, member_ids)
+            elif settings['action'] == 'lockdown':
+                await self.lockdown(guild)
+
+            await self._alert(guild, settings, len(member_ids))
+        except Exception as error:
+            print(f'Raid response in guild {guild.id} failed:', file = sys.stderr)
+            traceback.print_exception(type(error), error, error.__traceback__, file = sys.stderr)
+
+    async def _verify(self, guild: discord.Guild, member_ids: list):
+        """Moves the joins that set off the detector to verification"""
+        join_stats = self.bot.join_cache.get(guild.id)
+        if join_stats is None or join_stats['verify_role'] is None:
+            return
+
+        verify_role = guild.get_role(join_stats['verify_role'])
+        user_role = guild.get_role(join_stats['join_role_u']) if join_stats['join_role_u'] is not None else None
+
+        for member_id in member_ids:
+            member = guild.get_member(member_id)
+            if member is None or verify_role in member.roles:
+                continue
+
+            await member.add_roles(verify_role, reason = "Raid detected: verification pending")
+            if user_role is not None and user_role in member.roles:
+                await member.remove_roles(user_role, reason = "Raid detected: verification pending")
+
+    async def _alert(self, guild: discord.Guild, settings, joins: int):
+        channel = guild.get_channel(settings['alert_channel']) if settings['alert_channel'] is not None else None
+        if channel is None:
+            return
+
+        actions = {
+            'alert': "No action is taken.",
+            'verify': "New members are sent to verification until the raid ends.",
+            'lockdown': "Invites are paused and members cannot send messages. Use `endraid` to lift the lockdown."
+        }
+        em = discord.Embed(color = EMBED_COLOR, title = "Raid detected",
+        description = f"**{joins}** new members joined within {settings['seconds']} seconds.\n{actions[settings['action']]}")
+        em.set_footer(text = f"The raid ends after {RAID_QUIET // 60} minutes without joins, or with `endraid`")
+
+        await channel.send(embed = em)
@@ -0,0 +1,95 @@
+import asyncio
+import time
+import discord
+from collections import OrderedDict
+from discord.ext import commands
+
+"""
+User and member lookups shared by every cog, for IDs stored in the database (moderators, tag owners).
+The gateway cache is checked first; anything not in it is fetched once and kept in a small LRU,
+including IDs that were not found (deleted accounts, members who left), so they are not fetched again and again.
+Concurrent lookups of the same ID share one request.
+"""
+
+class _LRU:
+    def __init__(self, max_size: int, ttl: float, missing_ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl # shorter, since a missing member may join back
+        self.items = OrderedDict() # {key: (expires, value or None if not found)}
+
+    def get(self, key):
+        """Returns (found in cache, value)"""
+        item = self.items.get(key)
+        if item is None:
+            return False, None
+
+        if item[0] < time.monotonic():
+            del self.items[key]
+            return False, None
+
+        self.items.move_to_end(key)
+        return True, item[1]
+
+    def put(self, key, value):
+        ttl = self.ttl if value is not None else self.missing_ttl
+        self.items[key] = (time.monotonic() + ttl, value)
+        self.items.move_to_end(key)
+
+        while len(self.items) > self.max_size:
+            self.items.popitem(last = False)
+
+class Resolver:
+    def __init__(self, bot: commands.Bot, max_size: int = 4096, ttl: float = 3600, missing_ttl: float = 600):
+        self.bot = bot
+        self.users = _LRU(max_size, ttl, missing_ttl)
+        self.members = _LRU(max_size, ttl / 6, missing_ttl / 6)
+        self._pending = {} # {key: Task}, so concurrent lookups of an ID share the request
+
+    async def _lookup(self, cache: _LRU, key, fetch):
+        found, value = cache.get(key)
+        if found:
+            return value
+
+        task = self._pending.get(key)
+        if task is None:
+            task = self._pending[key] = asyncio.create_task(self._fetch(cache, key, fetch))
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+
+        return await asyncio.shield(task)
+
+    async def _fetch(self, cache: _LRU, key, fetch):
+        try:
+            value = await fetch()
+        except discord.NotFound:
+            value = None
+
+        # other HTTP errors propagate without being cached
+        cache.put(key, value)
+        return value
+
+    async def user(self, user_id: int) -> discord.User | None:
+        """None if there is no such user"""
+        user = self.bot.get_user(user_id)
+        if user is not None:
+            return user
+
+        return await self._lookup(self.users, ('user', user_id), lambda: self.bot.fetch_user(user_id))
+
+    async def fetch_users(self, user_ids) -> dict:
+        """Looks up the distinct IDs concurrently. Returns {user ID: user or None}"""
+        user_ids = set(user_ids)
+        users = await asyncio.gather(*[self.user(user_id) for user_id in user_ids])
+        return dict(zip(user_ids, users))
+
+    async def member(self, guild: discord.Guild, user_id: int) -> discord.Member | None:
+        """None if the user is not in the guild"""
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member
+
+        return await self._lookup(self.members, ('member', guild.id, user_id), lambda: guild.fetch_member(user_id))
+
+def mention(user: discord.abc.User | None, user_id: int) -> str:
+    """The user's mention, or their ID if the account could not be found"""
+    return user.mention if user is not None else f"`{user_id}` (deleted)"
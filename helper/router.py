@@ -0,0 +1,55 @@
+import discord
+from discord.ext import commands
+import traceback, sys
+from helper import poll_views, join_view
+
+"""
+Routes component interactions by custom_id, in place of one persistent View per message.
+custom_ids are ':' separated, the first part picks the handler and the rest is passed to it,
+e.g. 'poll:12:vote:3' calls poll_views.dispatch(bot, itx, ['12', 'vote', '3'])
+"""
+
+ROUTES = {
+    'poll': poll_views.dispatch,
+    'verify': join_view.dispatch
+}
+
+# custom_ids used by messages sent before routing, which carry no poll ID
+LEGACY_IDS = {
+    'result': ['poll', '', 'result'],
+    'end_poll': ['poll', '', 'end'],
+    'verify_here': ['verify', 'here']
+}
+
+def parse_custom_id(custom_id: str) -> list:
+    if custom_id in LEGACY_IDS:
+        return LEGACY_IDS[custom_id]
+
+    if custom_id.startswith('option_') and custom_id[7:].isnumeric():
+        return ['poll', '', 'vote', custom_id[7:]]
+
+    return custom_id.split(':')
+
+class ComponentRouter(commands.Cog, command_attrs = dict(hidden = True)):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    @commands.Cog.listener()
+    async def on_interaction(self, itx: discord.Interaction):
+        if itx.type != discord.InteractionType.component or itx.data is None:
+            return
+
+        parts = parse_custom_id(itx.data.get('custom_id', ''))
+        handler = ROUTES.get(parts[0])
+
+        if handler is None:
+            return
+
+        try:
+            await handler(self.bot, itx, parts[1:])
+        except Exception as error:
+            print('Ignoring exception in component {}:'.format(itx.data.get('custom_id')), file=sys.stderr)
+            traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+
+async def setup(bot: commands.Bot) -> None:
+    await bot.add_cog(ComponentRouter(bot))
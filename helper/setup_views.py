@@ -1,6 +1,6 @@
 import discord
 from discord.ext.commands import Bot
-from asyncpg import Connection
+from helper.queries import Database
 import traceback, sys
 from datetime import timedelta
 from helper.other import TimeParser
@@ -12,10 +12,10 @@ EMBED_COLOR = discord.Color.from_str("#9fca77")
 # ADDITIONAL MESSAGE VIEWS
 
 class AdditionalMessage(discord.ui.View):
-    def __init__(self, author: discord.Member, pool):
+    def __init__(self, author: discord.Member, bot: Bot):
         super().__init__(timeout = 300)
         self.author = author
-        self.pool = pool
+        self.bot = bot
     
     async def on_timeout(self) -> None:
         for child in self.children:
@@ -34,15 +34,15 @@ class AdditionalMessage(discord.ui.View):
     
     @discord.ui.button(label = "Set message", style = discord.ButtonStyle.green)
     async def set_message(self, itx: discord.Interaction, button: discord.ui.Button):
-        await itx.response.send_modal(AdditionalMessageModal(self.pool, self.msg))
+        await itx.response.send_modal(AdditionalMessageModal(self.bot, self.msg))
 
 class AdditionalMessageModal(discord.ui.Modal):
-    def __init__(self, pool, msg: discord.Message) -> None:
+    def __init__(self, bot: Bot, msg: discord.Message) -> None:
         super().__init__(title = "Set additional message", timeout = 300)
         self.message = discord.ui.TextInput(label = "Enter here", style = discord.TextStyle.long, placeholder = "Leave empty to remove message",
         required = False, max_length = 1024)
         self.add_item(self.message)
-        self.pool = pool
+        self.bot = bot
         self.msg = msg
 
     async def on_submit(self, itx: discord.Interaction, /):
@@ -51,7 +51,8 @@ class AdditionalMessageModal(discord.ui.Modal):
         else:
             offence_message = self.message.value.strip()
         
-        await self.pool.execute("UPDATE guild_table SET offence_message = $1 WHERE guild_id = $2", offence_message, itx.guild.id)
+        await self.bot.db.execute('guild_set_offence_message', offence_message, itx.guild.id)
+        await self.bot.guild_cache.refresh(itx.guild.id)
 
         if offence_message is None:
             await itx.response.send_message("Removed additional message.", ephemeral = True)
@@ -67,10 +68,10 @@ class AdditionalMessageModal(discord.ui.Modal):
 # VERIFICATION SETUP VIEW
 
 class VerificationView(discord.ui.View):
-    def __init__(self, author: discord.Member, pool, cancel_button_disabled: bool):
+    def __init__(self, author: discord.Member, bot: Bot, cancel_button_disabled: bool):
         super().__init__(timeout = 300)
         self.author = author
-        self.pool = pool
+        self.bot = bot
         self.cancel_button_disabled = cancel_button_disabled
 
         self.remove_verification.disabled = self.cancel_button_disabled
@@ -96,7 +97,7 @@ class VerificationView(discord.ui.View):
     @discord.ui.button(label = "Create channel (and role if not found)")
     async def create_channel(self, itx: discord.Interaction, button: discord.ui.Button):
         await itx.response.defer(ephemeral = True, thinking = True)
-        role_id = await self.pool.fetchval("SELECT verify_role FROM join_stats WHERE guild_id = $1", itx.guild.id)
+        role_id = self.bot.join_cache.get_value(itx.guild.id, 'verify_role')
         
         if role_id is not None:
             role = itx.guild.get_role(role_id)
@@ -124,12 +125,13 @@ class VerificationView(discord.ui.View):
         em = discord.Embed(color = EMBED_COLOR, title = "Verify by clicking the button",
         description = "Click the button, then enter the code you see in the new message.")
 
-        view = VerifyMessageView(self.pool)
+        view = VerifyMessageView()
 
         msg = await channel.send(embed = em, view = view)
+        view.stop()
 
-        await self.pool.execute("UPDATE join_stats SET verify_role = $1, verify_channel = $2, verify_message = $3 WHERE guild_id = $4",
-        role.id, channel.id, msg.id, itx.guild.id)
+        await self.bot.db.execute('join_stats_set_verification', role.id, channel.id, msg.id, itx.guild.id)
+        await self.bot.join_cache.refresh(itx.guild.id)
 
         self.msg.embeds[0].description = f"Channel: {channel.mention}\nRole used: {role.mention}"
         
@@ -143,9 +145,10 @@ class VerificationView(discord.ui.View):
 
     @discord.ui.button(label = "Remove verification", style = discord.ButtonStyle.red)
     async def remove_verification(self, itx: discord.Interaction, button: discord.ui.Button):
-        record = await self.pool.fetchrow("SELECT * FROM join_stats WHERE guild_id = $1", itx.guild_id)
+        record = self.bot.join_cache.get(itx.guild_id)
         
-        await self.pool.execute("UPDATE join_stats SET verify_role = $1, verify_channel = $1, verify_message = $1 where guild_id = $2", None, itx.guild_id)
+        await self.bot.db.execute('join_stats_clear_verification', itx.guild_id)
+        await self.bot.join_cache.refresh(itx.guild_id)
 
         try:
             role = itx.guild.get_role(record['verify_role'])
@@ -194,19 +197,18 @@ class WarnView(discord.ui.View):
 
     @discord.ui.button(label="Add threshold",style=discord.ButtonStyle.blurple,row=0)
     async def addt(self,itx:discord.Interaction,button:discord.ui.Button):
-        thresholds = await self.bot.pool.fetch("SELECT * FROM autopunishments WHERE guild_id=$1",itx.guild.id)
+        thresholds = await self.bot.db.fetch('thresholds_by_guild', itx.guild.id)
         if len(thresholds)>=10:
             return await itx.response.send_message("You can only have 10 thresholds maximum.",ephemeral=True)
-        await itx.response.send_modal(AddThreshold(self.bot.pool,self.msg,self.field_0,self.field_1))
+        await itx.response.send_modal(AddThreshold(self.bot.db,self.msg,self.field_0,self.field_1))
 
 
     @discord.ui.button(label="Remove threshold",style=discord.ButtonStyle.blurple,row=0)
     async def removet(self,itx:discord.Interaction,button:discord.ui.Button):
-        if await self.bot.pool.fetchval("SELECT EXISTS (SELECT 1 FROM autopunishments WHERE guild_id=$1)",itx.guild.id):
-            options = [discord.SelectOption(label=x['points'],value=x['id']) for x in await self.bot.pool.fetch("SELECT id,points FROM autopunishments\
-                WHERE guild_id=$1",itx.guild.id)]
+        if await self.bot.db.fetchval('thresholds_exist', itx.guild.id):
+            options = [discord.SelectOption(label=x['points'],value=x['id']) for x in await self.bot.db.fetch('thresholds_by_guild', itx.guild.id)]
             
-            view = RemoveThreshold(self.author, self.bot.pool, self.msg,options, self.field_0, self.field_1)
+            view = RemoveThreshold(self.author, self.bot.db, self.msg,options, self.field_0, self.field_1)
             
             await itx.response.send_message("Press **Submit** to submit.",view=view)
             button.disabled = True
@@ -228,20 +230,20 @@ class WarnView(discord.ui.View):
 
     @discord.ui.button(label="Add autocomplete",style=discord.ButtonStyle.blurple,row=1)
     async def adda(self,itx:discord.Interaction,button:discord.ui.Button):
-        if await self.bot.pool.fetchval("SELECT COUNT(*) FROM autocompletes WHERE guild_id=$1",itx.guild.id)<25:
-            await itx.response.send_modal(AddAutocomplete(self.bot.pool,self.msg,self.field_1))
+        if await self.bot.db.fetchval('autocompletes_count', itx.guild.id)<25:
+            await itx.response.send_modal(AddAutocomplete(self.bot.db,self.msg,self.field_1))
         else:
             return await itx.response.send_message("Maximum 25 autocompletes.")
     
     @discord.ui.button(label="Remove autocomplete",style=discord.ButtonStyle.blurple,row=1)
     async def removea(self,itx:discord.Interaction,button:discord.ui.Button):
-        if await self.bot.pool.fetchval("SELECT EXISTS (SELECT 1 FROM autocompletes WHERE guild_id=$1)",itx.guild.id):
+        if await self.bot.db.fetchval('autocompletes_exist', itx.guild.id):
             options = [
                 discord.SelectOption(label = x['reason'][:100], value = x['id'], description = x['points']) 
-                for x in await self.bot.pool.fetch("SELECT * FROM autocompletes WHERE guild_id=$1", itx.guild.id)
+                for x in await self.bot.db.fetch('autocompletes_by_guild', itx.guild.id)
                 ]
                 
-            view = RemoveAutocomplete(self.author,self.bot.pool,self.msg,options,self.field_1)
+            view = RemoveAutocomplete(self.author,self.bot.db,self.msg,options,self.field_1)
             
             await itx.response.send_message("Press **Submit** to submit.",view=view)
             button.disabled = True
@@ -257,9 +259,9 @@ class WarnView(discord.ui.View):
             await itx.response.send_message("No autocomplete responses have been set.",ephemeral=True)
 
 class AddThreshold(discord.ui.Modal):
-    def __init__(self, pool: Connection, parent_msg: discord.Message, field_0, field_1) -> None:
+    def __init__(self, db: Database, parent_msg: discord.Message, field_0, field_1) -> None:
         super().__init__(title="Add Threshold", timeout=600)
-        self.pool = pool
+        self.db = db
         self.parent_msg = parent_msg
         self.field_0 = field_0
         self.field_1 = field_1
@@ -275,7 +277,7 @@ class AddThreshold(discord.ui.Modal):
         self.add_item(self.threshold_timer)
 
     async def on_submit(self, itx: discord.Interaction, /):
-        thresholds = await self.pool.fetch("SELECT * FROM autopunishments WHERE guild_id=$1",itx.guild.id)
+        thresholds = await self.db.fetch('thresholds_by_guild', itx.guild.id)
 
         try:
             tpoints = int(self.threshold_points.value)
@@ -310,13 +312,13 @@ class AddThreshold(discord.ui.Modal):
         info_dict = {"kick":"kick","ban":"ban"}
         p_type = info_dictt[self.threshold_ptype.value.lower()] if timer is not None else info_dict[self.threshold_ptype.value.lower()]
 
-        await self.pool.execute("INSERT INTO autopunishments (guild_id,points,p_type,timer) VALUES($1,$2,$3,$4)",itx.guild.id,tpoints,p_type,timer)
+        await self.db.execute('threshold_insert', itx.guild.id,tpoints,p_type,timer)
         
         
         field0_value = '\n'.join(await self.field_0())
         self.parent_msg.embeds[0].set_field_at(index=0,name="Thresholds",value=f"```{field0_value}```")
         
-        max_rec = await self.pool.fetchrow("SELECT * FROM autopunishments WHERE guild_id=$1 AND p_type='ban'",itx.guild.id)
+        max_rec = await self.db.fetchrow('threshold_ban', itx.guild.id)
 
         self.parent_msg.embeds[0].set_field_at(index=1,name="Maximum",value=await self.field_1(max_rec))
         await self.parent_msg.edit(embed=self.parent_msg.embeds[0])
@@ -336,13 +338,13 @@ class ThresholdDropdown(discord.ui.Select):
         await itx.response.send_message(f"Alright! Now, press **Submit** to store them.",ephemeral=True)
 
 class RemoveThreshold(discord.ui.View):
-    def __init__(self, author: discord.User, pool: Connection, parent_msg: discord.Message, options: discord.SelectOption, field_0, field_1):
+    def __init__(self, author: discord.User, db: Database, parent_msg: discord.Message, options: discord.SelectOption, field_0, field_1):
         super().__init__(timeout=300)
         self.add_item(ThresholdDropdown(options))
         self.options = options
         self.modules = []
         self.author = author
-        self.pool = pool
+        self.db = db
         self.parent_msg = parent_msg
         self.field_0 = field_0
         self.field_1 = field_1
@@ -363,12 +365,12 @@ class RemoveThreshold(discord.ui.View):
         if self.modules == []:
             self.stop()
     
-        await self.pool.executemany("DELETE FROM autopunishments WHERE id=$1",[(int(x),) for x in self.modules])
+        await self.db.executemany('threshold_delete', [(int(x),) for x in self.modules])
         
         field0_value = '\n'.join(await self.field_0())
         self.parent_msg.embeds[0].set_field_at(index=0,name="Thresholds",value=f"```{field0_value}```")
         
-        max_rec = await self.pool.fetchrow("SELECT * FROM autopunishments WHERE guild_id=$1 AND p_type='ban'",itx.guild.id)
+        max_rec = await self.db.fetchrow('threshold_ban', itx.guild.id)
 
         self.parent_msg.embeds[0].set_field_at(index=1,name="Maximum",value=await self.field_1(max_rec))
         await self.parent_msg.edit(embed=self.parent_msg.embeds[0])
@@ -377,9 +379,9 @@ class RemoveThreshold(discord.ui.View):
 
 
 class AddAutocomplete(discord.ui.Modal):
-    def __init__(self,pool: Connection, parent_msg: discord.Message, field_1) -> None:
+    def __init__(self,db: Database, parent_msg: discord.Message, field_1) -> None:
         super().__init__(title="Add Autocomplete response", timeout=600)
-        self.pool = pool
+        self.db = db
         self.parent_msg = parent_msg
         self.field_1 = field_1
 
@@ -390,7 +392,7 @@ class AddAutocomplete(discord.ui.Modal):
         self.add_item(self.reason)
     
     async def on_submit(self, itx: discord.Interaction, /) -> None:
-        autocompletes = await self.pool.fetch("SELECT * FROM autocompletes WHERE guild_id=$1",itx.guild.id)
+        autocompletes = await self.db.fetch('autocompletes_by_guild', itx.guild.id)
 
         try:
             tpoints = int(self.autocomplete_points.value)
@@ -402,9 +404,9 @@ class AddAutocomplete(discord.ui.Modal):
         if self.reason.value in [x['reason'] for x in autocompletes]:
             return await itx.response.send_message("Autocomplete reason has to be unique!",ephemeral=True)
 
-        await self.pool.execute("INSERT INTO autocompletes(guild_id,points,reason) VALUES($1,$2,$3)",itx.guild.id,tpoints,self.reason.value)
+        await self.db.execute('autocomplete_insert', itx.guild.id,tpoints,self.reason.value)
 
-        choose_color = await self.pool.fetchrow("SELECT * FROM autopunishments WHERE guild_id=$1 AND p_type='ban'",itx.guild.id)
+        choose_color = await self.db.fetchrow('threshold_ban', itx.guild.id)
 
         self.parent_msg.embeds[0].set_field_at(index=1,name="Maximum",value=await self.field_1(choose_color))
         await self.parent_msg.edit(embed=self.parent_msg.embeds[0])
@@ -424,12 +426,12 @@ class AutocompleteDropdown(discord.ui.Select):
         await itx.response.send_message(f"Alright! Now, press **Submit** to store them.",ephemeral=True)
 
 class RemoveAutocomplete(discord.ui.View):
-    def __init__(self, author: discord.User, pool: Connection, parent_msg: discord.Message, options: discord.SelectOption, field_1):
+    def __init__(self, author: discord.User, db: Database, parent_msg: discord.Message, options: discord.SelectOption, field_1):
         super().__init__(timeout=300)
         self.add_item(AutocompleteDropdown(options))
         self.responses = []
         self.author = author
-        self.pool = pool
+        self.db = db
         self.parent_msg = parent_msg
         self.field_1 = field_1
 
@@ -449,9 +451,9 @@ class RemoveAutocomplete(discord.ui.View):
         if self.responses == []:
             self.stop()
             
-        await self.pool.executemany("DELETE FROM autocompletes WHERE id=$1",[(int(x),) for x in self.responses])
+        await self.db.executemany('autocomplete_delete', [(int(x),) for x in self.responses])
         
-        choose_color = await self.pool.fetchrow("SELECT * FROM autopunishments WHERE guild_id=$1 AND p_type='ban'",itx.guild.id)
+        choose_color = await self.db.fetchrow('threshold_ban', itx.guild.id)
         self.parent_msg.embeds[0].set_field_at(index=1,name="Maximum",value=await self.field_1(choose_color))
         await self.parent_msg.edit(embed=self.parent_msg.embeds[0])
 
@@ -0,0 +1,39 @@
+import time
+import json
+from contextlib import contextmanager
+
+class StartupProfiler:
+    """
+    Records how long each startup phase takes, relative to when the bot was created.
+    Phases can nest (setup_hook runs inside login), and extensions load concurrently,
+    so their durations overlap rather than add up
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = [] # [{'name': str, 'start': float, 'duration': float | None}]
+        self.ready_at = None
+
+    @contextmanager
+    def phase(self, name: str):
+        phase = {'name': name, 'start': round(time.perf_counter() - self.started, 4), 'duration': None}
+        self.phases.append(phase)
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            phase['duration'] = round(time.perf_counter() - start, 4)
+
+    def mark_ready(self) -> bool:
+        """Returns False if ready was already marked (READY fires again after reconnects)"""
+        if self.ready_at is not None:
+            return False
+
+        self.ready_at = round(time.perf_counter() - self.started, 4)
+        return True
+
+    def report(self) -> dict:
+        return {'ready_after': self.ready_at, 'phases': self.phases}
+
+    def report_json(self) -> str:
+        return json.dumps(self.report(), indent = 2)
@@ -0,0 +1,108 @@
+import asyncio
+import heapq
+import sys
+import traceback
+import discord
+from datetime import datetime, timedelta
+from discord.ext import commands
+
+"""
+Timed unbans. The bans ending within WINDOW, for guilds on this cluster's shards, are loaded into a min-heap
+(through the index on banned_users.wait_until), and each one is unbanned at its exact time.
+`ban` and `unban` update the schedule directly; the table is loaded again every WINDOW / 2, which picks up bans
+further ahead and anything changed elsewhere.
+"""
+
+WINDOW = timedelta(minutes = 10)
+
+class UnbanScheduler:
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.heap = [] # [(wait_until, ban id)]; removed bans stay in it and are skipped
+        self.bans = {} # {ban id: (guild_id, user_id)}
+        self.horizon = None # every ban ending before this is scheduled
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def load(self):
+        horizon = discord.utils.utcnow() + WINDOW
+        records = await self.bot.db.fetch('banned_due', horizon, self.bot.shard_count or 1, list(self.bot.shards.keys()) or [0])
+
+        self.bans = {record['id']: (record['guild_id'], record['user_id']) for record in records}
+        self.heap = [(record['wait_until'], record['id']) for record in records]
+        heapq.heapify(self.heap)
+        self.horizon = horizon
+        self._wake.set()
+
+    def add(self, ban_id: int, guild_id: int, user_id: int, wait_until: datetime):
+        # later bans are picked up by the next load
+        if self.horizon is None or wait_until > self.horizon:
+            return
+
+        self.bans[ban_id] = (guild_id, user_id)
+        heapq.heappush(self.heap, (wait_until, ban_id))
+
+        if self.heap[0][1] == ban_id:
+            self._wake.set()
+
+    def remove(self, guild_id: int, user_id: int):
+        for ban_id in [ban_id for ban_id, ban in self.bans.items() if ban == (guild_id, user_id)]:
+            del self.bans[ban_id]
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+
+            while self.heap and self.heap[0][1] not in self.bans:
+                heapq.heappop(self.heap)
+
+            if not self.heap:
+                await self._wake.wait()
+                continue
+
+            wait_until, ban_id = self.heap[0]
+            delay = (wait_until - discord.utils.utcnow()).total_seconds()
+
+            # woken early when an earlier ban is added or the heap is reloaded
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self.heap)
+            guild_id, user_id = self.bans.pop(ban_id)
+
+            try:
+                await self._unban(ban_id, guild_id, user_id)
+            except Exception as error:
+                # the row is still there, so the next load schedules it again
+                print(f'Timed unban {ban_id} failed:', file = sys.stderr)
+                traceback.print_exception(type(error), error, error.__traceback__, file = sys.stderr)
+
+    async def _unban(self, ban_id: int, guild_id: int, user_id: int):
+        guild = self.bot.get_guild(guild_id)
+
+        # the guild is unavailable (an outage or a shard reconnecting); the row is kept, so the next load retries it
+        if guild is None:
+            return
+
+        # skips the request if the user was already unbanned by hand
+        if self.bot.ban_index.contains(guild_id, user_id) is not False:
+            try:
+                await guild.unban(discord.Object(user_id), reason = "Timer expired.")
+            except discord.NotFound:
+                pass
+            except discord.Forbidden:
+                # kept and retried on the next load, in case the permission is given back
+                return
+
+        await self.bot.db.execute('banned_delete', ban_id)
@@ -0,0 +1,91 @@
+import discord
+from helper.queries import Database
+
+"""
+Warn point balances, kept in warn_balances next to the warns rows.
+A user's balance is the running total of their warns in id order, never going below zero
+(pardoning more points than a user has does not leave them in credit).
+Every change to warns goes through here. Warning, pardoning and deleting a warn are each a single call to a
+function in the database (migration 5), which updates the balance in the same transaction.
+
+Guilds can have their points decay (`set decay`, migrations 9 and 10): warns older than expire_days expire and the
+user's balance is recomputed from the rest, and/or monthly_points are taken off every 30 days, logged as a warn by
+DECAY_AUTHOR like a pardon. A balance is always the clamped total of the warns that have not expired, so expiring,
+deleting and rebuilding agree. `decay` applies both, from the moderation task.
+"""
+
+# due warns expired per guild in one call; each call is its own transaction
+EXPIRE_BATCH = 1000
+# created_by of the warns logged by the monthly decay
+DECAY_AUTHOR = 0
+
+REBUILD = """
+    UPDATE warn_balances SET points = 0;
+
+    INSERT INTO warn_balances (guild_id, user_id, points)
+    SELECT guild_id, user_id, MAX(total) - LEAST(MIN(running), 0) FROM (
+        SELECT guild_id, user_id,
+        SUM(COALESCE(points, 0)) OVER (PARTITION BY guild_id, user_id ORDER BY id) AS running,
+        SUM(COALESCE(points, 0)) OVER (PARTITION BY guild_id, user_id) AS total
+        FROM warns WHERE expired = false
+    ) prefix
+    GROUP BY guild_id, user_id
+    ON CONFLICT (guild_id, user_id) DO UPDATE SET points = EXCLUDED.points;
+"""
+
+async def get_balance(db: Database, guild_id: int, user_id: int) -> int:
+    points = await db.fetchval('warn_balance_get', guild_id, user_id)
+    return points if points is not None else 0
+
+async def warn(db: Database, guild_id: int, user_id: int, reason: str, points: int | None, created_by: int):
+    """
+    Logs a warn. A reason matching one of the guild's autocompletes takes its points, otherwise `points` (1 if None).
+    Returns a record of: points (as logged), total (None if the points were invalid and nothing was logged),
+    threshold_id/threshold_points/threshold_type/threshold_timer (the threshold to punish for, None if there is none),
+    max_points/max_type (the guild's highest threshold) and offence_message
+    """
+    return await db.fetchrow('warn_user', guild_id, user_id, reason, points, created_by, discord.utils.utcnow())
+
+async def warn_many(db: Database, guild_id: int, user_ids: list, reason: str, points: int, created_by: int):
+    """Logs the same warn for each of the distinct `user_ids`. Thresholds are not applied"""
+    created_on = discord.utils.utcnow()
+
+    async with db.transaction() as conn:
+        await db.execute('warn_balances_lock_many', guild_id, user_ids, conn = conn)
+        await db.execute('warns_insert_many', guild_id, user_ids, reason, points, created_by, created_on, conn = conn)
+
+async def pardon(db: Database, guild_id: int, user_id: int, reason: str, points: int, created_by: int):
+    """
+    Logs a pardon (`points` is negative) and pardons the threshold offences above the new balance.
+    Returns a record of: total (None if the user had no points, in which case nothing was logged), max_points and max_type
+    """
+    return await db.fetchrow('pardon_user', guild_id, user_id, reason, points, created_by, discord.utils.utcnow())
+
+async def delete_warn(db: Database, guild_id: int, warn_id: int):
+    """
+    Deletes a warn, recomputes the user's balance and pardons the threshold offences above it.
+    Returns the deleted warn's columns and total, or None if there is no such warn
+    """
+    record = await db.fetchrow('delete_warn', guild_id, warn_id)
+    return record if record['id'] is not None else None
+
+async def decay(db: Database) -> tuple:
+    """Expires the due warns in batches, then applies the monthly decay. Returns (warns expired, balances decayed)"""
+    now = discord.utils.utcnow()
+    expired = 0
+
+    while True:
+        count = await db.fetchval('warns_expire', now, EXPIRE_BATCH)
+        if count == 0:
+            break
+        expired += count
+
+    return expired, await db.fetchval('warn_balances_decay', now)
+
+async def rebuild_balances(db: Database) -> int:
+    """Recomputes every balance from the warns that have not expired. Returns the number of balances"""
+    async with db.transaction() as conn:
+        # warns and pardons wait until the rebuild is done
+        await conn.execute("LOCK TABLE warn_balances IN EXCLUSIVE MODE")
+        await conn.execute(REBUILD)
+        return await conn.fetchval("SELECT COUNT(*) FROM warn_balances")
@@ -0,0 +1,119 @@
+import asyncio
+import heapq
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+"""
+Event loop lag watchdog.
+A task on the loop records a heartbeat every INTERVAL seconds; a separate thread watches it, and when the
+loop has not run for longer than the threshold, it captures the loop thread's stack while it is still blocked.
+That stack names whatever synchronous code is holding up the loop.
+"""
+
+INTERVAL = 0.05
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class Stall:
+    def __init__(self, started: float, stack: list):
+        # the loop stopped answering at its last heartbeat, not when the stack was captured
+        self.started_at = datetime.now(timezone.utc) - timedelta(seconds = time.perf_counter() - started)
+        self.started = started
+        self.duration = None # seconds, set once the loop runs again
+        self.stack = stack # [traceback.FrameSummary], outermost first
+
+    def __lt__(self, other: "Stall") -> bool:
+        return self.duration < other.duration
+
+    @property
+    def callsite(self) -> str:
+        """The innermost frame in the bot's own code, or the innermost frame if none is"""
+        frames = [frame for frame in self.stack if frame.filename.startswith(ROOT)] or self.stack
+        if not frames:
+            return 'unknown'
+
+        frame = frames[-1]
+        return f"{os.path.relpath(frame.filename, ROOT)}:{frame.lineno} in {frame.name}"
+
+    def format_stack(self, limit: int = 8) -> str:
+        return ''.join(traceback.format_list(self.stack[-limit:]))
+
+class LoopWatchdog:
+    def __init__(self, threshold: float = 0.25, keep: int = 10, on_lag = None):
+        self.threshold = threshold
+        self.keep = keep
+        self.on_lag = on_lag # called on the loop with each heartbeat's lag, in seconds
+
+        self.worst = [] # min-heap of the `keep` longest stalls
+        self.recent = deque(maxlen = keep)
+        self.max_lag = 0.0
+
+        self._heartbeat = time.perf_counter()
+        self._stall = None # captured by the thread, finished by the loop
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._task = None
+        self._thread = None
+        self._loop_thread_id = None
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        self._task = asyncio.create_task(self._beat())
+        self._thread = threading.Thread(target = self._watch, name = 'loop-watchdog', daemon = True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _beat(self):
+        while True:
+            expected = time.perf_counter() + INTERVAL
+            await asyncio.sleep(INTERVAL)
+            now = time.perf_counter()
+            lag = max(now - expected, 0.0)
+
+            with self._lock:
+                self._heartbeat = now
+                stall, self._stall = self._stall, None
+
+            if stall is not None:
+                stall.duration = now - stall.started
+                self._record(stall)
+
+            self.max_lag = max(self.max_lag, lag)
+            if self.on_lag is not None:
+                self.on_lag(lag)
+
+    def _watch(self):
+        while not self._stopped.wait(INTERVAL):
+            with self._lock:
+                blocked_for = time.perf_counter() - self._heartbeat
+                if blocked_for < self.threshold or self._stall is not None:
+                    continue
+
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is None:
+                    continue
+
+                # the loop is still blocked, so this is the code blocking it
+                self._stall = Stall(self._heartbeat, traceback.extract_stack(frame))
+
+    def _record(self, stall: Stall):
+        self.recent.append(stall)
+
+        if len(self.worst) < self.keep:
+            heapq.heappush(self.worst, stall)
+        elif stall.duration > self.worst[0].duration:
+            heapq.heapreplace(self.worst, stall)
+
+        print(f'Event loop blocked for {stall.duration * 1000:.0f}ms at {stall.callsite}', file = sys.stderr)
+
+    def worst_stalls(self) -> list:
+        return sorted(self.worst, reverse = True)
@@ -0,0 +1,80 @@
+import asyncio
+import aiohttp
+import sys
+from os import environ, getenv
+from dotenv import load_dotenv
+
+"""
+Runs the bot as several processes (clusters), each owning a range of shards with its own event loop and database pool.
+Usage: python launcher.py <number of clusters> [shard count]
+If the shard count is not given, Discord's recommended count is used.
+"""
+
+load_dotenv()
+
+TOKEN = getenv("TOKEN")
+RESTART_DELAY = 5
+
+async def recommended_shards() -> int:
+    async with aiohttp.ClientSession() as cs:
+        async with cs.get("https://discord.com/api/v10/gateway/bot", headers = {"Authorization": f"Bot {TOKEN}"}) as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+
+    return data['shards']
+
+def shard_ranges(shard_count: int, clusters: int) -> list:
+    """Splits shards 0..shard_count-1 into `clusters` contiguous ranges, as evenly as possible"""
+    per_cluster, extra = divmod(shard_count, clusters)
+    ranges = []
+    start = 0
+
+    for cluster_id in range(clusters):
+        end = start + per_cluster + (1 if cluster_id < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+
+    return ranges
+
+async def run_cluster(cluster_id: int, shard_ids: list, shard_count: int):
+    env = dict(environ, CLUSTER_ID = str(cluster_id), SHARD_COUNT = str(shard_count),
+    SHARD_IDS = ','.join(str(shard_id) for shard_id in shard_ids))
+
+    while True:
+        print(f'[launcher] starting cluster {cluster_id} with shards {shard_ids[0]}-{shard_ids[-1]}')
+        process = await asyncio.create_subprocess_exec(sys.executable, 'main.py', env = env)
+
+        try:
+            code = await process.wait()
+        except asyncio.CancelledError:
+            process.terminate()
+            await process.wait()
+            raise
+
+        if code == 0:
+            print(f'[launcher] cluster {cluster_id} exited')
+            return
+
+        print(f'[launcher] cluster {cluster_id} exited with code {code}, restarting in {RESTART_DELAY}s')
+        await asyncio.sleep(RESTART_DELAY)
+
+async def main(clusters: int, shard_count: int | None):
+    if shard_count is None:
+        shard_count = await recommended_shards()
+
+    clusters = min(clusters, shard_count)
+    ranges = shard_ranges(shard_count, clusters)
+
+    print(f'[launcher] {shard_count} shards across {clusters} clusters')
+
+    await asyncio.gather(*[run_cluster(cluster_id, shard_ids, shard_count) for cluster_id, shard_ids in enumerate(ranges)])
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python launcher.py <number of clusters> [shard count]")
+        sys.exit(1)
+
+    try:
+        asyncio.run(main(int(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) > 2 else None))
+    except KeyboardInterrupt:
+        pass
@@ -1,7 +1,22 @@
 import discord
 from discord.ext import commands
 import asyncpg
-from helper import poll_views, join_view
+import asyncio
+import time
+from helper.pg_listener import PGListener
+from helper.guild_cache import GuildCache
+from helper.startup import StartupProfiler
+from helper.cluster import ClusterBus
+from helper.queries import Database
+from helper.migrations import migrate
+from helper.metrics import Metrics, MetricsTree
+from helper.watchdog import LoopWatchdog
+from helper.resolver import Resolver
+from helper.ban_index import BanIndex
+from helper.raid import RaidDetector
+from helper.outbox import DMOutbox
+from helper.modlog import ModLog
+from helper import partitions
 from os import getenv, listdir
 from dotenv import load_dotenv
 
@@ -12,70 +27,149 @@ DB_NAME = getenv("DB_NAME")
 DB_USERNAME = getenv("DB_USERNAME")
 DB_PASSWORD = getenv("DB_PASSWORD")
 
-class MyBot(commands.Bot):
+# set by launcher.py when running as one of several clusters
+CLUSTER_ID = int(getenv("CLUSTER_ID", 0))
+SHARD_COUNT = getenv("SHARD_COUNT")
+SHARD_IDS = getenv("SHARD_IDS")
+
+# event loop stalls longer than this are logged, with the blocking code
+WATCHDOG_THRESHOLD = int(getenv("WATCHDOG_THRESHOLD_MS", 250)) / 1000
+
+class MyBot(commands.AutoShardedBot):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, tree_cls = MetricsTree, **kwargs)
+        self.profiler = StartupProfiler()
+        self.cluster_id = CLUSTER_ID
+
+        self.metrics = Metrics(self)
+        self.before_invoke(self.metrics.before_invoke)
+        self.after_invoke(self.metrics.after_invoke)
+
+        self.watchdog = LoopWatchdog(WATCHDOG_THRESHOLD, on_lag = self.metrics.loop_lagged)
+        # cached user and member lookups, shared by every cog
+        self.resolver = Resolver(self)
+        self.ban_index = BanIndex(self)
+        self.raid_detector = RaidDetector(self)
+        # moderation DMs are sent in the background
+        self.outbox = DMOutbox()
+        self.modlog = ModLog(self)
+
+    async def login(self, token: str) -> None:
+        # setup_hook is called from within login
+        with self.profiler.phase('login'):
+            await super().login(token)
+
+    async def _run_event(self, coro, event_name: str, *args, **kwargs) -> None:
+        # every event listener runs through here, so they are all timed for the metrics
+        start = time.perf_counter()
+        try:
+            await super()._run_event(coro, event_name, *args, **kwargs)
+        finally:
+            self.metrics.event_finished(event_name, coro, time.perf_counter() - start)
+
+    async def load_timed_extension(self, name: str):
+        with self.profiler.phase(f'extension {name}'):
+            await self.load_extension(name)
+
+    async def close(self) -> None:
+        self.watchdog.stop()
+        self.outbox.stop()
+        await super().close()
+
     async def setup_hook(self) -> None:
+        # started first, so slow startup work is caught too
+        self.watchdog.start()
+        self.outbox.start()
+
         try:
-            self.pool = await asyncpg.create_pool(database = DB_NAME, user = DB_USERNAME, password = DB_PASSWORD)
-            for file in listdir('commands'):
-                if not file.endswith('.py'):
-                    continue
-                await self.load_extension(f'commands.{file[:-3]}')
-            
-            await self.load_extension('helper.error_handler')
-            await self.load_extension('help_command')
-
-            try:
-                poll_records = await self.pool.fetch("SELECT * FROM poll_table")
-            except asyncpg.UndefinedTableError:
-                poll_records = []
-            
-            for record in poll_records:
-                try:
-                    self.add_view(poll_views.Poll(len(record['poll_options']), self.pool), message_id = record['message_id'])
-                except:
-                    pass
-
-            try:
-                verify_records = await self.pool.fetch("SELECT verify_message FROM join_stats")    
-            except asyncpg.UndefinedTableError:
-                verify_records = []
-                        
-            for record in verify_records:
+            # on its own connection, before the pool prepares its statements against the schema
+            with self.profiler.phase('migrations'):
+                conn = await asyncpg.connect(database = DB_NAME, user = DB_USERNAME, password = DB_PASSWORD)
                 try:
-                    self.add_view(join_view.VerifyMessageView(self.pool), message_id = record['verify_message'])
-                except:
-                    pass
+                    for version, name in await migrate(conn):
+                        print(f'Applied migration {version}: {name}')
+                finally:
+                    await conn.close()
+
+            with self.profiler.phase('pool creation'):
+                self.db = Database()
+                self.db.on_acquire = self.metrics.pool_acquired
+                self.pool = await self.db.create_pool(database = DB_NAME, user = DB_USERNAME, password = DB_PASSWORD)
+
+            # before anything can log a warn or offence, in case no cluster has run the partition task this month
+            with self.profiler.phase('partitions'):
+                for partition in await partitions.ensure(self.db):
+                    print(f'Created partition {partition}')
+
+            with self.profiler.phase('cache load'):
+                self.listener = PGListener(self.pool)
+                await self.listener.start()
+
+                self.guild_cache = GuildCache(self.db, self.listener, 'guild_table')
+                self.join_cache = GuildCache(self.db, self.listener, 'join_stats')
+                self.raid_cache = GuildCache(self.db, self.listener, 'raid_settings')
+                await asyncio.gather(self.guild_cache.start(), self.join_cache.start(), self.raid_cache.start())
+
+                self.cluster_bus = ClusterBus(self, self.listener)
+                await self.cluster_bus.start()
+
+            # extensions do not depend on each other at load time, so they are loaded concurrently
+            extensions = [f'commands.{file[:-3]}' for file in listdir('commands') if file.endswith('.py')]
+            extensions += ['helper.error_handler', 'helper.router', 'helper.cluster', 'helper.metrics', 'help_command']
+
+            with self.profiler.phase('extensions'):
+                await asyncio.gather(*[self.load_timed_extension(extension) for extension in extensions])
 
         except KeyboardInterrupt:
             await self.pool.close()
             await self.logout()
 
 async def get_prefix(bot: commands.Bot, message: discord.Message):
-    try:
-        prefix = await bot.pool.fetchval("SELECT prefix FROM guild_table WHERE guild_id = $1", message.guild.id)
-    except:
-        prefix = None
+    prefix = bot.guild_cache.get_value(message.guild.id, 'prefix') if message.guild is not None else None
 
     if prefix is None:
         return [f"{bot.user.mention} ", bot.user.mention, '-']
     return [f"{bot.user.mention} ", bot.user.mention, prefix]
 
 activity = discord.Activity(type=discord.ActivityType.watching, name="-help")
-bot = MyBot(command_prefix = get_prefix, intents = discord.Intents.all(), activity = activity)
+
+if SHARD_IDS is not None:
+    shard_kwargs = {'shard_count': int(SHARD_COUNT), 'shard_ids': [int(shard_id) for shard_id in SHARD_IDS.split(',')]}
+else:
+    shard_kwargs = {}
+
+bot = MyBot(command_prefix = get_prefix, intents = discord.Intents.all(), activity = activity, **shard_kwargs)
 
 @bot.event
 async def on_ready():
-    print(f'Logged in as {bot.user} (ID: {bot.user.id})')
+    print(f'Logged in as {bot.user} (ID: {bot.user.id}) on cluster {bot.cluster_id}, shards {sorted(bot.shards.keys())}')
     print('------')
 
+    if bot.profiler.mark_ready():
+        print(f'Startup report:\n{bot.profiler.report_json()}')
+
 @bot.event
 async def on_guild_join(guild: discord.Guild):
-    if await bot.pool.fetchval("SELECT * FROM guild_table WHERE guild_id = $1", guild.id) is None:
-            await bot.pool.execute("INSERT INTO guild_table (guild_id) VALUES ($1)", guild.id)
+    if bot.guild_cache.get(guild.id) is None:
+        await bot.db.execute('guild_insert', guild.id)
+        await bot.guild_cache.refresh(guild.id)
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    bot.ban_index.forget(guild.id)
+
+@bot.event
+async def on_member_ban(guild: discord.Guild, user: discord.User | discord.Member):
+    bot.ban_index.update(guild.id, user.id, True)
+
+@bot.event
+async def on_member_unban(guild: discord.Guild, user: discord.User):
+    bot.ban_index.update(guild.id, user.id, False)
 
 @bot.event
 async def on_member_join(member: discord.Member):
-    join_stats = await bot.pool.fetchrow("SELECT * FROM join_stats WHERE guild_id = $1", member.guild.id)
+    bot.raid_detector.on_join(member)
+    join_stats = bot.join_cache.get(member.guild.id)
 
     if join_stats is None:
         return
@@ -96,7 +190,7 @@ async def on_member_join(member: discord.Member):
 
 @bot.event
 async def on_guild_channel_create(channel: discord.abc.GuildChannel):
-    vrole_id = await bot.pool.fetchval("SELECT verify_role FROM join_stats WHERE guild_id = $1", channel.guild.id)
+    vrole_id = bot.join_cache.get_value(channel.guild.id, 'verify_role')
     
     vrole = channel.guild.get_role(vrole_id) if vrole_id is not None else None
 
@@ -60,7 +60,7 @@ class MarkovGenerator(commands.Cog, name = "markov"):
         if ctx.channel.type == discord.ChannelType.private:
             return False
 
-        b_c = await self.bot.pool.fetchval("SELECT blacklisted_channels FROM guild_table WHERE guild_id = $1", ctx.guild.id)
+        b_c = self.bot.guild_cache.get_value(ctx.guild.id, 'blacklisted_channels')
 
         if b_c is not None and ctx.channel.id in b_c:
             return False
@@ -71,7 +71,7 @@ class MarkovGenerator(commands.Cog, name = "markov"):
         if message.author == self.bot.user:
             return
 
-        prefix = await self.bot.pool.fetchval("SELECT prefix FROM guild_table WHERE guild_id = $1", message.guild.id)
+        prefix = self.bot.guild_cache.get_value(message.guild.id, 'prefix')
         if prefix is None:
             prefix = '-'
 
@@ -79,7 +79,7 @@ class MarkovGenerator(commands.Cog, name = "markov"):
             return
         
         try:
-            data = await self.bot.pool.fetchrow("SELECT * FROM markov_table WHERE guild_id = $1", message.guild.id)
+            data = await self.bot.db.fetchrow('markov_get', message.guild.id)
             if data['channel_id'] != message.channel.id:
                 return
         except:
@@ -106,7 +106,7 @@ class MarkovGenerator(commands.Cog, name = "markov"):
         
         full_list = data['trigrams'] + trigram_list
         
-        await self.bot.pool.execute("UPDATE markov_table SET trigrams = $1 WHERE guild_id = $2", full_list, message.guild.id)
+        await self.bot.db.execute('markov_set_trigrams', full_list, message.guild.id)
 
 
     @commands.cooldown(rate = 1, per = 30, type = BucketType.user)
@@ -115,7 +115,7 @@ class MarkovGenerator(commands.Cog, name = "markov"):
         if ctx.interaction:
             await ctx.interaction.response.defer(thinking = True)
         
-        data = await self.bot.pool.fetchrow("SELECT * FROM markov_table WHERE guild_id = $1", ctx.guild.id)
+        data = await self.bot.db.fetchrow('markov_get', ctx.guild.id)
 
         if data is None:
             return await ctx.send("I cannot generate a sentence unless you have registered me here! Use `/set generation`", delete_after = 5)
@@ -144,10 +144,10 @@ class MarkovGenerator(commands.Cog, name = "markov"):
         if channel.guild != ctx.guild:
             return await ctx.send("Channel does not exist in this server")
         
-        if await self.bot.pool.fetchval("SELECT EXISTS (SELECT 1 FROM markov_table WHERE guild_id = $1)", ctx.guild.id):
-            await self.bot.pool.execute("UPDATE markov_table SET channel_id = $1 WHERE guild_id = $2", channel.id, ctx.guild.id)
+        if await self.bot.db.fetchval('markov_exists', ctx.guild.id):
+            await self.bot.db.execute('markov_set_channel', channel.id, ctx.guild.id)
         else:
-            await self.bot.pool.execute("INSERT INTO markov_table (guild_id, channel_id) VALUES ($1, $2)", ctx.guild.id, channel.id)
+            await self.bot.db.execute('markov_insert', ctx.guild.id, channel.id)
 
         await ctx.send("Done!")
 